@@ -0,0 +1,409 @@
+"""
+Offline benchmark for the assistant graph.
+
+Runs per-route workloads against graph.app, ground_book_graph and the RAG
+chain with deterministic stand-ins for ChatOpenAI, OpenAIEmbeddings and
+the raw OpenAI client, so the numbers measure our code rather than the
+network. Reports p50/p95/p99 latency, requests/sec and peak RSS, saves
+them as JSON and can compare against an earlier run:
+
+    python benchmark.py --requests 200 --concurrency 8 --output base.json
+    python benchmark.py --baseline base.json
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+WORKLOADS = ("math", "knowledge", "booking", "ground_book", "rag")
+
+MATH_QUERIES = [
+    "what is 15 + 27?",
+    "(3 + 4) * 12 / 7",
+    "2 ** 10 - 1",
+    "sqrt(144) + 3 * 7",
+    "I have 3 apples and buy 5 more, how many do I have?",
+]
+TOPICS = ["battery", "display", "chip", "ports", "camera", "speakers", "keyboard", "weight"]
+
+
+def _reply_text(prompt: str) -> str:
+    if "Query Router" in prompt:
+        return "knowledge"
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+    return f"Based on the context, the answer is {digest}. It is described in the product documentation."
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model: same prompt, same reply, fixed latency."""
+
+    latency: float = 0.05
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "benchmark-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        text = _reply_text(str(messages[-1].content))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        text = _reply_text(str(messages[-1].content))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for token in re.findall(r"\S+\s*", _reply_text(str(messages[-1].content))):
+            time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors: similar texts get similar embeddings."""
+
+    def __init__(self, dim: int = 256, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"[a-z0-9]+", text.lower()):
+            vector[int(hashlib.md5(token.encode("utf-8")).hexdigest(), 16) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._vector(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # Queries embed like documents here, so a batch is one call.
+        return self.embed_documents(texts)
+
+
+def _completion(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeOpenAI:
+    """Stand-in for openai.OpenAI().chat.completions; returns an empty JSON object."""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        time.sleep(self.latency)
+        return _completion("{}")
+
+
+class FakeAsyncOpenAI(FakeOpenAI):
+    async def _create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return _completion("{}")
+
+
+def peak_rss_mb() -> float:
+    if resource is not None:
+        # ru_maxrss is in KiB on Linux and bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    import psutil
+
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def load_app(workdir: str, llm_latency: float, embed_latency: float, documents: int, llm_cache: str = "off"):
+    """
+    Import the graph with every store in workdir and the fakes installed.
+
+    Paths are read from the environment at import time, so the imports
+    happen here rather than at the top of the module. llm_cache is the
+    LLM_CACHE_MODE; unless LLM_CACHE_PATH is set its file is in workdir too.
+    """
+    os.environ["BOOKING_DB"] = os.path.join(workdir, "bookings.sqlite")
+    os.environ["CHECKPOINT_DB"] = os.path.join(workdir, "checkpoints.sqlite")
+    os.environ["LLM_CACHE_MODE"] = llm_cache
+    os.environ.setdefault("LLM_CACHE_PATH", os.path.join(workdir, "llm_cache.sqlite"))
+    import ground_book
+    import graph
+    import http_pool
+    import knolege_agent
+    from langchain_community.vectorstores import FAISS
+
+    ground_book.CSV_FILE = os.path.join(workdir, "bookings.csv")
+    graph.router.log_file = None
+
+    embeddings = FakeEmbeddings(latency=embed_latency)
+    texts = [
+        f"Section {i}: the {TOPICS[i % len(TOPICS)]} of model {i // len(TOPICS)} "
+        f"is rated {i % 97} units and supports option {i % 13}."
+        for i in range(documents)
+    ]
+    knolege_agent.use_models(
+        llm=FakeChatModel(latency=llm_latency),
+        embeddings=embeddings,
+        vectorstore=FAISS.from_texts(texts, embeddings, ids=[f"section-{i}" for i in range(documents)]),
+        version="benchmark",
+    )
+    http_pool.use_openai(FakeOpenAI(llm_latency), FakeAsyncOpenAI(llm_latency))
+    return graph
+
+
+def make_workloads(graph, run_id: str) -> Dict[str, tuple]:
+    """(sync, async) callables per workload; each performs request i."""
+    import ground_book
+    import knolege_agent
+    from langgraph.types import Command
+    from sessions import make_config
+
+    app = graph.app
+    first_day = date(2100, 1, 1)
+
+    def state(query):
+        return {"query": query, "responce": "", "ans": ""}
+
+    def config(workload, i):
+        return make_config(f"bench-{run_id}-{workload}-{i}", user_id=f"bench-{i}")
+
+    def question(i):
+        # A quarter of distinct questions, so the answer cache sees repeats.
+        n = i % 50
+        return f"What is the {TOPICS[n % len(TOPICS)]} rating of model {n}?"
+
+    def slot(i):
+        day = (first_day + timedelta(days=i // 16)).isoformat()
+        return day, f"{6 + i % 16:02d}:00", f"{7 + i % 16:02d}:00"
+
+    def booking_reply(i):
+        day, start, end = slot(i)
+        return f"{start} to {end} on {day}"
+
+    def math(i):
+        app.invoke(state(MATH_QUERIES[i % len(MATH_QUERIES)]), config=config("math", i))
+
+    async def amath(i):
+        await app.ainvoke(state(MATH_QUERIES[i % len(MATH_QUERIES)]), config=config("math", i))
+
+    def knowledge(i):
+        app.invoke(state(question(i)), config=config("knowledge", i))
+
+    async def aknowledge(i):
+        await app.ainvoke(state(question(i)), config=config("knowledge", i))
+
+    def booking(i):
+        cfg = config("booking", i)
+        result = app.invoke(state("I want to book the ground"), config=cfg)
+        if "__interrupt__" in result:
+            result = app.invoke(Command(resume=booking_reply(i)), config=cfg)
+        if result.get("responce") != "Booking confirmed":
+            raise RuntimeError(f"booking not confirmed: {result.get('responce')!r}")
+
+    async def abooking(i):
+        cfg = config("booking", i)
+        result = await app.ainvoke(state("I want to book the ground"), config=cfg)
+        if "__interrupt__" in result:
+            result = await app.ainvoke(Command(resume=booking_reply(i)), config=cfg)
+        if result.get("responce") != "Booking confirmed":
+            raise RuntimeError(f"booking not confirmed: {result.get('responce')!r}")
+
+    # ground_book uses its own user/day range so it never clashes with "booking".
+    def ground_booking(i):
+        day, start, end = slot(i)
+        day = (date.fromisoformat(day) + timedelta(days=20000)).isoformat()
+        return {"user_id": f"bench-{i}", "date": day, "start_time": start, "end_time": end}
+
+    def ground_book_run(i):
+        ground_book.ground_book_graph.invoke(ground_booking(i))
+
+    async def aground_book_run(i):
+        await ground_book.ground_book_graph.ainvoke(ground_booking(i))
+
+    def rag(i):
+        knolege_agent.get_rag_chain().invoke(question(i))
+
+    async def arag(i):
+        await knolege_agent.get_rag_chain().ainvoke(question(i))
+
+    return {
+        "math": (math, amath),
+        "knowledge": (knowledge, aknowledge),
+        "booking": (booking, abooking),
+        "ground_book": (ground_book_run, aground_book_run),
+        "rag": (rag, arag),
+    }
+
+
+def _timed(fn: Callable[[int], None], i: int, latencies: list, errors: list) -> None:
+    started = time.perf_counter()
+    try:
+        fn(i)
+    except Exception as e:
+        errors.append(repr(e))
+        return
+    latencies.append(time.perf_counter() - started)
+
+
+async def _atimed(fn, i: int, latencies: list, errors: list, limiter: asyncio.Semaphore) -> None:
+    async with limiter:
+        started = time.perf_counter()
+        try:
+            await fn(i)
+        except Exception as e:
+            errors.append(repr(e))
+            return
+        latencies.append(time.perf_counter() - started)
+
+
+def run_workload(sync_fn, async_fn, requests: int, concurrency: int, mode: str) -> dict:
+    """
+    Run one workload and summarise it.
+
+    Returns:
+        Dict with requests, errors, p50/p95/p99/mean latency in ms, rps and
+        the process's peak RSS in MB so far
+    """
+    latencies: List[float] = []
+    errors: List[str] = []
+    started = time.perf_counter()
+    if mode == "async":
+        async def main():
+            limiter = asyncio.Semaphore(concurrency)
+            await asyncio.gather(*(_atimed(async_fn, i, latencies, errors, limiter) for i in range(requests)))
+
+        asyncio.run(main())
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda i: _timed(sync_fn, i, latencies, errors), range(requests)))
+    elapsed = time.perf_counter() - started
+
+    ms = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "requests": requests,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Compare two result files.
+
+    Returns:
+        One line per workload present in both; lines for a p95 rise or
+        rps drop beyond tolerance (a fraction) start with "REGRESSION"
+    """
+    lines = []
+    for name, current in results["workloads"].items():
+        before = baseline.get("workloads", {}).get(name)
+        if not before:
+            continue
+        p95_change = (current["p95_ms"] - before["p95_ms"]) / before["p95_ms"] if before["p95_ms"] else 0.0
+        rps_change = (current["rps"] - before["rps"]) / before["rps"] if before["rps"] else 0.0
+        regressed = p95_change > tolerance or rps_change < -tolerance
+        lines.append(
+            f"{'REGRESSION ' if regressed else ''}{name}: p95 {before['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms "
+            f"({p95_change:+.0%}), rps {before['rps']:.1f} -> {current['rps']:.1f} ({rps_change:+.0%})"
+        )
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline latency/throughput benchmark with fake models.")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help="comma separated: " + ", ".join(WORKLOADS))
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--embed-latency", type=float, default=0.005, help="seconds per fake embedding call")
+    parser.add_argument("--documents", type=int, default=2000, help="size of the synthetic knowledge base")
+    parser.add_argument("--llm-cache", choices=("off", "on", "replay"), default="off", help="LLM_CACHE_MODE for the run")
+    parser.add_argument("--output", help="where to save the results (default benchmarks/<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed p95/rps change before flagging")
+    args = parser.parse_args(argv)
+
+    workloads = [name.strip() for name in args.workloads.split(",") if name.strip()]
+    unknown = set(workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    graph = load_app(workdir, args.llm_latency, args.embed_latency, args.documents, args.llm_cache)
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    available = make_workloads(graph, run_id)
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "workloads": {},
+    }
+    for name in workloads:
+        sync_fn, async_fn = available[name]
+        summary = run_workload(sync_fn, async_fn, args.requests, args.concurrency, args.mode)
+        results["workloads"][name] = summary
+        print(
+            f"{name:12s} p50 {summary['p50_ms']:8.1f} ms  p95 {summary['p95_ms']:8.1f} ms  "
+            f"p99 {summary['p99_ms']:8.1f} ms  {summary['rps']:8.1f} req/s  "
+            f"rss {summary['peak_rss_mb']:.0f} MB  errors {summary['errors']}"
+        )
+        if summary["first_error"]:
+            print(f"{'':12s} first error: {summary['first_error']}")
+
+    output = args.output or os.path.join("benchmarks", f"{run_id}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            lines = compare(results, json.load(f), args.tolerance)
+        print("\n".join(lines))
+        if any(line.startswith("REGRESSION") for line in lines):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import re
+from datetime import date as Date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from recurrence import add_months
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+
+_WEEKDAY = r"(mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun)(?:day)?|tuesday|wednesday|thursday|saturday"
+_MONTH = (
+    r"(january|february|march|april|may|june|july|august|september|october|november|december|"
+    r"jan|feb|mar|apr|jun|jul|aug|sept|sep|oct|nov|dec)(?:\.|\b)"
+)
+_ORDINAL = r"(?:st|nd|rd|th)?"
+
+ISO_DATE = re.compile(r"\b(\d{4})[-/](\d{1,2})[-/](\d{1,2})\b")
+DAY_MONTH = re.compile(rf"\b(\d{{1,2}}){_ORDINAL}(?:\s+of)?\s+{_MONTH}(?:,?\s+(\d{{4}}))?", re.I)
+MONTH_DAY = re.compile(rf"\b{_MONTH}\s+(\d{{1,2}}){_ORDINAL}\b(?:,?\s+(\d{{4}}))?", re.I)
+RELATIVE_DAY = re.compile(r"\b(day after tomorrow|tomorrow|today|tonight)\b", re.I)
+IN_DAYS = re.compile(r"\bin\s+(\d{1,3})\s+days?\b", re.I)
+WEEKDAY = re.compile(rf"\b(?:(next|this|coming)\s+)?({_WEEKDAY})\b", re.I)
+
+_TIME = r"(\d{1,2})(?:[:.](\d{2}))?\s*(a\.?m\.?|p\.?m\.?)?"
+TIME_RANGE = re.compile(
+    rf"(?:\b(?:from|between)\s+)?\b{_TIME}\s*(?:-|–|to|till|until|and)\s*{_TIME}(?![\d:])", re.I
+)
+SINGLE_TIME = re.compile(rf"(?:\b(at|from|after|by)\s+)?\b{_TIME}(?![\d:])", re.I)
+NAMED_TIME = re.compile(r"\b(noon|midday|midnight)\b", re.I)
+DURATION = re.compile(
+    r"\bfor\s+(\d+(?:\.\d+)?|an?|one|two|three|four|five|six)\s*(hours?|hrs?|h|minutes?|mins?)\b", re.I
+)
+REPEAT = re.compile(rf"\bevery\s+(other\s+)?(day|week|{_WEEKDAY})\b", re.I)
+REPEAT_FOR = re.compile(
+    r"\bfor\s+(?:the\s+next\s+)?(\d+|an?|one|two|three|four|five|six)\s+(weeks?|months?|years?)\b", re.I
+)
+REPEAT_UNTIL = re.compile(r"\b(?:until|till|through)\s+", re.I)
+
+_NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6}
+# Left-over words that still describe a date or time we could not pin down.
+_VAGUE = re.compile(
+    r"\d|\b(morning|afternoon|evening|night|weekend|week|month|"
+    r"january|february|march|april|june|july|august|september|october|november|december|"
+    r"o'?clock|half|quarter|past|hour|hours|am|pm|today|tonight|tomorrow|"
+    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b",
+    re.I,
+)
+
+
+def _to_24h(hour: int, minute: int, meridiem: Optional[str]) -> Optional[Tuple[int, int]]:
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        pm = meridiem.lower().startswith("p")
+        hour = hour % 12 + (12 if pm else 0)
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        return None
+    return hour, minute
+
+
+def _fmt(hour: int, minute: int) -> str:
+    return f"{hour:02d}:{minute:02d}"
+
+
+def _month_date(day: str, month: str, year: Optional[str], today: Date) -> Optional[Date]:
+    month_number = MONTHS.index(month.lower()[:3]) + 1
+    try:
+        if year:
+            return Date(int(year), month_number, int(day))
+        candidate = Date(today.year, month_number, int(day))
+        return candidate if candidate >= today else Date(today.year + 1, month_number, int(day))
+    except ValueError:
+        return None
+
+
+def _weekday_date(qualifier: Optional[str], name: str, today: Date) -> Date:
+    target = next(i for i, day in enumerate(WEEKDAYS) if day.startswith(name.lower()[:3]))
+    ahead = (target - today.weekday()) % 7
+    if qualifier and qualifier.lower() == "next" and ahead == 0:
+        ahead = 7
+    return today + timedelta(days=ahead)
+
+
+def _date_value(pattern: re.Pattern, match: re.Match, today: Date) -> Optional[Date]:
+    if pattern is ISO_DATE:
+        try:
+            return Date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        except ValueError:
+            return None
+    if pattern is DAY_MONTH:
+        return _month_date(match.group(1), match.group(2), match.group(3), today)
+    if pattern is MONTH_DAY:
+        return _month_date(match.group(2), match.group(1), match.group(3), today)
+    if pattern is RELATIVE_DAY:
+        offset = {"today": 0, "tonight": 0, "tomorrow": 1, "day after tomorrow": 2}[match.group(1).lower()]
+        return today + timedelta(days=offset)
+    if pattern is IN_DAYS:
+        return today + timedelta(days=int(match.group(1)))
+    return _weekday_date(match.group(1), match.group(2), today)
+
+
+DATE_PATTERNS = (ISO_DATE, DAY_MONTH, MONTH_DAY, RELATIVE_DAY, IN_DAYS, WEEKDAY)
+
+
+def _find_dates(text: str, today: Date) -> List[Tuple[int, int, Optional[Date]]]:
+    """Every date mention as (start, end, date or None), in text order."""
+    found = []
+    for pattern in DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            # Earlier patterns are more specific ("15 March" over "march").
+            if any(match.start() < end and start < match.end() for start, end, _ in found):
+                continue
+            found.append((match.start(), match.end(), _date_value(pattern, match, today)))
+    return sorted(found, key=lambda item: item[0])
+
+
+def _parse_date(text: str, today: Date) -> Tuple[Optional[str], str]:
+    found = _find_dates(text, today)
+    values = {value for _, _, value in found}
+    if not found or None in values or len(values) > 1:
+        # No date, one that isn't real (31 February) or several different
+        # ones ("tomorrow or friday"): keep it unresolved.
+        return None, text
+    for start, end, _ in reversed(found):
+        text = text[:start] + " " + text[end:]
+    return values.pop().isoformat(), text
+
+
+def _parse_repeat(text: str, today: Date) -> Tuple[Dict[str, object], Optional[Tuple[int, str]], str]:
+    """Pull "every tuesday", "until 30 June" and "for 6 months" out of the text."""
+    match = REPEAT.search(text)
+    if not match:
+        return {}, None, text
+    other, unit = match.group(1), match.group(2).lower()
+    days = 1 if unit == "day" else 7
+    fields: Dict[str, object] = {"repeat_every_days": days * (2 if other else 1)}
+    # Keep the weekday name so _parse_date finds the first occurrence.
+    keep = "" if unit in ("day", "week") else unit
+    text = text[:match.start()] + " " + keep + " " + text[match.end():]
+
+    span = None
+    match = REPEAT_FOR.search(text)
+    if match:
+        count = int(_NUMBER_WORDS.get(match.group(1).lower(), match.group(1)))
+        span = (count, match.group(2).lower()[0])
+        text = text[:match.start()] + " " + text[match.end():]
+
+    match = REPEAT_UNTIL.search(text)
+    if match:
+        after = text[match.end():]
+        found = _find_dates(after, today)
+        # Only a date directly after "until" ends the series ("until 8pm on
+        # 5 March" is a time range).
+        if found and found[0][0] == 0 and found[0][2] is not None:
+            fields["repeat_until"] = found[0][2].isoformat()
+            text = text[:match.start()] + " " + after[found[0][1]:]
+    return fields, span, text
+
+
+def _ambiguous(hour: str, meridiem: Optional[str]) -> bool:
+    # "7:30" could be morning or evening; "07:30", "19:30" and "7:30pm" can't.
+    return not meridiem and 1 <= int(hour) <= 12 and not hour.startswith("0")
+
+
+def _named_to_clock(match: re.Match) -> str:
+    return "12:00am" if match.group(1).lower() == "midnight" else "12:00pm"
+
+
+def _parse_times(text: str) -> Tuple[Dict[str, str], str]:
+    # Times that stay ambiguous are left in the returned text, so the
+    # reply counts as unresolved and the LLM gets to read it.
+    fields = {}
+    # "noon" and "midnight" are read like any clock time, also in ranges.
+    text = NAMED_TIME.sub(_named_to_clock, text)
+    match = TIME_RANGE.search(text)
+    if match:
+        h1, m1, ap1, h2, m2, ap2 = match.groups()
+        # A bare "2 to 4" could be morning or afternoon; so could "10:00
+        # to 11:30". Leave those to the LLM.
+        if ap1 or ap2 or (m1 and m2 and not (_ambiguous(h1, None) and _ambiguous(h2, None))):
+            end = _to_24h(int(h2), int(m2 or 0), ap2 or ap1)
+            start = _to_24h(int(h1), int(m1 or 0), ap1 or ap2)
+            if start and end and ap2 and not ap1 and start > end:
+                # "11 to 1pm": the meridiem only belongs to the end.
+                start = _to_24h(int(h1), int(m1 or 0), "am")
+            if start and end and start >= end:
+                # "10pm to 1am" crosses midnight; "5 to 5pm" is a typo.
+                return {}, text
+            if start and end:
+                fields = {"start_time": _fmt(*start), "end_time": _fmt(*end)}
+                return fields, text[:match.start()] + " " + text[match.end():]
+
+    for match in SINGLE_TIME.finditer(text):
+        _, hour, minute, meridiem = match.groups()
+        # A bare hour ("at 8") or "7:30" could be morning or evening.
+        if (not minute and not meridiem) or (minute and _ambiguous(hour, meridiem)):
+            continue
+        value = _to_24h(int(hour), int(minute or 0), meridiem)
+        if value is None:
+            continue
+        fields["start_time"] = _fmt(*value)
+        return fields, text[:match.start()] + " " + text[match.end():]
+
+    return fields, text
+
+
+def parse_booking_text(text: str, today: Optional[Date] = None) -> Tuple[Dict[str, str], bool]:
+    """
+    Extract booking date and times from a user reply without an LLM.
+
+    Understands ISO dates, "15 March", "March 15th", today/tomorrow/
+    day after tomorrow, "in 3 days", weekday names ("next friday"),
+    12/24-hour times ("2pm", "14:30", "noon"), ranges ("2pm to 4pm",
+    "14:00-16:00"), durations ("at 6pm for 2 hours") and repeats
+    ("every tuesday for 6 months", "every day until 30 June").
+
+    Args:
+        text: The user's reply
+        today: Reference date for relative expressions (default: today)
+
+    Returns:
+        Tuple of (fields, unresolved). fields holds any of date,
+        start_time, end_time, repeat_until in YYYY-MM-DD / HH:MM format
+        and repeat_every_days as an int. unresolved is
+        True when the reply still mentions a date or time that could not
+        be parsed, i.e. when asking the LLM may add information.
+    """
+    today = today or Date.today()
+
+    fields, span, rest = _parse_repeat(text, today)
+    value, rest = _parse_date(rest, today)
+    if value:
+        fields["date"] = value
+    if span and "repeat_until" not in fields:
+        count, unit = span
+        first = fields.get("date") or today.isoformat()
+        if unit == "w":
+            fields["repeat_until"] = (Date.fromisoformat(first) + timedelta(weeks=count)).isoformat()
+        else:
+            fields["repeat_until"] = add_months(first, count * (12 if unit == "y" else 1))
+
+    times, rest = _parse_times(rest)
+    fields.update(times)
+
+    match = DURATION.search(rest)
+    if match:
+        amount = float(_NUMBER_WORDS.get(match.group(1).lower(), match.group(1)))
+        minutes = int(amount * (60 if match.group(2).lower().startswith("h") else 1))
+        if "start_time" in fields and "end_time" not in fields:
+            hour, minute = map(int, fields["start_time"].split(":"))
+            end = hour * 60 + minute + minutes
+            if end < 24 * 60:
+                fields["end_time"] = _fmt(end // 60, end % 60)
+                rest = rest[:match.start()] + " " + rest[match.end():]
+
+    return fields, bool(_VAGUE.search(rest))
@@ -0,0 +1,558 @@
+import csv
+import os
+import sqlite3
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from logger import get_logger
+from recurrence import RULE_FIELDS, RecurrenceRule, RuleIndex, occurrences, occurs_on, ordinal, rules_conflict
+
+log = get_logger("booking_store")
+
+BOOKING_FIELDS = ["user_id", "start_time", "end_time", "date"]
+
+
+def to_minutes(hhmm: str) -> int:
+    """Convert a 24-hour HH:MM string to minutes after midnight."""
+    hours, minutes = hhmm.strip().split(":")
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours <= 23 and 0 <= minutes <= 59):
+        raise ValueError(f"time data '{hhmm}' does not match format '%H:%M'")
+    return hours * 60 + minutes
+
+
+def from_minutes(minutes: int) -> str:
+    """Convert minutes after midnight to a 24-hour HH:MM string."""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def validate_booking(row: dict) -> Optional[str]:
+    """Return why a row is not a valid booking, or None."""
+    missing = [field for field in BOOKING_FIELDS if not str(row.get(field) or "").strip()]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    try:
+        datetime.strptime(str(row["date"]), "%Y-%m-%d")
+    except ValueError:
+        return f"invalid date {row['date']!r}"
+    try:
+        start, end = to_minutes(str(row["start_time"])), to_minutes(str(row["end_time"]))
+    except ValueError:
+        return f"invalid time {row['start_time']!r}-{row['end_time']!r}"
+    if start >= end:
+        return "end_time must be after start_time"
+    return None
+
+
+class DayIndex:
+    """
+    Bookings of a single date, sorted by start minute.
+
+    max_end[i] is the latest end among the first i + 1 intervals, so an
+    overlap check is one binary search: the intervals starting before the
+    new end overlap it iff the latest of their ends is after the new start.
+    """
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.max_end: List[int] = []
+
+    def overlaps(self, start: int, end: int) -> bool:
+        count = bisect_left(self.starts, end)
+        return count > 0 and self.max_end[count - 1] > start
+
+    def add(self, start: int, end: int) -> None:
+        position = bisect_left(self.starts, start)
+        self.starts.insert(position, start)
+        self.ends.insert(position, end)
+        running = self.max_end[position - 1] if position else end
+        self.max_end.insert(position, 0)
+        for i in range(position, len(self.starts)):
+            running = max(running, self.ends[i])
+            self.max_end[i] = running
+
+    def intervals(self) -> List[Tuple[int, int]]:
+        return list(zip(self.starts, self.ends))
+
+    @classmethod
+    def from_intervals(cls, intervals) -> "DayIndex":
+        """Build an index from (start, end) intervals in one sorted pass."""
+        day = cls()
+        running = 0
+        for start, end in sorted(intervals):
+            running = max(running, end)
+            day.starts.append(start)
+            day.ends.append(end)
+            day.max_end.append(running)
+        return day
+
+
+def sweep_conflicts(bookings: List[dict], existing: Callable[[str], Optional[DayIndex]]) -> Dict[int, str]:
+    """
+    Find the bookings of a batch that cannot be stored.
+
+    Invalid bookings (see validate_booking) are rejected first. The rest
+    are sorted by (date, start) and swept once: a booking is rejected if
+    it overlaps the store (one binary search in the date's DayIndex) or a
+    booking accepted earlier in the sweep, which is the case iff the
+    latest accepted end on that date is after its start.
+
+    Args:
+        bookings: Bookings to check
+        existing: Returns the stored DayIndex of a date, or None
+
+    Returns:
+        {position in bookings: reason} for every rejected booking
+    """
+    failures = {}
+    for i, booking in enumerate(bookings):
+        error = validate_booking(booking)
+        if error:
+            failures[i] = error
+    order = sorted(
+        (i for i in range(len(bookings)) if i not in failures),
+        key=lambda i: (bookings[i]["date"], to_minutes(bookings[i]["start_time"])),
+    )
+    date, day, latest_end, latest = None, None, -1, None
+    for i in order:
+        booking = bookings[i]
+        start, end = to_minutes(booking["start_time"]), to_minutes(booking["end_time"])
+        if booking["date"] != date:
+            date, day, latest_end, latest = booking["date"], existing(booking["date"]), -1, None
+        if day is not None and day.overlaps(start, end):
+            failures[i] = "conflicts with an existing booking"
+        elif latest_end > start:
+            other = bookings[latest]
+            failures[i] = f"overlaps {other['start_time']}-{other['end_time']} on {date} in the same batch"
+        else:
+            latest_end, latest = end, i
+    return failures
+
+
+class CsvBookingStore:
+    """
+    Booking store backed by the bookings CSV file.
+
+    The file is read once; afterwards a per-date DayIndex answers conflict
+    checks in O(log n) and writes append one row and update the index,
+    so the hot path never rescans booking history. Recurring bookings
+    are kept as rules in a sidecar CSV (bookings.rules.csv) and a
+    RuleIndex, never expanded into rows.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rules_path = os.path.splitext(path)[0] + ".rules.csv"
+        self.days: Dict[str, DayIndex] = defaultdict(DayIndex)
+        self.by_user: Dict[str, List[dict]] = defaultdict(list)
+        self._lock = threading.Lock()
+        for booking in read_bookings(path):
+            self._index(booking)
+        self.rules = RuleIndex(
+            {**rule, "period_days": int(rule["period_days"])} for rule in read_bookings(self.rules_path, RULE_FIELDS)
+        )
+
+    def _index(self, booking: dict) -> None:
+        self.days[booking["date"]].add(to_minutes(booking["start_time"]), to_minutes(booking["end_time"]))
+        self.by_user[str(booking["user_id"])].append(booking)
+
+    def is_available(self, booking: dict) -> bool:
+        start, end = to_minutes(booking["start_time"]), to_minutes(booking["end_time"])
+        day = self.days.get(booking["date"])
+        if day is not None and day.overlaps(start, end):
+            return False
+        return not self.rules.conflicts(booking["date"], start, end)
+
+    def holds(self, booking: dict) -> bool:
+        """True if the booking's user already has exactly this slot."""
+        start, end = to_minutes(booking["start_time"]), to_minutes(booking["end_time"])
+        return any(
+            row["date"] == booking["date"] and to_minutes(row["start_time"]) == start and to_minutes(row["end_time"]) == end
+            for row in self.by_user.get(str(booking["user_id"]), ())
+        )
+
+    def _day(self, date: str) -> Optional[DayIndex]:
+        """The date's index including rule occurrences, for batch sweeps."""
+        extra = self.rules.intervals(date)
+        if not extra:
+            return self.days.get(date)
+        return DayIndex.from_intervals(self.intervals(date))
+
+    def book(self, booking: dict) -> bool:
+        """
+        Store a booking unless it conflicts with an existing one.
+
+        Returns:
+            True if the booking was stored, False on a conflict
+
+        Raises:
+            ValueError: If the booking is invalid (see validate_booking)
+        """
+        error = validate_booking(booking)
+        if error:
+            raise ValueError(error)
+        row = {field: booking[field] for field in BOOKING_FIELDS}
+        with self._lock:
+            if not self.is_available(row):
+                return False
+            append_bookings(self.path, [row])
+            self._index(row)
+        return True
+
+    def book_many(self, bookings: List[dict], atomic: bool = True) -> Dict[int, str]:
+        """
+        Store a batch of bookings with one conflict sweep.
+
+        Args:
+            bookings: Bookings to store
+            atomic: Store nothing if any booking is rejected
+
+        Returns:
+            {position in bookings: reason} for the rejected bookings
+        """
+        rows = [{field: booking.get(field) for field in BOOKING_FIELDS} for booking in bookings]
+        with self._lock:
+            failures = sweep_conflicts(rows, self._day)
+            if atomic and failures:
+                return failures
+            accepted = [row for i, row in enumerate(rows) if i not in failures]
+            append_bookings(self.path, accepted)
+            for row in accepted:
+                self._index(row)
+        return failures
+
+    def add_rule(self, rule: RecurrenceRule) -> bool:
+        """
+        Store a recurring booking unless any occurrence conflicts.
+
+        Other rules are checked arithmetically; single bookings only on
+        the rule's own dates, expanded lazily.
+
+        Returns:
+            True if the rule was stored, False on a conflict
+        """
+        start, end = to_minutes(rule["start_time"]), to_minutes(rule["end_time"])
+        with self._lock:
+            if self.rules.conflicts_with_rule(rule):
+                return False
+            for date in occurrences(rule):
+                day = self.days.get(date)
+                if day is not None and day.overlaps(start, end):
+                    return False
+            append_bookings(self.rules_path, [rule], RULE_FIELDS)
+            self.rules.add(rule)
+        return True
+
+    def bookings_for_user(self, user_id: str) -> List[dict]:
+        return list(self.by_user.get(str(user_id), []))
+
+    def rules_for_user(self, user_id: str) -> List[RecurrenceRule]:
+        return self.rules.for_user(user_id)
+
+    def intervals(self, date: str) -> List[Tuple[int, int]]:
+        """Booked (start, end) minute intervals of a date, sorted by start."""
+        day = self.days.get(date)
+        booked = day.intervals() if day else []
+        extra = self.rules.intervals(date)
+        return sorted(booked + extra) if extra else booked
+
+
+class SqliteBookingStore:
+    """
+    Booking store backed by SQLite in WAL mode.
+
+    Several processes can share one database file: the conflict check and
+    the insert run in one IMMEDIATE transaction, so two workers can never
+    book overlapping slots, and readers are not blocked by writers. Each
+    thread uses its own connection.
+
+    Recurring bookings are one row each in booking_rules; whether a rule
+    occurs on a date is the arithmetic test (day - start_ord) % period = 0
+    on day ordinals, evaluated in the query.
+    """
+
+    def __init__(self, path: str, import_csv: str = None):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS bookings (
+                id INTEGER PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                date TEXT NOT NULL,
+                start_time TEXT NOT NULL,
+                end_time TEXT NOT NULL,
+                start_min INTEGER NOT NULL,
+                end_min INTEGER NOT NULL,
+                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_bookings_slot ON bookings (date, start_min, end_min);
+            CREATE INDEX IF NOT EXISTS idx_bookings_user ON bookings (user_id);
+            CREATE TABLE IF NOT EXISTS booking_rules (
+                id INTEGER PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                period_days INTEGER NOT NULL,
+                start_time TEXT NOT NULL,
+                end_time TEXT NOT NULL,
+                start_ord INTEGER NOT NULL,
+                end_ord INTEGER NOT NULL,
+                start_min INTEGER NOT NULL,
+                end_min INTEGER NOT NULL,
+                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_booking_rules_window ON booking_rules (end_ord, start_ord);
+            """
+        )
+        if import_csv:
+            self._import_csv(import_csv)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: transactions are opened explicitly with BEGIN.
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _import_csv(self, csv_path: str) -> None:
+        """Import a bookings CSV into an empty database (first start only)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM bookings LIMIT 1").fetchone() is None:
+                rows = read_bookings(csv_path)
+                self._insert(conn, rows)
+                if rows:
+                    log.info("Imported %d bookings from %s", len(rows), csv_path)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, bookings: List[dict]) -> None:
+        conn.executemany(
+            "INSERT INTO bookings (user_id, date, start_time, end_time, start_min, end_min)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    str(b["user_id"]), b["date"], b["start_time"], b["end_time"],
+                    to_minutes(b["start_time"]), to_minutes(b["end_time"]),
+                )
+                for b in bookings
+            ],
+        )
+
+    _RULES_ON_DATE = (
+        "SELECT start_min, end_min FROM booking_rules"
+        " WHERE start_ord <= :day AND end_ord >= :day AND (:day - start_ord) % period_days = 0"
+    )
+
+    @classmethod
+    def _conflicts(cls, conn: sqlite3.Connection, date: str, start: int, end: int) -> bool:
+        row = conn.execute(
+            "SELECT 1 FROM bookings WHERE date = :date AND start_min < :end AND end_min > :start"
+            f" UNION ALL SELECT 1 FROM ({cls._RULES_ON_DATE}) WHERE start_min < :end AND end_min > :start"
+            " LIMIT 1",
+            {"date": date, "day": ordinal(date), "start": start, "end": end},
+        ).fetchone()
+        return row is not None
+
+    @staticmethod
+    def _rules(conn: sqlite3.Connection, first: str, last: str) -> List[RecurrenceRule]:
+        """Rules with occurrences possible between two dates (inclusive)."""
+        rows = conn.execute(
+            "SELECT user_id, start_time, end_time, start_date, end_date, period_days FROM booking_rules"
+            " WHERE end_ord >= ? AND start_ord <= ?",
+            (ordinal(first), ordinal(last)),
+        ).fetchall()
+        return [dict(zip(RULE_FIELDS, row)) for row in rows]
+
+    def is_available(self, booking: dict) -> bool:
+        start, end = to_minutes(booking["start_time"]), to_minutes(booking["end_time"])
+        return not self._conflicts(self._conn(), booking["date"], start, end)
+
+    def holds(self, booking: dict) -> bool:
+        """True if the booking's user already has exactly this slot."""
+        row = self._conn().execute(
+            "SELECT 1 FROM bookings WHERE user_id = ? AND date = ? AND start_min = ? AND end_min = ? LIMIT 1",
+            (str(booking["user_id"]), booking["date"], to_minutes(booking["start_time"]), to_minutes(booking["end_time"])),
+        ).fetchone()
+        return row is not None
+
+    def book(self, booking: dict) -> bool:
+        """
+        Store a booking unless it conflicts with an existing one.
+
+        Returns:
+            True if the booking was stored, False on a conflict
+
+        Raises:
+            ValueError: If the booking is invalid (see validate_booking)
+        """
+        error = validate_booking(booking)
+        if error:
+            raise ValueError(error)
+        start, end = to_minutes(booking["start_time"]), to_minutes(booking["end_time"])
+        conn = self._conn()
+        # IMMEDIATE takes the write lock up front, so no other writer can
+        # insert between the conflict check and our insert.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._conflicts(conn, booking["date"], start, end):
+                conn.execute("ROLLBACK")
+                return False
+            self._insert(conn, [booking])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def book_many(self, bookings: List[dict], atomic: bool = True) -> Dict[int, str]:
+        """
+        Store a batch of bookings with one conflict sweep.
+
+        The stored intervals of the batch's date range are read and the
+        accepted rows inserted inside one IMMEDIATE transaction.
+
+        Args:
+            bookings: Bookings to store
+            atomic: Store nothing if any booking is rejected
+
+        Returns:
+            {position in bookings: reason} for the rejected bookings
+        """
+        dates = [booking["date"] for booking in bookings if validate_booking(booking) is None]
+        if not dates:
+            return sweep_conflicts(bookings, lambda date: None)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stored = defaultdict(list)
+            for date, start, end in conn.execute(
+                "SELECT date, start_min, end_min FROM bookings WHERE date BETWEEN ? AND ?",
+                (min(dates), max(dates)),
+            ):
+                stored[date].append((start, end))
+            rules = RuleIndex(self._rules(conn, min(dates), max(dates)))
+            if rules.rules:
+                for date in set(dates):
+                    stored[date].extend(rules.intervals(date))
+            days = {date: DayIndex.from_intervals(intervals) for date, intervals in stored.items()}
+
+            failures = sweep_conflicts(bookings, days.get)
+            if atomic and failures:
+                conn.execute("ROLLBACK")
+                return failures
+            self._insert(conn, [b for i, b in enumerate(bookings) if i not in failures])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return failures
+
+    def add_rule(self, rule: RecurrenceRule) -> bool:
+        """
+        Store a recurring booking unless any occurrence conflicts.
+
+        Other rules are checked arithmetically; single bookings only need
+        the candidates in the rule's date and time window.
+
+        Returns:
+            True if the rule was stored, False on a conflict
+        """
+        start, end = to_minutes(rule["start_time"]), to_minutes(rule["end_time"])
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            others = self._rules(conn, rule["start_date"], rule["end_date"])
+            conflict = any(rules_conflict(rule, other) for other in others) or any(
+                occurs_on(rule, date)
+                for (date,) in conn.execute(
+                    "SELECT date FROM bookings WHERE date BETWEEN ? AND ? AND start_min < ? AND end_min > ?",
+                    (rule["start_date"], rule["end_date"], end, start),
+                )
+            )
+            if conflict:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "INSERT INTO booking_rules (user_id, start_date, end_date, period_days, start_time, end_time,"
+                " start_ord, end_ord, start_min, end_min) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(rule["user_id"]), rule["start_date"], rule["end_date"], int(rule["period_days"]),
+                    rule["start_time"], rule["end_time"],
+                    ordinal(rule["start_date"]), ordinal(rule["end_date"]), start, end,
+                ),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def bookings_for_user(self, user_id: str) -> List[dict]:
+        rows = self._conn().execute(
+            "SELECT user_id, start_time, end_time, date FROM bookings WHERE user_id = ? ORDER BY date, start_min",
+            (str(user_id),),
+        ).fetchall()
+        return [dict(zip(BOOKING_FIELDS, row)) for row in rows]
+
+    def rules_for_user(self, user_id: str) -> List[RecurrenceRule]:
+        rows = self._conn().execute(
+            "SELECT user_id, start_time, end_time, start_date, end_date, period_days FROM booking_rules"
+            " WHERE user_id = ? ORDER BY start_date",
+            (str(user_id),),
+        ).fetchall()
+        return [dict(zip(RULE_FIELDS, row)) for row in rows]
+
+    def intervals(self, date: str) -> List[Tuple[int, int]]:
+        """Booked (start, end) minute intervals of a date, sorted by start."""
+        return self._conn().execute(
+            f"SELECT start_min, end_min FROM bookings WHERE date = :date UNION ALL {self._RULES_ON_DATE}"
+            " ORDER BY start_min",
+            {"date": date, "day": ordinal(date)},
+        ).fetchall()
+
+    def export_csv(self, csv_path: str) -> int:
+        """Write every booking to a CSV file; returns the number of rows."""
+        rows = self._conn().execute(
+            "SELECT user_id, start_time, end_time, date FROM bookings ORDER BY date, start_min"
+        ).fetchall()
+        with open(csv_path, "w", newline="", encoding="utf-8") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(BOOKING_FIELDS)
+            writer.writerows(rows)
+        return len(rows)
+
+
+def read_bookings(path: str, fields: List[str] = BOOKING_FIELDS) -> List[dict]:
+    """Read all bookings (or rules, with RULE_FIELDS) from a CSV file."""
+    bookings = []
+    if not os.path.isfile(path):
+        return bookings
+    with open(path, "r", newline="", encoding="utf-8") as csvfile:
+        for row in csv.DictReader(csvfile):
+            bookings.append({field: row[field] for field in fields})
+    return bookings
+
+
+def append_bookings(path: str, bookings: List[dict], fields: List[str] = BOOKING_FIELDS) -> None:
+    """Append bookings (or rules) to a CSV file, writing the header if needed."""
+    file_exists = os.path.isfile(path)
+    with open(path, "a", newline="", encoding="utf-8") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fields)
+        if not file_exists or os.stat(path).st_size == 0:
+            writer.writeheader()
+        for booking in bookings:
+            writer.writerow({field: booking[field] for field in fields})
@@ -0,0 +1,201 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Optional, Tuple
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from logger import get_logger
+
+log = get_logger("checkpoints")
+
+# "sqlite" (default) lets several workers share and resume conversations;
+# "memory" keeps the old per-process MemorySaver.
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "sqlite")
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.sqlite")
+# Threads without activity for this long are deleted (finished or abandoned).
+CHECKPOINT_TTL_SECONDS = float(os.getenv("CHECKPOINT_TTL_SECONDS", 7 * 24 * 3600))
+# Checkpoints kept per thread; older history is dropped on every write.
+CHECKPOINT_MAX_HISTORY = int(os.getenv("CHECKPOINT_MAX_HISTORY", "10"))
+CHECKPOINT_PRUNE_INTERVAL = float(os.getenv("CHECKPOINT_PRUNE_INTERVAL", "300"))
+
+
+class CompressedSerializer:
+    """
+    Wrap a checkpoint serializer and zlib-compress its payloads.
+
+    Payloads smaller than min_size are stored as is; compressed ones get a
+    "+zlib" suffix on their type so both kinds can be read back.
+    """
+
+    SUFFIX = "+zlib"
+
+    def __init__(self, serde: Any = None, level: int = 6, min_size: int = 256):
+        self.serde = serde or JsonPlusSerializer()
+        self.level = level
+        self.min_size = min_size
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) < self.min_size:
+            return type_, data
+        return type_ + self.SUFFIX, zlib.compress(data, self.level)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.endswith(self.SUFFIX):
+            type_, payload = type_[: -len(self.SUFFIX)], zlib.decompress(payload)
+        return self.serde.loads_typed((type_, payload))
+
+
+class PrunedSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver with compressed checkpoints, bounded history and a TTL.
+
+    Every put keeps only the newest max_history checkpoints (and their
+    writes) of the thread, and records the thread's last activity. At most
+    every prune_interval seconds, threads idle for longer than ttl are
+    deleted. The database is in WAL mode, so several processes can share
+    it and resume each other's threads. Without a connection, path is
+    opened on first use, so compiling a graph with the saver touches no
+    files. The async methods run the sync ones in worker threads.
+    """
+
+    def __init__(
+        self,
+        conn: Optional[sqlite3.Connection] = None,
+        ttl: float = CHECKPOINT_TTL_SECONDS,
+        max_history: int = CHECKPOINT_MAX_HISTORY,
+        prune_interval: float = CHECKPOINT_PRUNE_INTERVAL,
+        path: str = CHECKPOINT_DB,
+    ):
+        super().__init__(conn, serde=CompressedSerializer())
+        self.path = path
+        self.ttl = ttl
+        self.max_history = max_history
+        self.prune_interval = prune_interval
+        self._last_prune = 0.0
+        self._connect_lock = threading.Lock()
+
+    @classmethod
+    def from_path(cls, path: str = CHECKPOINT_DB, **kwargs) -> "PrunedSqliteSaver":
+        return cls(None, path=path, **kwargs)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self._connect_lock:
+                if self._conn is None:
+                    # The saver serialises access with its own lock.
+                    self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        return self._conn
+
+    @conn.setter
+    def conn(self, conn: Optional[sqlite3.Connection]) -> None:
+        self._conn = conn
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.executescript(
+            """
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS thread_activity (
+                thread_id TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_thread_activity_updated ON thread_activity (updated_at);
+            """
+        )
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = str(saved["configurable"]["thread_id"])
+        checkpoint_ns = saved["configurable"]["checkpoint_ns"]
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO thread_activity (thread_id, updated_at) VALUES (?, ?)",
+                (thread_id, time.time()),
+            )
+            if self.max_history:
+                self._trim(cur, thread_id, checkpoint_ns)
+        if time.time() - self._last_prune >= self.prune_interval:
+            self.prune()
+        return saved
+
+    def _trim(self, cur: sqlite3.Cursor, thread_id: str, checkpoint_ns: str) -> None:
+        # checkpoint ids are time-ordered (uuid6), so the oldest kept id
+        # bounds everything that can go.
+        row = cur.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+            " ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.max_history - 1),
+        ).fetchone()
+        if row is None:
+            return
+        for table in ("checkpoints", "writes"):
+            cur.execute(
+                f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (thread_id, checkpoint_ns, row[0]),
+            )
+
+    def prune(self, ttl: Optional[float] = None) -> int:
+        """
+        Delete every thread idle for longer than ttl seconds.
+
+        Returns:
+            Number of threads deleted
+        """
+        self._last_prune = time.time()
+        cutoff = time.time() - (self.ttl if ttl is None else ttl)
+        with self.cursor() as cur:
+            stale = [
+                (thread_id,)
+                for (thread_id,) in cur.execute(
+                    "SELECT thread_id FROM thread_activity WHERE updated_at < ?", (cutoff,)
+                ).fetchall()
+            ]
+            for table in ("checkpoints", "writes", "thread_activity"):
+                cur.executemany(f"DELETE FROM {table} WHERE thread_id = ?", stale)
+        if stale:
+            log.info("Pruned %d idle checkpoint threads", len(stale))
+        return len(stale)
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
+
+    # SqliteSaver is sync-only; for app.ainvoke/astream the same calls run
+    # in worker threads (the saver's lock already serialises them).
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def make_checkpointer() -> BaseCheckpointSaver:
+    """The checkpointer selected by CHECKPOINT_BACKEND."""
+    if CHECKPOINT_BACKEND == "memory":
+        return MemorySaver()
+    return PrunedSqliteSaver.from_path(CHECKPOINT_DB)
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from llm_cache import LLM_CACHE_MODE, CacheMiss
+from logger import get_logger
+
+log = get_logger("embedding_cache")
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# SQLite limits the number of host parameters per statement.
+_LOOKUP_CHUNK = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed cache in front of another Embeddings object.
+
+    Vectors are stored as float32 blobs in SQLite, keyed by the sha256 of
+    (model, text), with queries in their own namespace, so identical
+    chunks and repeated questions are only embedded once. When the cache
+    grows past max_entries the least recently used vectors are evicted.
+    With replay_only (the default when LLM_CACHE_MODE is "replay") a text
+    that isn't cached raises CacheMiss instead of calling the underlying
+    model.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model: Optional[str] = None,
+        path: str = EMBEDDING_CACHE_PATH,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        replay_only: bool = LLM_CACHE_MODE == "replay",
+    ):
+        self.underlying = underlying
+        self.replay_only = replay_only
+        self.model = model or getattr(underlying, "model", type(underlying).__name__)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def _key(self, text: str, kind: str = "document") -> str:
+        # Queries get their own namespace: some models embed a question
+        # differently from a chunk with the same text. Document keys are
+        # unchanged so existing caches of chunk vectors stay valid.
+        prefix = "" if kind == "document" else f"{kind}\0"
+        return hashlib.sha256(f"{self.model}\0{prefix}{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        for i in range(0, len(keys), _LOOKUP_CHUNK):
+            chunk = keys[i:i + _LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            for key, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                found[key] = vector.tolist()
+        if found:
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+        return found
+
+    def _store(self, items: Dict[str, List[float]]) -> None:
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            [(key, array("f", vector).tobytes(), now) for key, vector in items.items()],
+        )
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN"
+                " (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+            log.debug("Evicted %d cached embeddings", count - self.max_entries)
+
+    def _embed(
+        self, texts: List[str], compute: Callable[[List[str]], List[List[float]]], kind: str = "document"
+    ) -> List[List[float]]:
+        keys = [self._key(text, kind) for text in texts]
+        with self._lock:
+            cached = self._lookup(list(dict.fromkeys(keys)))
+            self._conn.commit()
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in cached and key not in missing:
+                    missing[key] = text
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing and self.replay_only:
+            raise CacheMiss(f"{len(missing)} texts have no cached embedding")
+        if missing:
+            vectors = compute(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            with self._lock:
+                self._store(computed)
+                self._conn.commit()
+            cached.update(computed)
+
+        return [cached[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, self.underlying.embed_documents)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        embed_query for many texts with one cache lookup.
+
+        The misses are embedded in one request when the model embeds
+        queries exactly like documents (OpenAI), else one embed_query each.
+        """
+        underlying = self.underlying
+        if isinstance(underlying, OpenAIEmbeddings):
+            return self._embed(texts, underlying.embed_documents, kind="query")
+        return self._embed(texts, lambda missing: embed_queries(underlying, missing), kind="query")
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text, "query")
+        with self._lock:
+            cached = self._lookup([key])
+            self._conn.commit()
+            if key in cached:
+                self.hits += 1
+                return cached[key]
+            self.misses += 1
+        if self.replay_only:
+            raise CacheMiss(f"No cached embedding for {text[:200]!r}")
+
+        vector = self.underlying.embed_query(text)
+        with self._lock:
+            self._store({key: vector})
+            self._conn.commit()
+        return vector
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the number of cached vectors."""
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embed search queries (not documents) in one go where possible.
+
+    Some models embed queries differently from documents, so queries go
+    through embed_query, or through embed_queries on embeddings that
+    provide it (CachedEmbeddings) to batch them.
+    """
+    if len(texts) == 1:
+        return [embeddings.embed_query(texts[0])]
+    batch = getattr(embeddings, "embed_queries", None)
+    if batch is not None:
+        return batch(texts)
+    return [embeddings.embed_query(text) for text in texts]
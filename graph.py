@@ -17,13 +17,18 @@ Strict instructions:
 your query :-{query}
 """
 from sqlalchemy import true
-from knolege_agent import llm,rag_chain
+from collections import defaultdict
+from knolege_agent import get_llm,answer_query,aanswer_query,answer_queries
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.tools import tool
-from typing import TypedDict
-from ground_book import update_booking_state,ground_book_graph,config,checkpointer
+from typing import List, TypedDict
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from ground_book import update_booking_state,aupdate_booking_state,ground_book_graph,checkpointer
+from http_pool import LLM_CONCURRENCY, llm_slot
 from langgraph.types import interrupt, Command
+from router import CentroidClassifier, QueryRouter
+from math_engine import MathError, evaluate, extract_expression, format_number
+from sessions import make_config
 
 @tool
 def math_tool(first_num: float, second_num: float, operation: str) -> dict:
@@ -53,12 +58,12 @@ class InitailStateState(TypedDict):
     query: str
     responce:str
     ans:str
+    route:str
+    route_source:str
     
     
-def inital_chat(state:InitailStateState):
-  
-    query=state["query"]
-    QUERY_ROUTER_PROMPT =f"""
+def _router_prompt(query:str) -> str:
+    return f"""
     You are a Query Router Agent.
     Your task is to read the user's query and reply with only one agent name based on the intent.
 
@@ -76,27 +81,101 @@ def inital_chat(state:InitailStateState):
 
     your query :- {query}
     """
-    route=llm.invoke(QUERY_ROUTER_PROMPT).content.strip()
+
+
+def llm_route(query:str) -> str:
+    route=get_llm().invoke(_router_prompt(query)).content.strip()
     
     return route
-llm_with_tools = llm.bind_tools([math_tool])
 
 
-def math(state:InitailStateState):
+async def allm_route(query:str) -> str:
+    async with llm_slot():
+        msg = await get_llm().ainvoke(_router_prompt(query))
+    return msg.content.strip()
 
-    query = state["query"]
 
-    llm_with_tools = llm.bind_tools([math_tool])
-    ai_msg = llm_with_tools.invoke(query)
+def llm_route_batch(queries:List[str]) -> List[str]:
+    # A failed completion leaves its query to out_of_my_known, which still
+    # answers it from the knowledge base.
+    msgs = get_llm().batch(
+        [_router_prompt(query) for query in queries],
+        config={"max_concurrency": LLM_CONCURRENCY},
+        return_exceptions=True,
+    )
+    return ["out_of_my_known" if isinstance(msg, Exception) else msg.content.strip() for msg in msgs]
+
+
+# Rules and the local classifier decide first; only low-confidence
+# queries pay for the LLM router.
+router = QueryRouter(
+    llm_route,
+    classifier=CentroidClassifier.load(),
+    allm_route=allm_route,
+    llm_route_batch=llm_route_batch,
+)
+
 
+def inital_chat(state:InitailStateState):
+    route, source = router.route(state["query"])
+    return {"route": route, "route_source": source}
+
+
+async def ainital_chat(state:InitailStateState):
+    route, source = await router.aroute(state["query"])
+    return {"route": route, "route_source": source}
+
+
+def select_route(state:InitailStateState):
+    return state["route"]
+
+
+@tool
+def calculator_tool(expression: str) -> dict:
+    """
+    Evaluate an arithmetic expression with any number of operands.
+    Supports + - * / // % **, parentheses and functions such as sqrt, log, sin, round, min, max.
+    """
+    try:
+        return {"expression": expression, "result": format_number(evaluate(expression))}
+    except MathError as e:
+        return {"error": str(e)}
+
+
+MATH_TOOLS = {t.name: t for t in (math_tool, calculator_tool)}
+_math_llm = None
+_math_base_llm = None
+
+
+def get_math_llm():
+    """The LLM with the math tools bound, built once per chat model."""
+    global _math_llm, _math_base_llm
+    llm = get_llm()
+    if _math_llm is None or _math_base_llm is not llm:
+        _math_llm, _math_base_llm = llm.bind_tools(list(MATH_TOOLS.values())), llm
+    return _math_llm
+
+
+def _local_math(query: str):
+    # Plain expressions are evaluated locally; only word problems need the LLM.
+    expression = extract_expression(query)
+    if expression is None:
+        return None
+    try:
+        return {"responce": format_number(evaluate(expression))}
+    except MathError as e:
+        return {"responce": f"Error: {e}"}
+
+
+def _math_reply(ai_msg):
     # Tool calling case
     if ai_msg.tool_calls:
         tool_call = ai_msg.tool_calls[0]
 
-        tool_result = math_tool.invoke(tool_call["args"])
+        tool_result = MATH_TOOLS[tool_call["name"]].invoke(tool_call["args"])
 
         return {
-            "responce": str(tool_result["result"])
+            "responce": str(tool_result.get("result", tool_result.get("error")))
         }
 
     # Fallback
@@ -104,70 +183,134 @@ def math(state:InitailStateState):
         "responce": ai_msg.content
     }
 
+
+def math(state:InitailStateState):
+
+    query = state["query"]
+    local = _local_math(query)
+    if local is not None:
+        return local
+    return _math_reply(get_math_llm().invoke(query))
+
+
+async def amath(state:InitailStateState):
+    query = state["query"]
+    local = _local_math(query)
+    if local is not None:
+        return local
+    async with llm_slot():
+        ai_msg = await get_math_llm().ainvoke(query)
+    return _math_reply(ai_msg)
+
 def knowledge(state:InitailStateState):
     query=state["query"]
     # Make the LLM tool-aware
-    responce=rag_chain.invoke(query)
+    responce=answer_query(query)
     state["responce"]=responce
     return state
 
+async def aknowledge(state:InitailStateState):
+    return {"responce": await aanswer_query(state["query"])}
+
 def out_of_my_known(state:InitailStateState):
     
     #state["responce"]="out of know"
     query=state["query"]
     # Make the LLM tool-aware
-    responce=rag_chain.invoke(query)
+    responce=answer_query(query)
     state["responce"]=responce
     return state
 
+async def aout_of_my_known(state:InitailStateState):
+    return {"responce": await aanswer_query(state["query"])}
 
 
-def ground(state: InitailStateState):
-    booking = {"user_id":"123"}
 
-    st = update_booking_state(state["query"], booking)
-    kt = ground_book_graph.invoke(st)
+def _config_user_id(config: RunnableConfig) -> str:
+    # Identity comes from the per-request config (see sessions.make_config).
+    configurable = config.get("configurable", {})
+    return str(configurable.get("user_id") or configurable.get("thread_id"))
 
+
+def _booking_from(kt, user_id: str) -> dict:
     booking={
-        "user_id":"123",
+        "user_id":user_id,
         "date": kt.get("date"),
         "start_time": kt.get("start_time"),
         "end_time": kt.get("end_time")
     }
+    # Keep a requested repeat ("every tuesday for 6 months") across turns.
+    booking.update({k: kt[k] for k in ("repeat_every_days", "repeat_until") if kt.get(k)})
+    return booking
 
-    while True:
-        human_answer = interrupt({
-            "type": "ans",
-            "question": f"Please provide data for {booking}"
-        })
+
+def _ask_for_booking(kt, booking):
+    # On a conflict the booking graph offers the nearest free slots.
+    question = kt.get("message") or f"Please provide data for {booking}"
+    return interrupt({
+        "type": "ans",
+        "question": question
+    })
+
+
+def ground(state: InitailStateState, config: RunnableConfig):
+    user_id = _config_user_id(config)
+    booking = {"user_id":user_id}
+
+    st = update_booking_state(state["query"], booking)
+    kt = ground_book_graph.invoke(st)
+    booking = _booking_from(kt, user_id)
+
+    # Everything before the last interrupt runs again on every resume; a
+    # booking confirmed here is re-confirmed (see save_booking_to_csv), and
+    # nothing is asked when the first message already had all the details.
+    while not kt.get("status"):
+        human_answer = _ask_for_booking(kt, booking)
 
         st = update_booking_state(human_answer, booking)
         kt = ground_book_graph.invoke(st)
+        booking = _booking_from(kt, user_id)
 
-        booking={
-            "user_id":"123",
-            "date": kt.get("date"),
-            "start_time": kt.get("start_time"),
-            "end_time": kt.get("end_time")
-        }
+    state["responce"] = kt["status"]
+    state["booking"] = booking
+    return state
 
-        if kt.get("status"):
-            state["responce"] = kt["status"]
-            break
 
+async def aground(state: InitailStateState, config: RunnableConfig):
+    user_id = _config_user_id(config)
+    booking = {"user_id":user_id}
+
+    st = await aupdate_booking_state(state["query"], booking)
+    kt = await ground_book_graph.ainvoke(st)
+    booking = _booking_from(kt, user_id)
+
+    # Everything before the last interrupt runs again on every resume; a
+    # booking confirmed here is re-confirmed (see save_booking_to_csv), and
+    # nothing is asked when the first message already had all the details.
+    while not kt.get("status"):
+        human_answer = _ask_for_booking(kt, booking)
+
+        st = await aupdate_booking_state(human_answer, booking)
+        kt = await ground_book_graph.ainvoke(st)
+        booking = _booking_from(kt, user_id)
+
+    state["responce"] = kt["status"]
     state["booking"] = booking
     return state
 
 
 
 initail_graph=StateGraph(InitailStateState)
-# initail_graph.add_node("inital_chat",inital_chat)
-initail_graph.add_node("math",math)
-initail_graph.add_node("knowledge",knowledge)
-initail_graph.add_node("out_of_my_known",out_of_my_known)
-initail_graph.add_node("ground",ground)
-
-initail_graph.add_conditional_edges(START,inital_chat,{
+# Each node has a sync and an async body: app.invoke/stream run the sync
+# ones, app.ainvoke/astream the async ones (no thread per request).
+initail_graph.add_node("inital_chat",RunnableLambda(inital_chat, afunc=ainital_chat))
+initail_graph.add_node("math",RunnableLambda(math, afunc=amath))
+initail_graph.add_node("knowledge",RunnableLambda(knowledge, afunc=aknowledge))
+initail_graph.add_node("out_of_my_known",RunnableLambda(out_of_my_known, afunc=aout_of_my_known))
+initail_graph.add_node("ground",RunnableLambda(ground, afunc=aground))
+
+initail_graph.add_edge(START,"inital_chat")
+initail_graph.add_conditional_edges("inital_chat",select_route,{
         "math": "math",
         "knowledge": "knowledge",
         "out_of_my_known":"out_of_my_known",
@@ -179,6 +322,71 @@ initail_graph.add_edge("out_of_my_known",END)
 initail_graph.add_edge("ground",END)
 app=initail_graph.compile(checkpointer=checkpointer)
 
+
+def run_batch(queries:List[str]) -> List[dict]:
+    """
+    Answer many independent queries at once (evaluation, back-office jobs).
+
+    All queries are routed first, with one batched LLM call for those the
+    local router can't place. Then each route is handled as a group: math
+    expressions locally and word problems in one batched tool-calling
+    call, knowledge and out_of_my_known through answer_queries (one
+    retrieval pass, concurrent completions). A booking needs the
+    interactive interrupt flow, so ground queries come back unanswered.
+
+    Returns:
+        One dict per query, in order: query, route, route_source, responce
+        and status ("ok", "needs_session" or "error")
+    """
+    results = [
+        {"query": query, "route": route, "route_source": source, "responce": "", "status": "ok"}
+        for query, (route, source) in zip(queries, router.route_batch(queries))
+    ]
+    groups = defaultdict(list)
+    for i, result in enumerate(results):
+        groups[result["route"]].append(i)
+
+    def fail(indices, error):
+        for i in indices:
+            results[i].update(status="error", responce=f"Error: {error}")
+
+    word_problems = []
+    for i in groups["math"]:
+        local = _local_math(queries[i])
+        if local is None:
+            word_problems.append(i)
+        else:
+            results[i]["responce"] = local["responce"]
+    if word_problems:
+        replies = get_math_llm().batch(
+            [queries[i] for i in word_problems],
+            config={"max_concurrency": LLM_CONCURRENCY},
+            return_exceptions=True,
+        )
+        for i, reply in zip(word_problems, replies):
+            if isinstance(reply, Exception):
+                fail([i], reply)
+            else:
+                results[i]["responce"] = _math_reply(reply)["responce"]
+
+    knowledge_group = groups["knowledge"] + groups["out_of_my_known"]
+    if knowledge_group:
+        try:
+            answers = answer_queries([queries[i] for i in knowledge_group])
+        except Exception as e:
+            fail(knowledge_group, e)
+        else:
+            for i, answer in zip(knowledge_group, answers):
+                if isinstance(answer, Exception):
+                    fail([i], answer)
+                else:
+                    results[i]["responce"] = answer
+
+    for i in groups["ground"]:
+        results[i].update(status="needs_session", responce="Booking needs an interactive session")
+    return results
+
+
 def process_response(response):
     """Extract interrupt question, show it, and collect human input."""
     if "__interrupt__" not in response:
@@ -192,6 +400,9 @@ def process_response(response):
     return user_input
 
 if __name__ == "__main__":
+    import uuid
+
+    config = make_config(f"cli-{uuid.uuid4().hex}", user_id="123")
     while True:
         user_input = input("enter user input :- ")
         if user_input == "quit":
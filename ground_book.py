@@ -1,342 +1,576 @@
-# from typing import TypedDict, List
-# import csv
-# import os
-# from datetime import datetime
-
-
-# class BookingSchema(TypedDict):
-#     user_id: str
-#     start_time: str
-#     end_time: str
-#     date: str
-#     status:str
-
-# CSV_FILE = "bookings.csv"
-
-
-# def get_booking(user_id: str) -> List[BookingSchema]:
-#     """
-#     Get all bookings for a specific user_id.
-    
-#     Args:
-#         user_id: The user ID to filter bookings by
-        
-#     Returns:
-#         List of booking dictionaries matching the user_id
-#     """
-#     bookings = read_bookings_from_csv()
-#     return [booking for booking in bookings if booking["user_id"] == user_id]
-
-
-# def is_time_slot_available(booking: BookingSchema) -> bool:
-#     """
-#     Check if a time slot is available (not conflicting with existing bookings).
-    
-#     Args:
-#         booking: A booking dictionary with user_id, start_time, end_time, and date
-        
-#     Returns:
-#         True if the time slot is available, False if it conflicts with existing bookings
-#     """
-#     existing_bookings = read_bookings_from_csv()
-    
-#     # Parse the new booking times
-#     new_start = datetime.strptime(booking["start_time"], "%H:%M").time()
-#     new_end = datetime.strptime(booking["end_time"], "%H:%M").time()
-#     new_date = booking["date"]
-    
-#     for existing_booking in existing_bookings:
-#         # Check if it's the same date
-#         if existing_booking["date"] == new_date:
-#             # Parse existing booking times
-#             existing_start = datetime.strptime(existing_booking["start_time"], "%H:%M").time()
-#             existing_end = datetime.strptime(existing_booking["end_time"], "%H:%M").time()
-            
-#             # Check for time overlap
-#             # Two time slots overlap if:
-#             # - new_start < existing_end AND new_end > existing_start
-#             if new_start < existing_end and new_end > existing_start:
-#                 return False
-    
-#     return True
-
-
-# def save_booking_to_csv(booking: BookingSchema) -> str:
-#     """
-#     Save a booking to the CSV file.
-#     If the file doesn't exist, it will be created with headers.
-#     Checks for time slot conflicts before saving.
-    
-#     Args:
-#         booking: A booking dictionary with user_id, start_time, end_time, and date
-        
-#     Returns:
-#         Success message if booking is saved, or error message if time slot is occupied
-#     """
-#     # Check if time slot is available
-#     if not is_time_slot_available(booking):
-#         return "Unable to book on this time. Please update your start time or end time."
-    
-#     file_exists = os.path.isfile(CSV_FILE)
-    
-#     with open(CSV_FILE, 'a', newline='', encoding='utf-8') as csvfile:
-#         fieldnames = ['user_id', 'start_time', 'end_time', 'date']
-#         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-#         # Write header if file is new
-#         if not file_exists:
-#             writer.writeheader()
-        
-#         # Write the booking data
-#         writer.writerow(booking)
-    
-#     return booking
-
-
-# def read_bookings_from_csv() -> List[BookingSchema]:
-#     """
-#     Read all bookings from the CSV file.
-    
-#     Returns:
-#         List of all booking dictionaries from the CSV file
-#     """
-#     bookings = []
-    
-#     if not os.path.isfile(CSV_FILE):
-#         return bookings
-    
-#     with open(CSV_FILE, 'r', newline='', encoding='utf-8') as csvfile:
-#         reader = csv.DictReader(csvfile)
-#         for row in reader:
-#             booking: BookingSchema = {
-#                 "user_id": row["user_id"],
-#                 "start_time": row["start_time"],
-#                 "end_time": row["end_time"],
-#                 "date": row["date"]
-#             }
-#             bookings.append(booking)
-    
-#     return bookings
-
-
-# # user_bookings = get_booking("user123")
-# # booking: BookingSchema = {
-# #     "user_id": "user123",
-# #     "start_time": "09:00",    # 9:00 AM in 24-hour format
-# #     "end_time": "17:30",       # 5:30 PM in 24-hour format
-# #     "date": "2024-01-15"
-# # }
-
-# # result = save_booking_to_csv(booking)
-# # print(result)
-from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
-
-from typing import TypedDict, List
-import csv
-import os
-from datetime import datetime
-from dotenv import load_dotenv
-from sqlalchemy import true
-load_dotenv()  # loads .env from current directory
-OPENAI_API_KEY=os.getenv("OPENAI_API_KEY")
-
-
-class BookingSchema(TypedDict):
-    user_id: str
-    start_time: str
-    end_time: str
-    date: str
-    status:str
-
-CSV_FILE = "bookings.csv"
-
-
-def get_booking(user_id: str) -> List[BookingSchema]:
-    """
-    Get all bookings for a specific user_id.
-    
-    Args:
-        user_id: The user ID to filter bookings by
-        
-    Returns:
-        List of booking dictionaries matching the user_id
-    """
-    bookings = read_bookings_from_csv()
-    return [booking for booking in bookings if booking["user_id"] == user_id]
-
-
-def is_time_slot_available(booking: BookingSchema) -> bool:
-    """
-    Check if a time slot is available (not conflicting with existing bookings).
-    
-    Args:
-        booking: A booking dictionary with user_id, start_time, end_time, and date
-        
-    Returns:
-        True if the time slot is available, False if it conflicts with existing bookings
-    """
-    existing_bookings = read_bookings_from_csv()
-    
-    # Parse the new booking times
-    new_start = datetime.strptime(booking["start_time"], "%H:%M").time()
-    new_end = datetime.strptime(booking["end_time"], "%H:%M").time()
-    new_date = booking["date"]
-    
-    for existing_booking in existing_bookings:
-        # Check if it's the same date
-        if existing_booking["date"] == new_date:
-            # Parse existing booking times
-            existing_start = datetime.strptime(existing_booking["start_time"], "%H:%M").time()
-            existing_end = datetime.strptime(existing_booking["end_time"], "%H:%M").time()
-            
-            # Check for time overlap
-            # Two time slots overlap if:
-            # - new_start < existing_end AND new_end > existing_start
-            if new_start < existing_end and new_end > existing_start:
-                return False
-    
-    return True
-
-
-def save_booking_to_csv(booking: BookingSchema):
-    required_fields = ["user_id", "start_time", "end_time", "date"]
-
-    if not all(booking.get(f) for f in required_fields):
-        booking["status"] = ""
-        return booking
-
-    if not is_time_slot_available(booking):
-        booking["status"] = "Unable to book on this time. Please update your start time or end time."
-        return booking
-
-    file_exists = os.path.isfile(CSV_FILE)
-
-    with open(CSV_FILE, 'a', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['user_id', 'start_time', 'end_time', 'date']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-        # ✅ write header if file is new OR empty
-        if not file_exists or os.stat(CSV_FILE).st_size == 0:
-            writer.writeheader()
-
-        writer.writerow({
-            "user_id": booking["user_id"],
-            "start_time": booking["start_time"],
-            "end_time": booking["end_time"],
-            "date": booking["date"]
-        })
-
-    booking["status"] = "Booking confirmed"
-    return booking
-
-
-
-def read_bookings_from_csv() -> List[BookingSchema]:
-    """
-    Read all bookings from the CSV file.
-    
-    Returns:
-        List of all booking dictionaries from the CSV file
-    """
-    bookings = []
-    
-    if not os.path.isfile(CSV_FILE):
-        return bookings
-    
-    with open(CSV_FILE, 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-
-        for row in reader:
-            
-            booking: BookingSchema = {
-                "user_id": row["user_id"],
-                "start_time": row["start_time"],
-                "end_time": row["end_time"],
-                "date": row["date"]
-            }
-            bookings.append(booking)
-    
-    return bookings
-
-ground_booking_bilder=StateGraph(BookingSchema)
-ground_booking_bilder.add_node("save_booking_to_csv",save_booking_to_csv)
-ground_booking_bilder.add_edge(START,"save_booking_to_csv")
-ground_booking_bilder.add_edge("save_booking_to_csv",END)
-checkpointer = MemorySaver()
-ground_book_graph=ground_booking_bilder.compile()
-config = {"configurable": {"thread_id": '12345'}}
-
-
-# save_booking_to_csv(booking={'user_id': 123, 'start_time': '00:00', 'end_time': '14:00', 'date': '2026-03-02'})
-
-from typing import TypedDict
-import json
-import openai
-
-
-# -----------------------------
-# OpenAI API key setup
-# -----------------------------
-openai.api_key = OPENAI_API_KEY
-
-# -----------------------------
-# Prompt template
-# -----------------------------
-PROMPT_TEMPLATE = PROMPT_TEMPLATE = """
-                    You are a booking assistant.
-
-                    Extract booking information from the user query.
-
-                    Return ONLY a valid JSON object matching:
-                    BookingSchema(TypedDict, total=False)
-                    Allowed fields: user_id, start_time, end_time, date, status
-
-                    STRICT RULES:
-                    1. Output MUST be valid JSON only. No explanation.
-                    2. Time format MUST be 24-hour HH:MM.
-                    3. Convert AM/PM to 24-hour time.
-                    4. Date format MUST be YYYY-MM-DD.
-                    5. Include ONLY fields explicitly mentioned or clearly inferred.
-                    6. If a field exists in the previous state and is NOT updated by the user,
-                    KEEP the previous value.
-                    7. 🚫 If end_time is NOT mentioned, DO NOT include end_time.
-                    8. 🚫 Never copy start_time into end_time.
-                    9. Do NOT guess missing fields.
-                    10. Do NOT include empty, null, or invalid values.
-
-                    Previous state:
-                    {previous_state}
-
-                    User query:
-                    "{user_query}"
-"""
-
-
-
-# -----------------------------
-# Function to update single booking state
-# -----------------------------
-def update_booking_state(user_query: str, previous_state: BookingSchema) -> BookingSchema:
-    prev_state_str = json.dumps(previous_state)
-    prompt = PROMPT_TEMPLATE.format(user_query=user_query, previous_state=prev_state_str)
-
-    # New syntax for v1.0+ OpenAI Python SDK
-    response = openai.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a helpful booking assistant."},
-            {"role": "user", "content": prompt}
-        ],
-       
-    )
-
-    ai_text = response.choices[0].message.content.strip()
-
-    try:
-        updated_state = json.loads(ai_text)
-        
-        return updated_state
-    except json.JSONDecodeError:
-        return previous_state
-
+# from typing import TypedDict, List
+# import csv
+# import os
+# from datetime import datetime
+
+
+# class BookingSchema(TypedDict):
+#     user_id: str
+#     start_time: str
+#     end_time: str
+#     date: str
+#     status:str
+
+# CSV_FILE = "bookings.csv"
+
+
+# def get_booking(user_id: str) -> List[BookingSchema]:
+#     """
+#     Get all bookings for a specific user_id.
+    
+#     Args:
+#         user_id: The user ID to filter bookings by
+        
+#     Returns:
+#         List of booking dictionaries matching the user_id
+#     """
+#     bookings = read_bookings_from_csv()
+#     return [booking for booking in bookings if booking["user_id"] == user_id]
+
+
+# def is_time_slot_available(booking: BookingSchema) -> bool:
+#     """
+#     Check if a time slot is available (not conflicting with existing bookings).
+    
+#     Args:
+#         booking: A booking dictionary with user_id, start_time, end_time, and date
+        
+#     Returns:
+#         True if the time slot is available, False if it conflicts with existing bookings
+#     """
+#     existing_bookings = read_bookings_from_csv()
+    
+#     # Parse the new booking times
+#     new_start = datetime.strptime(booking["start_time"], "%H:%M").time()
+#     new_end = datetime.strptime(booking["end_time"], "%H:%M").time()
+#     new_date = booking["date"]
+    
+#     for existing_booking in existing_bookings:
+#         # Check if it's the same date
+#         if existing_booking["date"] == new_date:
+#             # Parse existing booking times
+#             existing_start = datetime.strptime(existing_booking["start_time"], "%H:%M").time()
+#             existing_end = datetime.strptime(existing_booking["end_time"], "%H:%M").time()
+            
+#             # Check for time overlap
+#             # Two time slots overlap if:
+#             # - new_start < existing_end AND new_end > existing_start
+#             if new_start < existing_end and new_end > existing_start:
+#                 return False
+    
+#     return True
+
+
+# def save_booking_to_csv(booking: BookingSchema) -> str:
+#     """
+#     Save a booking to the CSV file.
+#     If the file doesn't exist, it will be created with headers.
+#     Checks for time slot conflicts before saving.
+    
+#     Args:
+#         booking: A booking dictionary with user_id, start_time, end_time, and date
+        
+#     Returns:
+#         Success message if booking is saved, or error message if time slot is occupied
+#     """
+#     # Check if time slot is available
+#     if not is_time_slot_available(booking):
+#         return "Unable to book on this time. Please update your start time or end time."
+    
+#     file_exists = os.path.isfile(CSV_FILE)
+    
+#     with open(CSV_FILE, 'a', newline='', encoding='utf-8') as csvfile:
+#         fieldnames = ['user_id', 'start_time', 'end_time', 'date']
+#         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        
+#         # Write header if file is new
+#         if not file_exists:
+#             writer.writeheader()
+        
+#         # Write the booking data
+#         writer.writerow(booking)
+    
+#     return booking
+
+
+# def read_bookings_from_csv() -> List[BookingSchema]:
+#     """
+#     Read all bookings from the CSV file.
+    
+#     Returns:
+#         List of all booking dictionaries from the CSV file
+#     """
+#     bookings = []
+    
+#     if not os.path.isfile(CSV_FILE):
+#         return bookings
+    
+#     with open(CSV_FILE, 'r', newline='', encoding='utf-8') as csvfile:
+#         reader = csv.DictReader(csvfile)
+#         for row in reader:
+#             booking: BookingSchema = {
+#                 "user_id": row["user_id"],
+#                 "start_time": row["start_time"],
+#                 "end_time": row["end_time"],
+#                 "date": row["date"]
+#             }
+#             bookings.append(booking)
+    
+#     return bookings
+
+
+# # user_bookings = get_booking("user123")
+# # booking: BookingSchema = {
+# #     "user_id": "user123",
+# #     "start_time": "09:00",    # 9:00 AM in 24-hour format
+# #     "end_time": "17:30",       # 5:30 PM in 24-hour format
+# #     "date": "2024-01-15"
+# # }
+
+# # result = save_booking_to_csv(booking)
+# # print(result)
+from langgraph.graph import StateGraph, START, END
+from checkpoints import make_checkpointer
+
+from typing import TypedDict, List, Optional
+import csv
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import true
+from booking_parser import parse_booking_text
+from recurrence import rule_from_booking
+from booking_store import (
+    CsvBookingStore,
+    SqliteBookingStore,
+    from_minutes,
+    read_bookings,
+    to_minutes,
+    validate_booking,
+)
+load_dotenv()  # loads .env from current directory
+OPENAI_API_KEY=os.getenv("OPENAI_API_KEY")
+
+
+class BookingSchema(TypedDict):
+    user_id: str
+    start_time: str
+    end_time: str
+    date: str
+    status:str
+    message:str
+    suggestions:List[dict]
+    repeat_every_days:int
+    repeat_until:str
+
+CSV_FILE = "bookings.csv"
+OPENING_HOURS = ("06:00", "22:00")
+CONFLICT_STATUS = "Unable to book on this time. Please update your start time or end time."
+# "sqlite" (default) is safe with several workers sharing BOOKING_DB;
+# "csv" keeps the single-process CSV store.
+BOOKING_BACKEND = os.getenv("BOOKING_BACKEND", "sqlite")
+BOOKING_DB = os.getenv("BOOKING_DB", "bookings.sqlite")
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The booking store for this process, created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if BOOKING_BACKEND == "csv":
+                    _store = CsvBookingStore(CSV_FILE)
+                else:
+                    # Existing CSV bookings are imported the first time the database is created.
+                    _store = SqliteBookingStore(BOOKING_DB, import_csv=CSV_FILE)
+    return _store
+
+
+def get_booking(user_id: str) -> List[BookingSchema]:
+    """
+    Get all bookings for a specific user_id.
+    
+    Args:
+        user_id: The user ID to filter bookings by
+        
+    Returns:
+        List of booking dictionaries matching the user_id
+    """
+    return get_store().bookings_for_user(user_id)
+
+
+def get_recurring_bookings(user_id: str) -> List[dict]:
+    """Get the recurrence rules (user_id, start/end time and date, period_days) of a user."""
+    return get_store().rules_for_user(user_id)
+
+
+def is_time_slot_available(booking: BookingSchema) -> bool:
+    """
+    Check if a time slot is available (not conflicting with existing bookings).
+    
+    Args:
+        booking: A booking dictionary with user_id, start_time, end_time, and date
+        
+    Returns:
+        True if the time slot is available, False if it conflicts with existing bookings
+    """
+    return get_store().is_available(booking)
+
+
+def save_booking_to_csv(booking: BookingSchema):
+    required_fields = ["user_id", "start_time", "end_time", "date"]
+
+    if not all(booking.get(f) for f in required_fields):
+        booking["status"] = ""
+        return booking
+
+    # The extractor may produce e.g. 22:00-01:00; ask again instead of saving it.
+    error = validate_booking(booking)
+    if error:
+        booking["status"] = ""
+        booking["message"] = f"That booking can't be saved ({error}). Please correct the date or times."
+        return booking
+
+    if booking.get("repeat_every_days"):
+        return save_recurring_booking(booking)
+
+    # Conflict check and write happen together in the store. The graph
+    # node calling this is re-run from the top when a conversation resumes,
+    # so a booking the user already holds is confirmed, not a conflict.
+    store = get_store()
+    if not store.book(booking) and not store.holds(booking):
+        booking["status"] = CONFLICT_STATUS
+        return booking
+
+    booking["status"] = "Booking confirmed"
+    return booking
+
+
+def save_recurring_booking(booking: BookingSchema):
+    """Store a repeating booking as one rule instead of one row per date."""
+    if not booking.get("repeat_until"):
+        booking["status"] = ""
+        booking["message"] = "Until which date should this booking repeat?"
+        return booking
+    try:
+        rule = rule_from_booking(booking)
+    except ValueError:
+        booking["status"] = ""
+        booking["message"] = "The repeat end date must be on or after the first booking date."
+        return booking
+
+    # As for single bookings, a replayed save of the user's own rule succeeds.
+    if not get_store().add_rule(rule) and rule not in get_recurring_bookings(rule["user_id"]):
+        booking["status"] = ""
+        booking["message"] = "That time is already booked on at least one date of the series. Please choose another time."
+        return booking
+
+    booking["status"] = f"Recurring booking confirmed until {rule['end_date']}"
+    return booking
+
+
+
+def read_bookings_from_csv() -> List[BookingSchema]:
+    """
+    Read all bookings from the CSV file.
+    
+    Returns:
+        List of all booking dictionaries from the CSV file
+    """
+    return read_bookings(CSV_FILE)
+
+
+def read_booking_file(path: str) -> List[dict]:
+    """Read bookings from a .jsonl file (one object per line) or a CSV file."""
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return list(csv.DictReader(f))
+
+
+def import_bookings(path: str, atomic: bool = True) -> dict:
+    """
+    Bulk-import bookings from a CSV or JSONL file.
+
+    Rows are validated, then checked against the store and against each
+    other in one sweep (see booking_store.sweep_conflicts) instead of one
+    graph invocation per booking.
+
+    Args:
+        path: CSV or .jsonl file with user_id, date, start_time, end_time
+        atomic: Import nothing if any row fails; otherwise import the valid rows
+
+    Returns:
+        {"imported": count, "failed": [{"row", "booking", "error"}]}, where
+        row is the 1-based data row in the file
+    """
+    rows = read_booking_file(path)
+    failed, valid, positions = [], [], []
+    for number, row in enumerate(rows, start=1):
+        error = validate_booking(row)
+        if error:
+            failed.append({"row": number, "booking": row, "error": error})
+            continue
+        valid.append({
+            "user_id": str(row["user_id"]).strip(),
+            "date": str(row["date"]).strip(),
+            "start_time": from_minutes(to_minutes(str(row["start_time"]))),
+            "end_time": from_minutes(to_minutes(str(row["end_time"]))),
+        })
+        positions.append(number)
+
+    if atomic and failed:
+        return {"imported": 0, "failed": failed}
+
+    conflicts = get_store().book_many(valid, atomic=atomic)
+    failed.extend(
+        {"row": positions[i], "booking": valid[i], "error": error} for i, error in conflicts.items()
+    )
+    failed.sort(key=lambda failure: failure["row"])
+    imported = 0 if atomic and conflicts else len(valid) - len(conflicts)
+    return {"imported": imported, "failed": failed}
+
+def _dates(date_or_range):
+    if isinstance(date_or_range, str):
+        return [date_or_range]
+    first, last = (datetime.strptime(d, "%Y-%m-%d").date() for d in date_or_range)
+    return [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+
+
+def find_free_slots(date_or_range, duration_minutes: int, opening_hours=OPENING_HOURS) -> List[dict]:
+    """
+    Find the free gaps long enough for a booking.
+
+    Each date is one pass over its booked intervals (already sorted by
+    start in the store index), merging overlaps as it goes.
+
+    Args:
+        date_or_range: A YYYY-MM-DD date or an inclusive (start_date, end_date) tuple
+        duration_minutes: Minimum length of a free gap
+        opening_hours: (open, close) HH:MM times of the ground
+
+    Returns:
+        List of {"date", "start_time", "end_time"} free gaps in date/time order
+    """
+    store = get_store()
+    open_min, close_min = to_minutes(opening_hours[0]), to_minutes(opening_hours[1])
+    free = []
+    for date in _dates(date_or_range):
+        cursor = open_min
+        for start, end in store.intervals(date) + [(close_min, close_min)]:
+            gap_end = min(start, close_min)
+            if gap_end - cursor >= duration_minutes:
+                free.append({"date": date, "start_time": from_minutes(cursor), "end_time": from_minutes(gap_end)})
+            cursor = max(cursor, end)
+            if cursor >= close_min:
+                break
+    return free
+
+
+def nearest_free_slots(booking: BookingSchema, limit: int = 3, days_ahead: int = 7) -> List[dict]:
+    """
+    Suggest the free slots closest to a requested booking.
+
+    Slots keep the requested duration. The requested date is searched
+    first, then the following days until something is found.
+
+    Returns:
+        Up to limit {"date", "start_time", "end_time"} slots
+    """
+    start, end = to_minutes(booking["start_time"]), to_minutes(booking["end_time"])
+    duration = end - start
+    if duration <= 0:
+        return []
+    first = datetime.strptime(booking["date"], "%Y-%m-%d").date()
+    for offset in range(days_ahead + 1):
+        date = (first + timedelta(days=offset)).isoformat()
+        candidates = []
+        for gap in find_free_slots(date, duration):
+            gap_start, gap_end = to_minutes(gap["start_time"]), to_minutes(gap["end_time"])
+            slot_start = min(max(start, gap_start), gap_end - duration)
+            candidates.append((abs(slot_start - start), slot_start))
+        if candidates:
+            return [
+                {"date": date, "start_time": from_minutes(s), "end_time": from_minutes(s + duration)}
+                for _, s in sorted(candidates)[:limit]
+            ]
+    return []
+
+
+def suggest_free_slots(booking: BookingSchema):
+    """Offer the nearest free slots instead of ending on a conflict."""
+    suggestions = nearest_free_slots(booking)
+    options = ", ".join(f"{s['date']} {s['start_time']}-{s['end_time']}" for s in suggestions)
+    booking["suggestions"] = suggestions
+    booking["message"] = f"That time is already booked. Nearest free slots: {options}." if options else CONFLICT_STATUS
+    booking["status"] = ""
+    return booking
+
+
+def route_after_save(booking: BookingSchema):
+    return "suggest_free_slots" if booking.get("status") == CONFLICT_STATUS else END
+
+
+ground_booking_bilder=StateGraph(BookingSchema)
+ground_booking_bilder.add_node("save_booking_to_csv",save_booking_to_csv)
+ground_booking_bilder.add_node("suggest_free_slots",suggest_free_slots)
+ground_booking_bilder.add_edge(START,"save_booking_to_csv")
+ground_booking_bilder.add_conditional_edges("save_booking_to_csv",route_after_save,["suggest_free_slots",END])
+ground_booking_bilder.add_edge("suggest_free_slots",END)
+checkpointer = make_checkpointer()
+ground_book_graph=ground_booking_bilder.compile()
+
+
+# save_booking_to_csv(booking={'user_id': 123, 'start_time': '00:00', 'end_time': '14:00', 'date': '2026-03-02'})
+
+from typing import TypedDict
+import openai
+from http_pool import get_async_openai, get_openai
+from llm_cache import acached_chat_completion, cached_chat_completion
+
+
+# -----------------------------
+# OpenAI API key setup
+# -----------------------------
+openai.api_key = OPENAI_API_KEY
+
+# -----------------------------
+# Prompt template
+# -----------------------------
+PROMPT_TEMPLATE = PROMPT_TEMPLATE = """
+                    You are a booking assistant.
+
+                    Extract booking information from the user query.
+
+                    Return ONLY a valid JSON object matching:
+                    BookingSchema(TypedDict, total=False)
+                    Allowed fields: user_id, start_time, end_time, date, status
+
+                    STRICT RULES:
+                    1. Output MUST be valid JSON only. No explanation.
+                    2. Time format MUST be 24-hour HH:MM.
+                    3. Convert AM/PM to 24-hour time.
+                    4. Date format MUST be YYYY-MM-DD.
+                    5. Include ONLY fields explicitly mentioned or clearly inferred.
+                    6. If a field exists in the previous state and is NOT updated by the user,
+                    KEEP the previous value.
+                    7. 🚫 If end_time is NOT mentioned, DO NOT include end_time.
+                    8. 🚫 Never copy start_time into end_time.
+                    9. Do NOT guess missing fields.
+                    10. Do NOT include empty, null, or invalid values.
+
+                    Today's date: {today}
+
+                    Previous state:
+                    {previous_state}
+
+                    User query:
+                    "{user_query}"
+"""
+
+BOOKING_FIELD_FORMATS = {
+    "date": "%Y-%m-%d",
+    "start_time": "%H:%M",
+    "end_time": "%H:%M",
+}
+
+
+def _valid_fields(fields: dict) -> dict:
+    """Keep only booking fields in the expected YYYY-MM-DD / HH:MM formats."""
+    valid = {}
+    for field, fmt in BOOKING_FIELD_FORMATS.items():
+        value = fields.get(field)
+        if not isinstance(value, str):
+            continue
+        try:
+            datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        valid[field] = value
+    return valid
+
+
+
+def _extraction_messages(user_query: str, local_state: dict) -> List[dict]:
+    prompt = PROMPT_TEMPLATE.format(
+        user_query=user_query,
+        previous_state=json.dumps(local_state),
+        today=datetime.now().strftime("%Y-%m-%d (%A)"),
+    )
+    return [
+        {"role": "system", "content": "You are a helpful booking assistant. Reply in JSON."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _merge_extraction(ai_text: str, previous_state: BookingSchema, parsed: dict, local_state: dict) -> BookingSchema:
+    try:
+        llm_state = json.loads(ai_text.strip())
+    except json.JSONDecodeError:
+        return local_state
+
+    if not isinstance(llm_state, dict):
+        return local_state
+    # The LLM is only asked when part of the reply couldn't be parsed, so
+    # its valid date and times win; the parser's fields fill in what it
+    # left out (and the repeat fields, which it doesn't extract).
+    return {**previous_state, **parsed, **_valid_fields(llm_state)}
+
+
+# -----------------------------
+# Function to update single booking state
+# -----------------------------
+def update_booking_state(user_query: str, previous_state: BookingSchema) -> BookingSchema:
+    # Most replies ("2pm to 4pm tomorrow") are parsed locally; the LLM is
+    # only asked when the reply mentions a date/time the parser couldn't read.
+    parsed, unresolved = parse_booking_text(user_query)
+    local_state = {**previous_state, **parsed}
+    if not unresolved:
+        return local_state
+
+    # New syntax for v1.0+ OpenAI Python SDK, on the shared connection pool;
+    # identical extraction requests are answered from the LLM cache.
+    ai_text = cached_chat_completion(
+        get_openai(),
+        model="gpt-4o-mini",
+        messages=_extraction_messages(user_query, local_state),
+        response_format={"type": "json_object"},
+        temperature=0,
+    )
+    return _merge_extraction(ai_text, previous_state, parsed, local_state)
+
+
+async def aupdate_booking_state(user_query: str, previous_state: BookingSchema) -> BookingSchema:
+    """Async update_booking_state using the async OpenAI client."""
+    parsed, unresolved = parse_booking_text(user_query)
+    local_state = {**previous_state, **parsed}
+    if not unresolved:
+        return local_state
+
+    ai_text = await acached_chat_completion(
+        get_async_openai(),
+        model="gpt-4o-mini",
+        messages=_extraction_messages(user_query, local_state),
+        response_format={"type": "json_object"},
+        temperature=0,
+    )
+    return _merge_extraction(ai_text, previous_state, parsed, local_state)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk-import bookings from a CSV or JSONL file.")
+    parser.add_argument("file")
+    parser.add_argument("--partial", action="store_true", help="import the valid rows even if some fail")
+    args = parser.parse_args()
+
+    report = import_bookings(args.file, atomic=not args.partial)
+    for failure in report["failed"]:
+        print(f"row {failure['row']}: {failure['error']}")
+    print(f"Imported {report['imported']} bookings, {len(report['failed'])} failed")
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import threading
+import weakref
+from contextlib import asynccontextmanager
+
+import httpx
+import openai
+
+# One keep-alive connection pool per process for every OpenAI call
+# (LangChain chat/embeddings and the raw SDK), sync and async.
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "50"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+# Upper bound on LLM requests in flight from the async path.
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "64"))
+
+_lock = threading.Lock()
+_client = None
+_async_client = None
+_openai = None
+_async_openai = None
+# httpx async pools and asyncio semaphores belong to the event loop that
+# first uses them, so each running loop gets its own; they are dropped
+# with the loop.
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_loop_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=30,
+    )
+
+
+def get_http_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = httpx.Client(limits=_limits(), timeout=HTTP_TIMEOUT)
+    return _client
+
+
+def _loop_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _loop_clients.get(loop)
+    if client is None:
+        with _lock:
+            client = _loop_clients.get(loop)
+            if client is None:
+                client = _loop_clients[loop] = httpx.AsyncClient(limits=_limits(), timeout=HTTP_TIMEOUT)
+    return client
+
+
+class _LoopLocalAsyncClient(httpx.AsyncClient):
+    """AsyncClient that sends every request through the running loop's own pool."""
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        return await _loop_client().send(request, **kwargs)
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    The shared async pool.
+
+    One client object can be handed to every model at construction time;
+    its requests go through a separate pool per event loop, so running
+    the async graph from several loops (or one loop after another) never
+    reuses a connection of another loop.
+    """
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                _async_client = _LoopLocalAsyncClient(timeout=HTTP_TIMEOUT)
+    return _async_client
+
+
+def get_openai() -> openai.OpenAI:
+    global _openai
+    if _openai is None:
+        with _lock:
+            if _openai is None:
+                _openai = openai.OpenAI(http_client=get_http_client())
+    return _openai
+
+
+def get_async_openai() -> openai.AsyncOpenAI:
+    global _async_openai
+    if _async_openai is None:
+        with _lock:
+            if _async_openai is None:
+                _async_openai = openai.AsyncOpenAI(http_client=get_async_http_client())
+    return _async_openai
+
+
+def use_openai(client=None, async_client=None) -> None:
+    """Replace the raw OpenAI clients, e.g. with offline stand-ins."""
+    global _openai, _async_openai
+    with _lock:
+        if client is not None:
+            _openai = client
+        if async_client is not None:
+            _async_openai = async_client
+
+
+@asynccontextmanager
+async def llm_slot():
+    """Hold one of the running loop's LLM_CONCURRENCY slots for the duration of an LLM call."""
+    loop = asyncio.get_running_loop()
+    semaphore = _loop_semaphores.get(loop)
+    if semaphore is None:
+        # Only code on this loop gets here, so no lock is needed.
+        semaphore = _loop_semaphores[loop] = asyncio.Semaphore(LLM_CONCURRENCY)
+    async with semaphore:
+        yield
@@ -0,0 +1,297 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.vectorstores.utils import DistanceStrategy
+from pydantic import ConfigDict
+
+from embedding_cache import embed_queries
+from logger import get_logger
+
+log = get_logger("hybrid_retriever")
+
+# Keeps model numbers and spec tokens such as "m4", "usb-c" or "13.6" whole.
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+# Dense searches run here so the lexical search can run at the same time.
+# A search that times out keeps its worker until the embedding call
+# returns, so at most DENSE_WORKERS searches are ever submitted: with every
+# worker stuck on a slow API, new queries go straight to the lexical index
+# instead of queueing behind them.
+DENSE_WORKERS = 4
+_dense_executor = ThreadPoolExecutor(max_workers=DENSE_WORKERS, thread_name_prefix="dense-search")
+_dense_slots = threading.BoundedSemaphore(DENSE_WORKERS)
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    In-process inverted index scored with Okapi BM25.
+
+    Documents are added and removed by docstore id, so the index can follow
+    incremental changes to the vector store.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.doc_lengths: Dict[str, int] = {}
+        self.documents: Dict[str, Document] = {}
+        self.total_length = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "BM25Index":
+        """Index every chunk held in a FAISS vector store's docstore."""
+        index = cls()
+        index.sync(vectorstore)
+        return index
+
+    def add(self, doc_id: str, document: Document) -> None:
+        with self._lock:
+            if doc_id in self.documents:
+                self.remove(doc_id)
+            counts = Counter(tokenize(document.page_content))
+            for term, tf in counts.items():
+                self.postings[term][doc_id] = tf
+            length = sum(counts.values())
+            self.doc_lengths[doc_id] = length
+            self.total_length += length
+            self.documents[doc_id] = document
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            document = self.documents.pop(doc_id, None)
+            if document is None:
+                return
+            for term in set(tokenize(document.page_content)):
+                self.postings[term].pop(doc_id, None)
+                if not self.postings[term]:
+                    del self.postings[term]
+            self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def sync(self, vectorstore) -> None:
+        """Add and remove documents so the index matches the vector store."""
+        with self._lock:
+            current = set(vectorstore.index_to_docstore_id.values())
+            for doc_id in set(self.documents) - current:
+                self.remove(doc_id)
+            for doc_id in current - set(self.documents):
+                self.add(doc_id, vectorstore.docstore.search(doc_id))
+
+    def idf(self, term: str) -> float:
+        """BM25 inverse document frequency of a term (0 for unknown terms)."""
+        with self._lock:
+            postings = self.postings.get(term)
+            if not postings:
+                return 0.0
+            n_docs = len(self.documents)
+            return math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        """
+        Return the k best matching documents for a query.
+
+        Returns:
+            List of (document, BM25 score) pairs, best first
+        """
+        with self._lock:
+            n_docs = len(self.documents)
+            if not n_docs:
+                return []
+            avg_length = self.total_length / n_docs
+            scores: Dict[str, float] = defaultdict(float)
+            for term in dict.fromkeys(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            # Ties go to the lower doc id, so results (and the RAG prompts
+            # built from them) are the same in every process; the LLM cache
+            # relies on that.
+            best = heapq.nsmallest(k, scores.items(), key=lambda item: (-item[1], item[0]))
+            return [(self.documents[doc_id], score) for doc_id, score in best]
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length (zero rows stay zero)."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int = 60) -> List[Document]:
+    """Fuse several ranked lists; each list adds 1 / (k + rank) per document."""
+    scores: Dict[str, float] = defaultdict(float)
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = document.id or document.page_content
+            scores[key] += 1.0 / (k + rank)
+            documents.setdefault(key, document)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Drop-in replacement for vectorstore.as_retriever that fuses FAISS and
+    BM25 results with reciprocal-rank fusion.
+
+    The dense and lexical searches run concurrently. If the dense search
+    fails or exceeds dense_timeout (for example when the embedding API is
+    slow or down) the lexical results are returned on their own. With a
+    live index, every read of the vector store happens under the read
+    side of index_lock (ingest.ReadWriteLock) so the watcher never
+    changes it mid-search.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: Any
+    lexical: BM25Index
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+    dense_timeout: float = 5.0
+    # Returns the current index version; the BM25 index is re-synced when it changes.
+    version_fn: Optional[Callable[[], str]] = None
+    synced_version: Optional[str] = None
+    # Optional second stage (reranker.Reranker): the top candidate_k fused
+    # documents are re-scored and trimmed to its budget instead of taking k.
+    reranker: Optional[Any] = None
+    candidate_k: int = 20
+    index_lock: Optional[Any] = None
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, **kwargs) -> "HybridRetriever":
+        index_lock = kwargs.get("index_lock")
+        with index_lock.read() if index_lock is not None else nullcontext():
+            lexical = BM25Index.from_vectorstore(vectorstore)
+        retriever = cls(vectorstore=vectorstore, lexical=lexical, **kwargs)
+        if retriever.version_fn:
+            retriever.synced_version = retriever.version_fn()
+        return retriever
+
+    def _reading(self):
+        return self.index_lock.read() if self.index_lock is not None else nullcontext()
+
+    def _sync_lexical(self) -> None:
+        if self.version_fn is None:
+            return
+        with self._reading():
+            version = self.version_fn()
+            if version != self.synced_version:
+                self.lexical.sync(self.vectorstore)
+                self.synced_version = version
+
+    def _submit_dense(self, queries: List[str]) -> Optional[Future]:
+        # None when every dense worker is still busy with earlier searches.
+        if not _dense_slots.acquire(blocking=False):
+            return None
+        try:
+            future = _dense_executor.submit(self._dense_batch, queries)
+        except BaseException:
+            _dense_slots.release()
+            raise
+        future.add_done_callback(lambda _: _dense_slots.release())
+        return future
+
+    @staticmethod
+    def _dense_result(future: Optional[Future], timeout: float):
+        if future is None:
+            raise TimeoutError("all dense search workers are busy")
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            # Drop it if it never started; a running search frees its slot when done.
+            future.cancel()
+            raise
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        self._sync_lexical()
+        dense_future = self._submit_dense([query])
+        lexical = [document for document, _ in self.lexical.search(query, self.fetch_k)]
+
+        try:
+            vectors, dense = self._dense_result(dense_future, self.dense_timeout)
+        except Exception as e:
+            log.warning("Dense search unavailable, answering from the lexical index: %r", e)
+            return self._select(query, None, lexical)
+
+        return self._select(query, vectors[0], reciprocal_rank_fusion([dense[0], lexical], k=self.rrf_k))
+
+    def _select(self, query: str, vector: Optional[np.ndarray], ranked: List[Document]) -> List[Document]:
+        # Either the fused top k, or the top candidate_k re-ranked down to
+        # what fits the reranker's score threshold and token budget.
+        if self.reranker is None:
+            return ranked[:self.k]
+        with self._reading():
+            kept = self.reranker.rerank(query, vector, ranked[:self.candidate_k])
+        return [document for document, _ in kept]
+
+    def _dense_batch(self, queries: List[str]) -> Tuple[np.ndarray, List[List[Document]]]:
+        # One embedding call and one FAISS search for the whole batch; the
+        # query vectors are returned for the reranker.
+        vectorstore = self.vectorstore
+        embeddings = vectorstore.embeddings
+        if embeddings is not None:
+            vectors = embed_queries(embeddings, queries)
+        else:
+            vectors = [vectorstore.embedding_function(query) for query in queries]
+        matrix = np.asarray(vectors, dtype=np.float32)
+        # Scaling a query never changes its ranking against unit-length
+        # chunk vectors, so only inner-product (cosine) indexes need it.
+        if vectorstore.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+            matrix = normalize_rows(matrix)
+        with self._reading():
+            _, indices = vectorstore.index.search(matrix, self.fetch_k)
+            return matrix, [
+                [vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]) for i in row if i != -1]
+                for row in indices
+            ]
+
+    def batch_retrieve(self, queries: List[str]) -> List[List[Document]]:
+        """
+        Retrieve for many queries at once.
+
+        Same results as invoking the retriever per query (up to the order
+        of equally distant documents), with the dense side done as one
+        multi-query search; falls back to lexical results if that search
+        fails.
+
+        Returns:
+            The context documents of each query, in query order
+        """
+        self._sync_lexical()
+        dense_future = self._submit_dense(queries)
+        lexical = [[document for document, _ in self.lexical.search(query, self.fetch_k)] for query in queries]
+
+        try:
+            # dense_timeout is per query; allow it per 100 queries here.
+            vectors, dense = self._dense_result(dense_future, self.dense_timeout * max(1, len(queries) // 100))
+        except Exception as e:
+            log.warning("Batch dense search unavailable, answering from the lexical index: %r", e)
+            return [self._select(query, None, documents) for query, documents in zip(queries, lexical)]
+
+        return [
+            self._select(query, vector, reciprocal_rank_fusion([dense_docs, lexical_docs], k=self.rrf_k))
+            for query, vector, dense_docs, lexical_docs in zip(queries, vectors, dense, lexical)
+        ]
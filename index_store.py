@@ -0,0 +1,241 @@
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import faiss
+from langchain_community.document_loaders.pdf import PyPDFLoader
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from logger import get_logger
+
+log = get_logger("index_store")
+
+INDEX_ROOT = os.getenv("KNOWLEDGE_INDEX_DIR", "index_store")
+INDEX_NAME = "index"
+MANIFEST_FILE = "manifest.json"
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+
+
+def file_sha256(path: str) -> str:
+    """Return the sha256 hex digest of a file, read in 1MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def index_version(source_paths: List[str], settings: Dict) -> str:
+    """
+    Compute the version key of an index.
+
+    The key changes whenever a source file's content or any of the
+    splitter/embedding settings change, so an index directory can be
+    reused as long as its key matches.
+
+    Args:
+        source_paths: PDF files the index is built from
+        settings: chunk_size, chunk_overlap and embedding_model
+
+    Returns:
+        A short hex string used as the index directory name
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    for path in sorted(source_paths):
+        digest.update(os.path.basename(path).encode("utf-8"))
+        digest.update(file_sha256(path).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def iter_file_chunks(path: str, chunk_size: int, chunk_overlap: int) -> Iterator[Document]:
+    """
+    Stream the chunks of one PDF.
+
+    Pages are read lazily and split as they arrive, so only one page is
+    materialised at a time. Chunks never span pages, which matches
+    splitting the output of PyPDFLoader.load() page by page.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+    for page in PyPDFLoader(file_path=path).lazy_load():
+        yield from text_splitter.split_documents([page])
+
+
+def _split_file(path: str, chunk_size: int, chunk_overlap: int) -> List[Document]:
+    # Runs in a worker process; returns one file's chunks.
+    return list(iter_file_chunks(path, chunk_size, chunk_overlap))
+
+
+def iter_chunks(source_paths: List[str], settings: Dict, workers: int = INGEST_WORKERS) -> Iterator[Document]:
+    """
+    Stream the chunks of every source PDF, in source order.
+
+    With more than one worker and more than one file, files are split in
+    a process pool. At most two files per worker are in flight, so memory
+    stays bounded by the in-flight files, not by the corpus.
+
+    Args:
+        source_paths: PDF files to split
+        settings: chunk_size and chunk_overlap
+        workers: Number of worker processes
+
+    Yields:
+        Chunk documents
+    """
+    chunk_size, chunk_overlap = settings["chunk_size"], settings["chunk_overlap"]
+    if workers <= 1 or len(source_paths) <= 1:
+        for path in source_paths:
+            yield from iter_file_chunks(path, chunk_size, chunk_overlap)
+        return
+
+    paths = iter(source_paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for path in itertools.islice(paths, workers * 2):
+            in_flight.append(executor.submit(_split_file, path, chunk_size, chunk_overlap))
+        while in_flight:
+            chunks = in_flight.popleft().result()
+            for path in itertools.islice(paths, 1):
+                in_flight.append(executor.submit(_split_file, path, chunk_size, chunk_overlap))
+            yield from chunks
+
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[List]:
+    """Group an iterable into lists of at most batch_size items."""
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def index_chunks(
+    chunks: Iterable[Document],
+    embeddings: Embeddings,
+    vectorstore: Optional[FAISS] = None,
+    ids: Optional[Callable[[Document], str]] = None,
+    batch_size: int = EMBED_BATCH_SIZE,
+) -> Tuple[Optional[FAISS], int]:
+    """
+    Embed chunks batch by batch as they arrive and add them to a store.
+
+    Args:
+        chunks: Chunk documents, typically from iter_chunks
+        embeddings: Embeddings used to vectorise the chunks
+        vectorstore: Store to add to; created from the first batch if None
+        ids: Optional function returning the docstore id of a chunk
+        batch_size: Number of chunks per embedding request
+
+    Returns:
+        Tuple of (vector store, number of chunks added)
+    """
+    count = 0
+    for batch in iter_batches(chunks, batch_size):
+        batch_ids = [ids(doc) for doc in batch] if ids else None
+        if vectorstore is None:
+            vectorstore = FAISS.from_documents(batch, embeddings, ids=batch_ids)
+        else:
+            vectorstore.add_documents(batch, ids=batch_ids)
+        count += len(batch)
+    return vectorstore, count
+
+
+def build_index(source_paths: List[str], embeddings: Embeddings, settings: Dict, root: str = INDEX_ROOT) -> str:
+    """
+    Build the FAISS index for the given sources and write it to disk.
+
+    Nothing is embedded if a directory for the same version already
+    exists. The index is written to a temporary directory first and
+    renamed into place, so concurrent builders never expose a half
+    written index.
+
+    Args:
+        source_paths: PDF files to index
+        embeddings: Embeddings used to vectorise the chunks
+        settings: chunk_size, chunk_overlap and embedding_model
+        root: Directory holding one sub-directory per index version
+
+    Returns:
+        Path of the versioned index directory
+    """
+    version = index_version(source_paths, settings)
+    index_dir = os.path.join(root, version)
+    if os.path.isfile(os.path.join(index_dir, MANIFEST_FILE)):
+        return index_dir
+
+    started = time.time()
+    vectorstore, chunk_count = index_chunks(iter_chunks(source_paths, settings), embeddings)
+    if vectorstore is None:
+        raise ValueError(f"No text could be extracted from {source_paths}")
+
+    tmp_dir = os.path.join(root, f".tmp-{version}-{os.getpid()}")
+    vectorstore.save_local(tmp_dir, index_name=INDEX_NAME)
+    manifest = {
+        "version": version,
+        "settings": settings,
+        "sources": [os.path.abspath(p) for p in source_paths],
+        "chunks": chunk_count,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    try:
+        os.rename(tmp_dir, index_dir)
+    except OSError:
+        # Another process published the same version first.
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    log.info("Built index %s (%d chunks) in %.1fs", version, chunk_count, time.time() - started)
+    return index_dir
+
+
+def load_index(index_dir: str, embeddings: Embeddings, mmap: bool = True) -> FAISS:
+    """
+    Load an index written by build_index.
+
+    With mmap=True the FAISS vectors are memory-mapped read-only, so
+    replicas share the OS page cache instead of each holding a copy.
+    Pass mmap=False when the index will be modified in place.
+
+    Args:
+        index_dir: Versioned index directory
+        embeddings: Embeddings used to vectorise queries
+        mmap: Whether to memory-map the vectors
+
+    Returns:
+        A FAISS vector store
+    """
+    index_path = os.path.join(index_dir, f"{INDEX_NAME}.faiss")
+    if mmap:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(index_path, flags)
+    else:
+        index = faiss.read_index(index_path)
+
+    # The pickle is produced by build_index on this machine.
+    with open(os.path.join(index_dir, f"{INDEX_NAME}.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def load_or_build(source_paths: List[str], embeddings: Embeddings, settings: Dict, root: str = INDEX_ROOT) -> FAISS:
+    """Load the index for the current sources, building it first if missing."""
+    index_dir = build_index(source_paths, embeddings, settings, root=root)
+    return load_index(index_dir, embeddings)
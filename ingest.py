@@ -0,0 +1,299 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+import faiss
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from index_store import (
+    EMBED_BATCH_SIZE,
+    INDEX_NAME,
+    INDEX_ROOT,
+    MANIFEST_FILE,
+    file_sha256,
+    iter_batches,
+    iter_chunks,
+    load_index,
+)
+from logger import get_logger
+
+log = get_logger("ingest")
+
+
+class ReadWriteLock:
+    """
+    Many readers or one writer.
+
+    A waiting writer keeps new readers out so a steady query load can't
+    starve the watcher. Not re-entrant.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class IngestionPipeline:
+    """
+    Keep a live FAISS index in sync with a directory of PDFs.
+
+    Each sync compares the directory with the manifest of the last sync
+    (mtime and size first, sha256 only when those differ), splits just the
+    added or changed files and applies add/delete operations to the index
+    in place. The new chunks are embedded batch by batch into a staging
+    index before the live one is touched; merging it, deleting the stale
+    chunks and updating the manifest then happen together under
+    index_lock (a write lock the retriever reads under), so a failed sync
+    leaves index and manifest as they were and is retried in full. The
+    index and manifest are persisted after every change, so a restart
+    only processes what changed while the process was down.
+    """
+
+    def __init__(self, docs_dir: str, embeddings: Embeddings, settings: Dict, root: str = INDEX_ROOT):
+        self.docs_dir = docs_dir
+        self.embeddings = embeddings
+        self.settings = settings
+        settings_key = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        self.index_dir = os.path.join(root, f"live-{settings_key}")
+        self.manifest = {"version": "", "files": {}}
+        self.vectorstore: Optional[FAISS] = None
+        self._lock = threading.Lock()
+        self.index_lock = ReadWriteLock()
+        self._stop = threading.Event()
+
+    @property
+    def version(self) -> str:
+        """Version of the indexed content; changes after every applied sync."""
+        return self.manifest["version"]
+
+    def load(self) -> FAISS:
+        """Load the persisted live index, or create an empty one."""
+        if os.path.isfile(os.path.join(self.index_dir, MANIFEST_FILE)):
+            self.vectorstore = load_index(self.index_dir, self.embeddings, mmap=False)
+            with open(os.path.join(self.index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        else:
+            dimension = len(self.embeddings.embed_query("dimension probe"))
+            self.vectorstore = FAISS(self.embeddings, faiss.IndexFlatL2(dimension), InMemoryDocstore(), {})
+        return self.vectorstore
+
+    def _scan(self) -> Dict[str, os.stat_result]:
+        paths = glob.glob(os.path.join(self.docs_dir, "**", "*.pdf"), recursive=True)
+        return {os.path.relpath(p, self.docs_dir): os.stat(p) for p in paths}
+
+    def detect_changes(self):
+        """
+        Compare the docs directory with the manifest.
+
+        The manifest itself is left alone; sync() applies the result.
+
+        Returns:
+            Tuple of (added, changed, removed, touched); added and changed
+            map a relative path to its new sha256, removed is a list of
+            paths and touched maps the paths whose stat changed but whose
+            content did not to their new (mtime, size)
+        """
+        known = self.manifest["files"]
+        added, changed, touched = {}, {}, {}
+        current = self._scan()
+        for rel_path, stat in current.items():
+            record = known.get(rel_path)
+            if record and record["mtime"] == stat.st_mtime and record["size"] == stat.st_size:
+                continue
+            sha = file_sha256(os.path.join(self.docs_dir, rel_path))
+            if record is None:
+                added[rel_path] = sha
+            elif record["sha256"] != sha:
+                changed[rel_path] = sha
+            else:
+                touched[rel_path] = (stat.st_mtime, stat.st_size)
+        removed = [rel_path for rel_path in known if rel_path not in current]
+        return added, changed, removed, touched
+
+    def _stage(self, pending: Dict[str, str], files: Dict[str, Dict]) -> Tuple[Optional[FAISS], int]:
+        """
+        Split and embed the pending files into a separate staging index.
+
+        Chunks are embedded batch by batch as they are split, so only one
+        batch of raw vectors is held at a time; the live index is not
+        touched. The staging index uses the live index's metric so it can
+        be merged into it.
+        """
+
+        def chunk_id(doc):
+            rel_path = os.path.relpath(doc.metadata["source"], self.docs_dir)
+            record = files[rel_path]
+            record["ids"].append(f"{rel_path}#{record['sha256'][:16]}#{len(record['ids'])}")
+            return record["ids"][-1]
+
+        live = self.vectorstore.index
+        index_type = faiss.IndexFlatIP if live.metric_type == faiss.METRIC_INNER_PRODUCT else faiss.IndexFlatL2
+        staged = FAISS(
+            self.embeddings,
+            index_type(live.d),
+            InMemoryDocstore(),
+            {},
+            normalize_L2=self.vectorstore._normalize_L2,
+            distance_strategy=self.vectorstore.distance_strategy,
+        )
+        paths = [os.path.join(self.docs_dir, rel_path) for rel_path in pending]
+        count = 0
+        for batch in iter_batches(iter_chunks(paths, self.settings), EMBED_BATCH_SIZE):
+            vectors = self.embeddings.embed_documents([doc.page_content for doc in batch])
+            staged.add_embeddings(
+                [(doc.page_content, vector) for doc, vector in zip(batch, vectors)],
+                metadatas=[doc.metadata for doc in batch],
+                ids=[chunk_id(doc) for doc in batch],
+            )
+            count += len(batch)
+        return (staged if count else None), count
+
+    def sync(self) -> Dict[str, int]:
+        """
+        Apply directory changes to the live index.
+
+        Returns:
+            Counts of added, changed and removed files and of chunks added
+        """
+        with self._lock:
+            if self.vectorstore is None:
+                self.load()
+
+            added, changed, removed, touched = self.detect_changes()
+            summary = {"added": len(added), "changed": len(changed), "removed": len(removed), "chunks": 0}
+            if not (added or changed or removed or touched):
+                return summary
+
+            # Work on a copy: the manifest only changes once the index has.
+            files = {rel_path: dict(record) for rel_path, record in self.manifest["files"].items()}
+            for rel_path, (mtime, size) in touched.items():
+                files[rel_path]["mtime"], files[rel_path]["size"] = mtime, size
+            if not (added or changed or removed):
+                # Only stats changed: persist them so the files aren't
+                # hashed again on every poll.
+                with self.index_lock.write():
+                    self.manifest = {**self.manifest, "files": files}
+                self._save_manifest()
+                return summary
+
+            stale_ids = []
+            for rel_path in list(changed) + removed:
+                stale_ids.extend(files.pop(rel_path)["ids"])
+
+            pending = {**added, **changed}
+            for rel_path, sha in pending.items():
+                stat = os.stat(os.path.join(self.docs_dir, rel_path))
+                files[rel_path] = {"sha256": sha, "mtime": stat.st_mtime, "size": stat.st_size, "ids": []}
+
+            staged, summary["chunks"] = self._stage(pending, files)
+
+            digest = hashlib.sha256()
+            for rel_path in sorted(files):
+                digest.update(f"{rel_path}\0{files[rel_path]['sha256']}".encode("utf-8"))
+
+            with self.index_lock.write():
+                if staged is not None:
+                    self.vectorstore.merge_from(staged)
+                # Ids a crashed or older sync never indexed can't be deleted.
+                indexed = set(self.vectorstore.index_to_docstore_id.values())
+                stale_ids = [doc_id for doc_id in stale_ids if doc_id in indexed]
+                if stale_ids:
+                    self.vectorstore.delete(stale_ids)
+                self.manifest = {"version": digest.hexdigest()[:16], "files": files}
+            self._save()
+
+        log.info("Synced %s: %s", self.docs_dir, summary)
+        return summary
+
+    def _save_manifest(self) -> None:
+        if not os.path.isdir(self.index_dir):
+            self._save()
+            return
+        path = os.path.join(self.index_dir, MANIFEST_FILE)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def _save(self) -> None:
+        tmp_dir = f"{self.index_dir}.tmp-{os.getpid()}"
+        self.vectorstore.save_local(tmp_dir, index_name=INDEX_NAME)
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+
+        old_dir = f"{self.index_dir}.old-{os.getpid()}"
+        if os.path.isdir(self.index_dir):
+            os.rename(self.index_dir, old_dir)
+        os.rename(tmp_dir, self.index_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def watch(self, interval: float = 5.0) -> None:
+        """Poll the docs directory and sync until stop() is called."""
+        while not self._stop.wait(interval):
+            try:
+                self.sync()
+            except Exception:
+                log.exception("Ingestion sync failed")
+
+    def start_watching(self, interval: float = 5.0) -> threading.Thread:
+        """Run watch() in a daemon thread."""
+        thread = threading.Thread(target=self.watch, args=(interval,), name="ingest-watch", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from knolege_agent import INDEX_SETTINGS, get_embeddings
+
+    parser = argparse.ArgumentParser(description="Sync a directory of PDFs into the live knowledge index.")
+    parser.add_argument("docs_dir")
+    parser.add_argument("--watch", action="store_true", help="keep polling for changes")
+    parser.add_argument("--interval", type=float, default=5.0)
+    args = parser.parse_args()
+
+    pipeline = IngestionPipeline(args.docs_dir, get_embeddings(), INDEX_SETTINGS)
+    print(pipeline.sync())
+    if args.watch:
+        pipeline.watch(args.interval)
@@ -1,33 +1,41 @@
+import asyncio
 import os
+import threading
+from typing import List
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.document_loaders.pdf import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from dotenv import load_dotenv
+from embedding_cache import CachedEmbeddings
+from http_pool import LLM_CONCURRENCY, get_async_http_client, get_http_client, llm_slot
+from hybrid_retriever import HybridRetriever
+from index_store import build_index, load_index
+from ingest import IngestionPipeline
+from llm_cache import install as install_llm_cache
+from logger import get_logger
+from reranker import RERANK_CANDIDATES, RERANK_ENABLED, Reranker
+from semantic_cache import SemanticAnswerCache
 
 load_dotenv() 
+log = get_logger("knolege_agent")
+# With LLM_CACHE_MODE=on or replay, chat model calls (router, math, RAG) go
+# through the disk-backed LLM cache; it is off unless asked for. Nothing
+# is opened until the first call.
+install_llm_cache()
 file_path = "/Users/nainishdhanorkar/Downloads/task/macbook-air-13inch-m4-2025-info (1).pdf"
 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-
-loader = PyPDFLoader(file_path=file_path)
-documents = loader.load()
-
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=800,
-    chunk_overlap=120,
-)
-
-splits = text_splitter.split_documents(documents)
-len(splits), splits[0].page_content[:200]
-
-vectorstore = FAISS.from_documents(splits, embeddings)
-retriever = vectorstore.as_retriever(search_kwargs={"k": 4})
-
+EMBEDDING_MODEL = "text-embedding-3-large"
+INDEX_SETTINGS = {
+    "chunk_size": 800,
+    "chunk_overlap": 120,
+    "embedding_model": EMBEDDING_MODEL,
+}
+SOURCE_FILES = [file_path]
+# When set, the knowledge base is every PDF under this directory and is
+# kept up to date incrementally instead of being rebuilt.
+DOCS_DIR = os.getenv("KNOWLEDGE_DOCS_DIR")
 
 prompt = ChatPromptTemplate.from_template(
     "You are a concise assistant. Use the context to answer.\n"
@@ -36,10 +44,242 @@ prompt = ChatPromptTemplate.from_template(
     "Question: {question}"
 )
 
-rag_chain = (
-    {"context": retriever, "question": RunnablePassthrough()}
-    | prompt
-    | llm
-    | StrOutputParser()
-)
+# Everything below is built on first use, so importing this module (and
+# graph.py) never touches the network or the index. Each object has its
+# own lock, so the cheap factories (LLM, embeddings, answer cache) never
+# wait behind an index build; a factory only takes the locks of what it
+# is built from, always in the order of the declarations below.
+_rag_chain_lock = threading.Lock()
+_retriever_lock = threading.Lock()
+_answer_cache_lock = threading.Lock()
+_vectorstore_lock = threading.Lock()
+_embeddings_lock = threading.Lock()
+_llm_lock = threading.Lock()
+_warm_up_lock = threading.Lock()
+_llm = None
+_embeddings = None
+_vectorstore = None
+_retriever = None
+_rag_chain = None
+_answer_cache = None
+_index_version = None
+_warm_up_thread = None
+pipeline = None
+
+
+def get_llm() -> ChatOpenAI:
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = ChatOpenAI(
+                    model="gpt-4o-mini",
+                    temperature=0,
+                    http_client=get_http_client(),
+                    http_async_client=get_async_http_client(),
+                )
+    return _llm
+
+
+def get_embeddings() -> CachedEmbeddings:
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                # Chunks and repeated questions are only sent to the embedding API once.
+                openai_embeddings = OpenAIEmbeddings(
+                    model=EMBEDDING_MODEL,
+                    http_client=get_http_client(),
+                    http_async_client=get_async_http_client(),
+                )
+                _embeddings = CachedEmbeddings(openai_embeddings, model=EMBEDDING_MODEL)
+    return _embeddings
+
+
+def get_vectorstore() -> FAISS:
+    global _vectorstore, _index_version, pipeline
+    if _vectorstore is None:
+        with _vectorstore_lock:
+            if _vectorstore is None:
+                if DOCS_DIR:
+                    pipeline = IngestionPipeline(DOCS_DIR, get_embeddings(), INDEX_SETTINGS)
+                    pipeline.sync()
+                    if os.getenv("KNOWLEDGE_WATCH") == "1":
+                        pipeline.start_watching()
+                    _vectorstore = pipeline.vectorstore
+                else:
+                    # The index is built once per source/settings version and then loaded
+                    # from disk (run `python knolege_agent.py` to build it ahead of time).
+                    index_dir = build_index(SOURCE_FILES, get_embeddings(), INDEX_SETTINGS)
+                    _vectorstore = load_index(index_dir, get_embeddings())
+                    _index_version = os.path.basename(index_dir)
+    return _vectorstore
+
+
+def get_retriever():
+    global _retriever
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                vectorstore = get_vectorstore()
+                # Dense + BM25 search fused with reciprocal-rank fusion; exact
+                # spec tokens (chip names, port counts) match lexically.
+                retriever = HybridRetriever.from_vectorstore(
+                    vectorstore,
+                    k=4,
+                    version_fn=(lambda: pipeline.version) if pipeline else None,
+                    index_lock=pipeline.index_lock if pipeline else None,
+                )
+                # Two stages: a wider candidate set, re-ranked locally down
+                # to the chunks that clear the score threshold and fit the
+                # token budget.
+                if RERANK_ENABLED:
+                    retriever.reranker = Reranker(vectorstore, retriever.lexical)
+                    retriever.candidate_k = RERANK_CANDIDATES
+                _retriever = retriever
+    return _retriever
+
+
+def get_rag_chain():
+    global _rag_chain
+    if _rag_chain is None:
+        with _rag_chain_lock:
+            if _rag_chain is None:
+                _rag_chain = (
+                    {"context": get_retriever(), "question": RunnablePassthrough()}
+                    | prompt
+                    | get_llm()
+                    | StrOutputParser()
+                )
+    return _rag_chain
+
+
+def use_models(llm=None, embeddings=None, vectorstore=None, version: str = "injected"):
+    """
+    Swap in a chat model, embeddings and/or vector store (benchmarks, tests).
+
+    Everything built from the replaced objects (retriever, RAG chain,
+    answer cache) is rebuilt on next use.
+    """
+    global _llm, _embeddings, _vectorstore, _index_version, _retriever, _rag_chain, _answer_cache
+    with _rag_chain_lock, _retriever_lock, _answer_cache_lock, _vectorstore_lock, _embeddings_lock, _llm_lock:
+        if llm is not None:
+            _llm = llm
+        if embeddings is not None:
+            _embeddings = embeddings
+        if vectorstore is not None:
+            _vectorstore = vectorstore
+            _index_version = version
+        _retriever = _rag_chain = _answer_cache = None
+
+
+def index_version() -> str:
+    """Version of the indexed content; changes whenever the index does."""
+    get_vectorstore()
+    return pipeline.version if pipeline else _index_version
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = SemanticAnswerCache(
+                    get_embeddings(),
+                    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+                    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+                )
+    return _answer_cache
+
+
+def answer_cache_stats():
+    """Stats of the answer cache, or None before the first knowledge query."""
+    return _answer_cache.stats() if _answer_cache is not None else None
+
+
+def answer_query(query: str) -> str:
+    """Answer a knowledge question through the semantic answer cache."""
+    return get_answer_cache().get_or_compute(query, get_rag_chain().invoke, version=index_version())
+
+
+def _rag_answers(queries: List[str]) -> list:
+    # The batch twin of rag_chain.invoke: one retrieval pass for all the
+    # queries and concurrent completions; a failed completion comes back as
+    # its exception so the rest of the batch still gets answered.
+    contexts = get_retriever().batch_retrieve(queries)
+    chain = prompt | get_llm() | StrOutputParser()
+    return chain.batch(
+        [{"context": context, "question": query} for context, query in zip(contexts, queries)],
+        config={"max_concurrency": LLM_CONCURRENCY},
+        return_exceptions=True,
+    )
+
+
+def answer_queries(queries: List[str]) -> list:
+    """
+    Batch answer_query.
+
+    Returns:
+        Answers in query order; an answer that failed is its exception
+    """
+    return get_answer_cache().get_or_compute_many(queries, _rag_answers, version=index_version())
+
+
+async def _arag_answer(query: str) -> str:
+    rag_chain = await asyncio.to_thread(get_rag_chain)
+    async with llm_slot():
+        return await rag_chain.ainvoke(query)
+
+
+async def aanswer_query(query: str) -> str:
+    """Async answer_query; the RAG stack itself is built off the event loop."""
+    version = await asyncio.to_thread(index_version)
+    return await get_answer_cache().aget_or_compute(query, _arag_answer, version=version)
+
+
+def warm_up(background: bool = True):
+    """
+    Build the RAG stack ahead of the first knowledge query.
+
+    Args:
+        background: Build in a daemon thread instead of blocking
+
+    Returns:
+        The warm-up thread when running in the background, else None
+    """
+    global _warm_up_thread
+    if not background:
+        get_rag_chain()
+        return None
+    with _warm_up_lock:
+        if _rag_chain is None and (_warm_up_thread is None or not _warm_up_thread.is_alive()):
+            _warm_up_thread = threading.Thread(target=_warm_up, name="rag-warm-up", daemon=True)
+            _warm_up_thread.start()
+    return _warm_up_thread
+
+
+def _warm_up():
+    try:
+        get_rag_chain()
+    except Exception:
+        log.exception("RAG warm-up failed")
+
+
+_LAZY_ATTRIBUTES = {
+    "llm": get_llm,
+    "embeddings": get_embeddings,
+    "vectorstore": get_vectorstore,
+    "retriever": get_retriever,
+    "rag_chain": get_rag_chain,
+}
+
+
+def __getattr__(name):
+    # Keeps `knolege_agent.rag_chain` style access working, built on demand.
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
+if __name__ == "__main__":
+    print(build_index(SOURCE_FILES, get_embeddings(), INDEX_SETTINGS))
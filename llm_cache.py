@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.caches import BaseCache
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from http_pool import llm_slot
+from logger import get_logger
+
+log = get_logger("llm_cache")
+
+# "on" records and reuses responses, "replay" only reuses them (a request
+# that was never recorded raises CacheMiss), "off" (the default) disables
+# the cache.
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+
+
+class CacheMiss(LookupError):
+    """A request with no recorded response while replaying."""
+
+
+def _normalise(value: Any) -> Any:
+    # Whitespace doesn't change what the model is asked.
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, list):
+        return [_normalise(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _normalise(item) for key, item in value.items()}
+    return value
+
+
+def _without_message_ids(messages: Any) -> Any:
+    # LangChain serialises each message as {"id": [class path], "kwargs":
+    # {..., "id": message id}}. The message id is new on every run; the
+    # class path and everything else (tool call ids, tool arguments) is
+    # part of the request.
+    if not isinstance(messages, list):
+        return messages
+    return [
+        {**message, "kwargs": {key: item for key, item in message["kwargs"].items() if key != "id"}}
+        if isinstance(message, dict) and isinstance(message.get("kwargs"), dict)
+        else message
+        for message in messages
+    ]
+
+
+def request_key(**request: Any) -> str:
+    """sha256 of the normalised request (model, messages, tools, temperature, ...)."""
+    canonical = json.dumps(_normalise(request), sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseStore:
+    """
+    SQLite table of responses keyed by request_key.
+
+    Like the embedding cache, the least recently used entries are evicted
+    once there are more than max_entries.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, last_used) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN"
+                    " (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                log.debug("Evicted %d cached LLM responses", count - self.max_entries)
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the number of cached responses."""
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+_lock = threading.Lock()
+_store = None
+
+
+def get_store() -> ResponseStore:
+    """The process-wide store, opened on first use."""
+    global _store
+    if _store is None:
+        with _lock:
+            if _store is None:
+                _store = ResponseStore()
+    return _store
+
+
+class DiskLLMCache(BaseCache):
+    """
+    LangChain cache over the response store, for every chat model call.
+
+    LangChain passes the serialised messages as prompt and the model's
+    parameters (name, temperature, bound tools, ...) as llm_string; both
+    go into the key. Installed globally by install().
+    """
+
+    def __init__(self, store: Optional[ResponseStore] = None, replay_only: bool = LLM_CACHE_MODE == "replay"):
+        self._store = store
+        self.replay_only = replay_only
+
+    @property
+    def store(self) -> ResponseStore:
+        return self._store or get_store()
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        try:
+            messages = json.loads(prompt)
+        except ValueError:
+            messages = prompt
+        return request_key(messages=_without_message_ids(messages), llm=llm_string)
+
+    def lookup(self, prompt: str, llm_string: str):
+        value = self.store.get(self._key(prompt, llm_string))
+        if value is None:
+            if self.replay_only:
+                raise CacheMiss(f"No recorded response for prompt {prompt[:200]!r}")
+            return None
+        generations = []
+        for item in json.loads(value):
+            if "message" in item:
+                generations.append(ChatGeneration(message=messages_from_dict([item["message"]])[0]))
+            else:
+                generations.append(Generation(text=item["text"]))
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        if self.replay_only:
+            return
+        items = [
+            {"message": message_to_dict(generation.message)} if isinstance(generation, ChatGeneration)
+            else {"text": generation.text}
+            for generation in return_val
+        ]
+        self.store.put(self._key(prompt, llm_string), json.dumps(items))
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+
+def install() -> None:
+    """Make DiskLLMCache the global LangChain cache unless LLM_CACHE_MODE is off."""
+    if LLM_CACHE_MODE != "off" and get_llm_cache() is None:
+        set_llm_cache(DiskLLMCache())
+
+
+def _completion_key(request: Dict[str, Any]) -> str:
+    return request_key(api="chat.completions", **request)
+
+
+def cached_chat_completion(client, **request: Any) -> str:
+    """
+    client.chat.completions.create(**request) through the cache.
+
+    Returns:
+        The content of the first choice
+    """
+    if LLM_CACHE_MODE == "off":
+        return client.chat.completions.create(**request).choices[0].message.content
+    key = _completion_key(request)
+    content = get_store().get(key)
+    if content is not None:
+        return content
+    if LLM_CACHE_MODE == "replay":
+        raise CacheMiss(f"No recorded completion for {request.get('model')}")
+    content = client.chat.completions.create(**request).choices[0].message.content
+    if content is not None:
+        get_store().put(key, content)
+    return content
+
+
+async def acached_chat_completion(client, **request: Any) -> str:
+    """Async cached_chat_completion; only a cache miss takes an llm_slot."""
+    if LLM_CACHE_MODE != "off":
+        key = _completion_key(request)
+        content = get_store().get(key)
+        if content is not None:
+            return content
+        if LLM_CACHE_MODE == "replay":
+            raise CacheMiss(f"No recorded completion for {request.get('model')}")
+    async with llm_slot():
+        response = await client.chat.completions.create(**request)
+    content = response.choices[0].message.content
+    if LLM_CACHE_MODE != "off" and content is not None:
+        get_store().put(key, content)
+    return content
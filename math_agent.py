@@ -1,8 +1,24 @@
-from typing import TypedDict
+import ast
+import itertools
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypedDict
 
+import numpy as np
 from langgraph.graph import StateGraph, START, END
 from langgraph.checkpoint.memory import MemorySaver
 
+from math_engine import (
+    CONSTANTS,
+    MAX_EXPRESSION_LENGTH,
+    MathError,
+    evaluate,
+    format_number,
+    normalize_expression,
+    parse_expression,
+)
+
 
 class MathState(TypedDict):
     """State for the math agent."""
@@ -13,24 +29,20 @@ class MathState(TypedDict):
 
 def safe_eval_math(expr: str) -> str:
     """
-    Safely evaluate a basic math expression.
+    Safely evaluate a math expression.
 
-    Supports: +, -, *, /, **, parentheses, integers and decimals.
-    No variables or function calls are allowed.
+    Supports: + - * / // % ** (or ^), unary minus, parentheses, integers,
+    decimals and the functions/constants of math_engine. Expressions are
+    parsed with ast and never passed to eval.
     """
-    allowed_chars = "0123456789+-*/(). "
-    if any(c not in allowed_chars for c in expr):
-        return "Error: Only numbers and + - * / ** and parentheses are allowed."
-
     try:
-        # Use a restricted eval environment
-        value = eval(expr, {"__builtins__": None}, {})
-    except ZeroDivisionError:
-        return "Error: Division by zero."
-    except Exception as e:
+        value = evaluate(expr)
+    except MathError as e:
+        if str(e) == "Division by zero":
+            return "Error: Division by zero."
         return f"Error: Could not evaluate expression ({e})."
 
-    return str(value)
+    return format_number(value)
 
 
 def math_node(state: MathState) -> MathState:
@@ -55,7 +67,233 @@ def build_math_app():
     return app
 
 
+# --- Batch evaluation -------------------------------------------------------
+
+# Groups smaller than this are evaluated one by one; NumPy only pays off
+# once there are enough rows to amortise building the arrays.
+MIN_VECTOR_GROUP = 8
+# Integers beyond this cannot be represented exactly in float64.
+MAX_EXACT_FLOAT = 2 ** 53
+
+NUMPY_BINARY = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+    ast.FloorDiv: np.floor_divide,
+    ast.Mod: np.mod,
+    ast.Pow: np.power,
+}
+
+NUMPY_UNARY = {
+    ast.UAdd: np.positive,
+    ast.USub: np.negative,
+}
+
+# Only fixed-arity forms are vectorised; any other call of these (log(x, base),
+# round(x, digits), min/max of one or three values, ...) and every other
+# function is left to the scalar engine, which also produces its errors.
+NUMPY_FUNCTIONS = {
+    "abs": (np.abs, 1),
+    "round": (np.round, 1),
+    "min": (np.minimum, 2),
+    "max": (np.maximum, 2),
+    "sqrt": (np.sqrt, 1),
+    "exp": (np.exp, 1),
+    "log": (np.log, 1),
+    "log10": (np.log10, 1),
+    "log2": (np.log2, 1),
+    "sin": (np.sin, 1),
+    "cos": (np.cos, 1),
+    "tan": (np.tan, 1),
+    "floor": (np.floor, 1),
+    "ceil": (np.ceil, 1),
+}
+
+
+# A numeric literal that is not part of a name such as log10.
+_NUMBER = re.compile(r"(?<![\w.])(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?(?![\w.])")
+
+
+def _split_numbers(expression: str) -> Optional[Tuple[str, List]]:
+    """
+    Separate an expression into a template and its numbers.
+
+    "3 + 4.5" gives ("_c0 + _c1", [3, 4.5]). Returns None for literals
+    Python itself would reject (e.g. leading zeros), which are left to
+    the scalar engine.
+    """
+    constants = []
+
+    def placeholder(match):
+        token = match.group(0)
+        if any(c in token for c in ".eE"):
+            constants.append(float(token))
+        elif len(token) > 1 and token[0] == "0":
+            raise ValueError(token)
+        else:
+            constants.append(int(token))
+        return f"_c{len(constants) - 1}"
+
+    try:
+        return _NUMBER.sub(placeholder, normalize_expression(expression)), constants
+    except ValueError:
+        return None
+
+
+def _bounded(values, exact: np.ndarray):
+    # Clears the rows whose intermediate value float64 may not hold exactly
+    # (e.g. 123456789 * 987654321); those rows go to the scalar engine.
+    exact &= np.abs(values) < MAX_EXACT_FLOAT
+    return values
+
+
+def _vectorize(node: ast.AST) -> Optional[Callable]:
+    """
+    Compile a parsed template into a function of the operand columns.
+
+    Placeholder _cN reads column N. The function also takes a boolean row
+    mask and clears the rows with an intermediate result outside
+    ±MAX_EXACT_FLOAT. Returns None if the template uses something NumPy
+    can't evaluate exactly like the scalar engine (e.g. factorial).
+    """
+    if isinstance(node, ast.Expression):
+        return _vectorize(node.body)
+    if isinstance(node, ast.Name):
+        if node.id.startswith("_c"):
+            index = int(node.id[2:])
+            return lambda columns, exact: columns[index]
+        value = CONSTANTS.get(node.id)
+        return None if value is None else (lambda columns, exact: value)
+    if isinstance(node, ast.UnaryOp):
+        operand = _vectorize(node.operand)
+        op = NUMPY_UNARY[type(node.op)]
+        return operand and (lambda columns, exact: op(operand(columns, exact)))
+    if isinstance(node, ast.BinOp):
+        left = _vectorize(node.left)
+        right = _vectorize(node.right)
+        op = NUMPY_BINARY[type(node.op)]
+        return left and right and (
+            lambda columns, exact: _bounded(op(left(columns, exact), right(columns, exact)), exact)
+        )
+    if isinstance(node, ast.Call):
+        spec = NUMPY_FUNCTIONS.get(node.func.id)
+        args = [_vectorize(arg) for arg in node.args]
+        if spec is None or len(args) != spec[1] or not all(args):
+            return None
+        func = spec[0]
+        return lambda columns, exact: _bounded(func(*(arg(columns, exact) for arg in args)), exact)
+    return None
+
+
+@lru_cache(maxsize=4096)
+def _compile_template(template: str, example: str) -> Optional[Callable]:
+    """
+    Compile a template once; later expressions of the same shape reuse it.
+
+    The example expression is validated with the scalar engine's parser.
+    Numbers never change whether an expression is allowed, so one valid
+    example validates the whole template.
+    """
+    try:
+        parse_expression(example)
+    except MathError:
+        return None
+    return _vectorize(ast.parse(template, mode="eval"))
+
+
+def _scalar_result(expression: str) -> Dict:
+    try:
+        return {"expression": expression, "result": format_number(evaluate(expression)), "error": None}
+    except MathError as e:
+        return {"expression": expression, "result": None, "error": str(e)}
+
+
+def evaluate_batch(expressions: List[str]) -> List[Dict]:
+    """
+    Evaluate many expressions at once.
+
+    Expressions are grouped by shape ("3 + 4" and "10 + 2.5" share the
+    template "_c0 + _c1"). Each template is validated and compiled to a
+    NumPy function once, and each large enough group is evaluated in one
+    pass over arrays of its operands. Rows with an operand, intermediate
+    or result that is not finite or not exactly representable are
+    re-evaluated with the scalar engine (as is a whole group whose NumPy
+    pass fails), so errors match safe_eval_math and results match it up
+    to the last bit of transcendental functions.
+
+    Args:
+        expressions: Expressions to evaluate
+
+    Returns:
+        One dict per expression, in input order, with expression, result
+        (a string, or None on error) and error (None on success)
+    """
+    results: List[Optional[Dict]] = [None] * len(expressions)
+    groups: Dict[str, List] = defaultdict(list)
+
+    for i, expression in enumerate(expressions):
+        split = _split_numbers(expression) if len(expression) <= MAX_EXPRESSION_LENGTH else None
+        if split is None:
+            results[i] = _scalar_result(expression)
+        else:
+            groups[split[0]].append((i, split[1]))
+
+    for template, rows in groups.items():
+        function = None
+        if len(rows) >= MIN_VECTOR_GROUP:
+            function = _compile_template(template, expressions[rows[0][0]])
+
+        # Operands float64 can't hold exactly are left to the scalar engine.
+        vector_rows = [row for row in rows if all(abs(c) < MAX_EXACT_FLOAT for c in row[1])] if function else []
+        if vector_rows:
+            matrix = np.array([constants for _, constants in vector_rows], dtype=np.float64)
+            exact = np.ones(len(vector_rows), dtype=bool)
+            try:
+                with np.errstate(all="ignore"):
+                    values = np.broadcast_to(function(matrix.T, exact), (len(vector_rows),))
+            except Exception:
+                # The scalar loop below evaluates the group (and reports its errors).
+                exact[:] = False
+                values = np.zeros(len(vector_rows))
+            exact &= np.isfinite(values) & (np.abs(values) < MAX_EXACT_FLOAT)
+            for (i, _), value, ok in zip(vector_rows, values.tolist(), exact.tolist()):
+                if ok:
+                    results[i] = {"expression": expressions[i], "result": format_number(value), "error": None}
+
+        for i, _ in rows:
+            if results[i] is None:
+                results[i] = _scalar_result(expressions[i])
+
+    return results
+
+
+def evaluate_stream(expressions: Iterable[str], chunk_size: int = 10000) -> Iterator[Dict]:
+    """Evaluate an iterable of expressions chunk by chunk, preserving order."""
+    expressions = iter(expressions)
+    while True:
+        chunk = list(itertools.islice(expressions, chunk_size))
+        if not chunk:
+            return
+        yield from evaluate_batch(chunk)
+
+
+def evaluate_file(path: str, chunk_size: int = 10000) -> Iterator[Dict]:
+    """Evaluate one expression per non-empty line of a text file."""
+    with open(path, "r", encoding="utf-8") as f:
+        yield from evaluate_stream((line.strip() for line in f if line.strip()), chunk_size)
+
+
 if __name__ == "__main__":
+    import json
+    import sys
+
+    # python math_agent.py --batch expressions.txt  -> one JSON result per line
+    if len(sys.argv) == 3 and sys.argv[1] == "--batch":
+        for item in evaluate_file(sys.argv[2]):
+            print(json.dumps(item))
+        sys.exit(0)
+
     app = build_math_app()
     config = {"configurable": {"thread_id": "math-thread-1"}}
 
@@ -0,0 +1,209 @@
+import ast
+import math
+import operator
+import re
+from typing import Optional, Union
+
+Number = Union[int, float]
+
+MAX_EXPRESSION_LENGTH = 1000
+MAX_NODES = 200
+# Results larger than this many bits (or decimal digits for powers) are refused,
+# so inputs like 9**9**9 fail fast instead of hanging the process.
+MAX_INT_BITS = 4096
+MAX_POWER_DIGITS = 1000
+# Largest n whose factorial fits in MAX_INT_BITS (n! has about lgamma(n + 1) / ln 2 bits).
+MAX_FACTORIAL = next(n for n in range(1, MAX_INT_BITS) if math.lgamma(n + 2) / math.log(2) > MAX_INT_BITS)
+
+
+class MathError(ValueError):
+    """Raised when an expression cannot be parsed or safely evaluated."""
+
+
+def _pow(base: Number, exponent: Number) -> Number:
+    # A negative exponent only makes the result smaller; one that is too
+    # negative for a float base underflows to 0 or overflows to an error.
+    if exponent > 0 and abs(base) > 1 and exponent * math.log10(abs(base)) > MAX_POWER_DIGITS:
+        raise MathError("Result is too large")
+    if base < 0 and exponent != int(exponent):
+        # Python would return a complex number, e.g. (-8) ** (1/3).
+        raise MathError("Result is not a real number")
+    return operator.pow(base, exponent)
+
+
+def _factorial(value: Number) -> int:
+    if value != int(value) or value < 0:
+        raise MathError("factorial() needs a non-negative integer")
+    if value > MAX_FACTORIAL:
+        raise MathError("Result is too large")
+    return math.factorial(int(value))
+
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _pow,
+}
+
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+FUNCTIONS = {
+    "abs": abs,
+    "round": round,
+    "min": min,
+    "max": max,
+    "sqrt": math.sqrt,
+    "exp": math.exp,
+    "log": math.log,
+    "log10": math.log10,
+    "log2": math.log2,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "factorial": _factorial,
+}
+
+CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e,
+    "tau": math.tau,
+}
+
+_ALLOWED_NODES = (ast.Expression, ast.Load, ast.BinOp, ast.UnaryOp, *BINARY_OPERATORS, *UNARY_OPERATORS)
+
+# Words that may wrap an expression in a question, e.g. "what is 15 + 27?".
+_QUESTION_PREFIX = re.compile(r"^\s*(what\s+is|what's|calculate|compute|evaluate|solve)\s*[:,]?\s*", re.I)
+
+
+def normalize_expression(text: str) -> str:
+    """Map common notation (^, ×, ÷, commas in numbers) to Python syntax."""
+    text = text.replace("^", "**").replace("×", "*").replace("÷", "/")
+    return re.sub(r"(?<=\d),(?=\d{3}\b)", "", text)
+
+
+def parse_expression(text: str) -> ast.Expression:
+    """
+    Parse an expression and check that it only uses whitelisted nodes.
+
+    Raises:
+        MathError: If the text is not a supported arithmetic expression
+    """
+    text = normalize_expression(text).strip()
+    if not text:
+        raise MathError("Empty expression")
+    if len(text) > MAX_EXPRESSION_LENGTH:
+        raise MathError("Expression is too long")
+    try:
+        tree = ast.parse(text, mode="eval")
+    except SyntaxError:
+        raise MathError("Invalid expression")
+
+    nodes = list(ast.walk(tree))
+    if len(nodes) > MAX_NODES:
+        raise MathError("Expression is too long")
+    for node in nodes:
+        if isinstance(node, _ALLOWED_NODES):
+            continue
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            continue
+        if isinstance(node, ast.Name) and (node.id in CONSTANTS or node.id in FUNCTIONS):
+            continue
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in FUNCTIONS
+            and not node.keywords
+        ):
+            continue
+        raise MathError(f"Unsupported syntax: {type(node).__name__}")
+    return tree
+
+
+def _check_size(value: Number) -> Number:
+    if isinstance(value, complex):
+        raise MathError("Result is not a real number")
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise MathError("Result is too large")
+    if isinstance(value, float) and not math.isfinite(value):
+        raise MathError("Result is not a finite number")
+    return value
+
+
+def _eval(node: ast.AST) -> Number:
+    if isinstance(node, ast.Expression):
+        return _eval(node.body)
+    if isinstance(node, ast.Constant):
+        # Literals can be out of range too, e.g. 1e999 parses as inf.
+        return _check_size(node.value)
+    if isinstance(node, ast.Name):
+        if node.id not in CONSTANTS:
+            raise MathError(f"'{node.id}' is a function")
+        return CONSTANTS[node.id]
+    if isinstance(node, ast.UnaryOp):
+        return UNARY_OPERATORS[type(node.op)](_eval(node.operand))
+    if isinstance(node, ast.BinOp):
+        left, right = _eval(node.left), _eval(node.right)
+        return _check_size(BINARY_OPERATORS[type(node.op)](left, right))
+    if isinstance(node, ast.Call):
+        args = [_eval(arg) for arg in node.args]
+        return _check_size(FUNCTIONS[node.func.id](*args))
+    raise MathError(f"Unsupported syntax: {type(node).__name__}")
+
+
+def evaluate_tree(tree: ast.Expression) -> Number:
+    """Evaluate an expression parsed by parse_expression."""
+    try:
+        return _eval(tree)
+    except ZeroDivisionError:
+        raise MathError("Division by zero")
+    except OverflowError:
+        raise MathError("Result is too large")
+    except (TypeError, ValueError) as e:
+        if isinstance(e, MathError):
+            raise
+        raise MathError(str(e))
+
+
+def evaluate(text: str) -> Number:
+    """
+    Safely evaluate an arithmetic expression.
+
+    Supports + - * / // % ** (and ^), unary minus, parentheses, the
+    functions in FUNCTIONS and the constants in CONSTANTS.
+
+    Raises:
+        MathError: If the expression is invalid or cannot be evaluated
+    """
+    return evaluate_tree(parse_expression(text))
+
+
+def extract_expression(query: str) -> Optional[str]:
+    """
+    Return the arithmetic expression in a query, or None for word problems.
+
+    "what is 15 + 27?" gives "15 + 27"; "I have 3 apples..." gives None.
+    """
+    text = _QUESTION_PREFIX.sub("", query.strip()).rstrip(" ?=.")
+    if not re.search(r"\d", text):
+        return None
+    try:
+        parse_expression(text)
+    except MathError:
+        return None
+    return text
+
+
+def format_number(value: Number) -> str:
+    """Format a result, dropping the fraction of integral floats."""
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e16:
+        return str(int(value))
+    return str(value)
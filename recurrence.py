@@ -0,0 +1,173 @@
+from collections import defaultdict
+from datetime import date as Date, timedelta
+from math import gcd
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TypedDict
+
+RULE_FIELDS = ["user_id", "start_time", "end_time", "start_date", "end_date", "period_days"]
+
+
+class RecurrenceRule(TypedDict):
+    """A booking repeated every period_days days from start_date to end_date (inclusive)."""
+    user_id: str
+    start_time: str
+    end_time: str
+    start_date: str
+    end_date: str
+    period_days: int
+
+
+def _minutes(hhmm: str) -> int:
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def ordinal(date: str) -> int:
+    """Day number of a YYYY-MM-DD date (datetime.date.toordinal)."""
+    return Date.fromisoformat(date).toordinal()
+
+
+def from_ordinal(day: int) -> str:
+    return Date.fromordinal(day).isoformat()
+
+
+def make_rule(user_id: str, start_time: str, end_time: str, start_date: str, end_date: str, period_days: int) -> RecurrenceRule:
+    """
+    Build a rule, trimming end_date to the last real occurrence.
+
+    Raises:
+        ValueError: If the period is not positive or end_date is before start_date
+    """
+    period_days = int(period_days)
+    first, last = ordinal(start_date), ordinal(end_date)
+    if period_days <= 0:
+        raise ValueError("period_days must be positive")
+    if last < first:
+        raise ValueError("end_date is before start_date")
+    last = first + (last - first) // period_days * period_days
+    return {
+        "user_id": str(user_id),
+        "start_time": start_time,
+        "end_time": end_time,
+        "start_date": start_date,
+        "end_date": from_ordinal(last),
+        "period_days": period_days,
+    }
+
+
+def rule_from_booking(booking: dict) -> RecurrenceRule:
+    """Turn a booking with repeat_every_days and repeat_until into a rule."""
+    return make_rule(
+        booking["user_id"], booking["start_time"], booking["end_time"],
+        booking["date"], booking["repeat_until"], booking["repeat_every_days"],
+    )
+
+
+def occurs_on(rule: RecurrenceRule, date: str) -> bool:
+    day, first = ordinal(date), ordinal(rule["start_date"])
+    return first <= day <= ordinal(rule["end_date"]) and (day - first) % int(rule["period_days"]) == 0
+
+
+def occurrences(rule: RecurrenceRule, first: Optional[str] = None, last: Optional[str] = None) -> Iterator[str]:
+    """
+    Lazily yield the dates of a rule inside an optional [first, last] window.
+
+    The first date is found arithmetically, so a window far into a long
+    series does not walk the earlier occurrences.
+    """
+    start, end, period = ordinal(rule["start_date"]), ordinal(rule["end_date"]), int(rule["period_days"])
+    low = max(start, ordinal(first)) if first else start
+    high = min(end, ordinal(last)) if last else end
+    day = start + -(-(low - start) // period) * period
+    while day <= high:
+        yield from_ordinal(day)
+        day += period
+
+
+def first_common_date(a: RecurrenceRule, b: RecurrenceRule) -> Optional[str]:
+    """
+    First date on which both rules occur, or None.
+
+    Solves d = start_a (mod period_a), d = start_b (mod period_b) with the
+    Chinese remainder theorem and checks the first solution against the
+    overlap of the two date ranges; no occurrences are expanded.
+    """
+    pa, pb = int(a["period_days"]), int(b["period_days"])
+    sa, sb = ordinal(a["start_date"]), ordinal(b["start_date"])
+    low = max(sa, sb)
+    high = min(ordinal(a["end_date"]), ordinal(b["end_date"]))
+    if low > high:
+        return None
+    g = gcd(pa, pb)
+    if (sb - sa) % g:
+        return None
+    modulus = pb // g
+    k = (sb - sa) // g * pow(pa // g, -1, modulus) % modulus if modulus > 1 else 0
+    period = pa // g * pb
+    day = sa + pa * k
+    day += -(-(low - day) // period) * period
+    return from_ordinal(day) if day <= high else None
+
+
+def times_overlap(start_a: int, end_a: int, start_b: int, end_b: int) -> bool:
+    return start_a < end_b and start_b < end_a
+
+
+def rules_conflict(a: RecurrenceRule, b: RecurrenceRule) -> bool:
+    if not times_overlap(
+        _minutes(a["start_time"]), _minutes(a["end_time"]),
+        _minutes(b["start_time"]), _minutes(b["end_time"]),
+    ):
+        return False
+    return first_common_date(a, b) is not None
+
+
+class RuleIndex:
+    """
+    In-memory recurrence rules bucketed by (period, day residue).
+
+    The rules occurring on a date are the buckets whose residue matches
+    the date's ordinal for each distinct period, so a lookup costs one
+    dict probe per period (e.g. one for a table of weekly series) instead
+    of a scan over every stored rule.
+    """
+
+    def __init__(self, rules: Iterable[RecurrenceRule] = ()):
+        self.rules: List[RecurrenceRule] = []
+        self.buckets: Dict[int, Dict[int, List[Tuple[int, int, int, int]]]] = defaultdict(lambda: defaultdict(list))
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule: RecurrenceRule) -> None:
+        period, start = int(rule["period_days"]), ordinal(rule["start_date"])
+        self.rules.append(rule)
+        self.buckets[period][start % period].append(
+            (start, ordinal(rule["end_date"]), _minutes(rule["start_time"]), _minutes(rule["end_time"]))
+        )
+
+    def intervals(self, date: str) -> List[Tuple[int, int]]:
+        """(start, end) minute intervals of the rules occurring on a date."""
+        day = ordinal(date)
+        found = []
+        for period, residues in self.buckets.items():
+            for first, last, start, end in residues.get(day % period, ()):
+                if first <= day <= last:
+                    found.append((start, end))
+        return found
+
+    def conflicts(self, date: str, start: int, end: int) -> bool:
+        return any(times_overlap(start, end, s, e) for s, e in self.intervals(date))
+
+    def conflicts_with_rule(self, rule: RecurrenceRule) -> bool:
+        return any(rules_conflict(rule, other) for other in self.rules)
+
+    def for_user(self, user_id: str) -> List[RecurrenceRule]:
+        return [rule for rule in self.rules if rule["user_id"] == str(user_id)]
+
+
+def add_months(date: str, months: int) -> str:
+    """Same day N months later, clamped to the end of shorter months."""
+    value = Date.fromisoformat(date)
+    month = value.month - 1 + months
+    year, month = value.year + month // 12, month % 12 + 1
+    next_month = Date(year + month // 12, month % 12 + 1, 1)
+    return min(Date(year, month, 1) + timedelta(days=value.day - 1), next_month - timedelta(days=1)).isoformat()
@@ -0,0 +1,233 @@
+"""
+Replay a JSONL log of queries through graph.app.
+
+Each line is one request:
+
+    {"query": "book the ground", "answers": ["10:00 to 11:00 on 2026-05-02"],
+     "session": "u42", "user_id": "42", "ts": 1714650000.5}
+
+Only the query is required. "answers" are fed, in order, to the questions
+the graph interrupts with; "session" puts several requests on the same
+conversation thread; "ts" (epoch seconds or ISO time) lets --speed replay
+the log's own arrival pattern. Without --rate or --speed requests are sent
+as fast as the worker pool takes them. With LLM_CACHE_MODE=replay every
+model call is answered from recorded responses (see llm_cache.py).
+
+    python replay.py traffic.jsonl --rate 20 --workers 16 --fake
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+from sessions import SessionManager, pending_question
+
+
+def read_requests(path: str, field: str = "query", limit: Optional[int] = None) -> Iterator[dict]:
+    """
+    Stream requests from a JSONL file, skipping blank lines and lines without the query field.
+
+    Args:
+        path: JSONL file
+        field: key holding the query text
+        limit: stop after this many requests
+
+    Returns:
+        Iterator of dicts with line, query, answers, session, user_id and ts
+    """
+    count = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if limit is not None and count >= limit:
+                return
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            query = record.get(field)
+            if not query:
+                continue
+            ts = record.get("ts")
+            if isinstance(ts, str):
+                ts = datetime.fromisoformat(ts).timestamp()
+            count += 1
+            yield {
+                "line": line_no,
+                "id": record.get("request_id") or record.get("id") or str(line_no),
+                "query": str(query),
+                "answers": list(record.get("answers") or []),
+                "session": record.get("session"),
+                "user_id": record.get("user_id"),
+                "ts": ts,
+            }
+
+
+def replay_one(sessions: SessionManager, request: dict, session_id: str) -> dict:
+    """
+    Run one request and answer its interrupts from the script.
+
+    Returns:
+        Timing record: id, route, route_source, turns, status (ok,
+        unanswered or error), latency_ms and the response or error
+    """
+    started = time.perf_counter()
+    record = {"id": request["id"], "line": request["line"], "route": None, "route_source": None, "turns": 1}
+    try:
+        result = sessions.ask(session_id, request["query"], user_id=request["user_id"])
+        answers = iter(request["answers"])
+        while pending_question(result) is not None:
+            answer = next(answers, None)
+            if answer is None:
+                break
+            result = sessions.resume(session_id, answer, user_id=request["user_id"])
+            record["turns"] += 1
+        record["status"] = "unanswered" if pending_question(result) is not None else "ok"
+        record["route"] = result.get("route")
+        record["route_source"] = result.get("route_source")
+        record["response"] = str(result.get("responce", ""))[:200]
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = repr(e)
+    record["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return record
+
+
+def replay(
+    sessions: SessionManager,
+    requests: Iterator[dict],
+    workers: int = 8,
+    rate: Optional[float] = None,
+    speed: Optional[float] = None,
+) -> List[dict]:
+    """
+    Send requests to a worker pool on schedule and collect their timings.
+
+    With rate, request i is due at i / rate seconds; with speed, at its ts
+    offset from the first request divided by speed. Otherwise each request
+    is sent as soon as a worker is free. queue_ms in each record is how
+    late the request started relative to when it was due.
+
+    Returns:
+        Timing records in completion order
+    """
+    results: List[dict] = []
+    results_lock = threading.Lock()
+    # Bounds memory when replaying a large log as fast as possible.
+    in_flight = threading.BoundedSemaphore(workers * 2)
+    known_sessions = set()
+
+    def run(request: dict, session_id: str, due: float) -> None:
+        try:
+            queue_ms = max(0.0, (time.perf_counter() - due) * 1000)
+            record = replay_one(sessions, request, session_id)
+            record["queue_ms"] = round(queue_ms, 3)
+            with results_lock:
+                results.append(record)
+        finally:
+            in_flight.release()
+
+    started = time.perf_counter()
+    first_ts = None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, request in enumerate(requests):
+            if rate:
+                due = started + i / rate
+            elif speed and request["ts"] is not None:
+                first_ts = request["ts"] if first_ts is None else first_ts
+                due = started + (request["ts"] - first_ts) / speed
+            else:
+                due = time.perf_counter()
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            session_id = request["session"] or uuid.uuid4().hex
+            if session_id not in known_sessions:
+                known_sessions.add(session_id)
+                sessions.create(user_id=request["user_id"], session_id=session_id)
+            in_flight.acquire()
+            pool.submit(run, request, session_id, due)
+    return results
+
+
+def _percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3)}
+
+
+def summarize(results: List[dict], elapsed: float) -> dict:
+    """Counts by status and route, throughput and latency percentiles overall and per route."""
+    by_route = defaultdict(list)
+    for record in results:
+        if record["status"] != "error":
+            by_route[record["route"] or "unknown"].append(record["latency_ms"])
+    latencies = [latency for values in by_route.values() for latency in values]
+    return {
+        "requests": len(results),
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "status": dict(Counter(record["status"] for record in results)),
+        "route_source": dict(Counter(record["route_source"] for record in results if record["route_source"])),
+        "latency": _percentiles(latencies),
+        "queue": _percentiles([record["queue_ms"] for record in results]),
+        "routes": {route: {"requests": len(values), **_percentiles(values)} for route, values in sorted(by_route.items())},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay a JSONL query log through the assistant graph.")
+    parser.add_argument("file", help="JSONL log, one request per line")
+    parser.add_argument("--field", default="query", help="key holding the query text")
+    parser.add_argument("--limit", type=int, help="replay at most this many requests")
+    parser.add_argument("--workers", type=int, default=8)
+    pacing = parser.add_mutually_exclusive_group()
+    pacing.add_argument("--rate", type=float, help="target requests per second")
+    pacing.add_argument("--speed", type=float, help="replay the log's ts spacing, this many times faster")
+    parser.add_argument("--fake", action="store_true", help="use benchmark.py's offline models and temp stores")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call (--fake)")
+    parser.add_argument("--llm-cache", choices=("off", "on", "replay"), default="off", help="LLM_CACHE_MODE with --fake")
+    parser.add_argument("--output", help="write one timing record per request to this JSONL file")
+    args = parser.parse_args(argv)
+
+    if args.fake:
+        import benchmark
+
+        app = benchmark.load_app(
+            tempfile.mkdtemp(prefix="replay-"), args.llm_latency, 0.0, 2000, args.llm_cache
+        ).app
+    else:
+        from graph import app
+
+    started = time.perf_counter()
+    results = replay(
+        SessionManager(app, max_sessions=max(1000, args.workers * 4)),
+        read_requests(args.file, args.field, args.limit),
+        workers=args.workers,
+        rate=args.rate,
+        speed=args.speed,
+    )
+    summary = summarize(results, time.perf_counter() - started)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            for record in results:
+                f.write(json.dumps(record) + "\n")
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["status"].get("error") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
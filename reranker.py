@@ -0,0 +1,137 @@
+import math
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from hybrid_retriever import BM25Index, normalize_rows, tokenize
+from logger import get_logger
+
+log = get_logger("reranker")
+
+# Set RERANK=0 to send the fused top k straight to the prompt again.
+RERANK_ENABLED = os.getenv("RERANK", "1") == "1"
+# Candidates taken from the hybrid search before re-ranking.
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_MIN_SCORE = float(os.getenv("RERANK_MIN_SCORE", "0.25"))
+# Context budget in (estimated) tokens and a hard cap on chunks.
+RERANK_TOKEN_BUDGET = int(os.getenv("RERANK_TOKEN_BUDGET", "1000"))
+RERANK_MAX_DOCS = int(os.getenv("RERANK_MAX_DOCS", "6"))
+# Weight of embedding cosine against lexical overlap in the score.
+RERANK_DENSE_WEIGHT = float(os.getenv("RERANK_DENSE_WEIGHT", "0.7"))
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class Reranker:
+    """
+    Second retrieval stage: score a candidate set locally and keep the
+    chunks worth putting in the prompt.
+
+    The score mixes the cosine between the query and chunk embeddings
+    (chunk vectors are read back from the FAISS index, one vectorised
+    pass per query) with IDF-weighted query-term overlap from the BM25
+    index. Chunks below min_score are dropped and the rest are kept best
+    first until token_budget or max_docs is reached; the best chunk is
+    always kept so the model still sees some context.
+    """
+
+    def __init__(
+        self,
+        vectorstore,
+        lexical: BM25Index,
+        min_score: float = RERANK_MIN_SCORE,
+        token_budget: int = RERANK_TOKEN_BUDGET,
+        max_docs: int = RERANK_MAX_DOCS,
+        dense_weight: float = RERANK_DENSE_WEIGHT,
+    ):
+        self.vectorstore = vectorstore
+        self.lexical = lexical
+        self.min_score = min_score
+        self.token_budget = token_budget
+        self.max_docs = max_docs
+        self.dense_weight = dense_weight
+        self._positions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _position(self, doc_id: str) -> Optional[int]:
+        # Deletes compact the FAISS index, so a cached position is checked
+        # against the store's own mapping and the map rebuilt when stale.
+        mapping = self.vectorstore.index_to_docstore_id
+        position = self._positions.get(doc_id)
+        if position is None or mapping.get(position) != doc_id:
+            with self._lock:
+                self._positions = {value: key for key, value in mapping.items()}
+            position = self._positions.get(doc_id)
+        return position
+
+    def _vectors(self, documents: Sequence[Document]) -> np.ndarray:
+        positions = [self._position(document.id) if document.id else None for document in documents]
+        try:
+            if None in positions:
+                raise KeyError("document not in the index")
+            matrix = self.vectorstore.index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+        except Exception:
+            # Index types without reconstruction (or documents it doesn't
+            # hold): the chunk vectors come from the embedding cache instead.
+            matrix = np.asarray(
+                self.vectorstore.embeddings.embed_documents([document.page_content for document in documents]),
+                dtype=np.float32,
+            )
+        return normalize_rows(matrix)
+
+    def _overlap(self, query: str, documents: Sequence[Document]) -> np.ndarray:
+        weights = {term: self.lexical.idf(term) for term in dict.fromkeys(tokenize(query))}
+        total = sum(weights.values())
+        if not total:
+            return np.zeros(len(documents), dtype=np.float32)
+        return np.asarray(
+            [
+                sum(weight for term, weight in weights.items() if term in terms) / total
+                for terms in (set(tokenize(document.page_content)) for document in documents)
+            ],
+            dtype=np.float32,
+        )
+
+    def score(self, query: str, query_vector: Optional[Sequence[float]], documents: Sequence[Document]) -> np.ndarray:
+        """
+        Relevance of each candidate to the query, roughly in [0, 1].
+
+        Without a query vector (dense search unavailable) only the lexical
+        overlap counts.
+        """
+        overlap = self._overlap(query, documents)
+        if query_vector is None:
+            return overlap
+        vector = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        cosine = self._vectors(documents) @ (vector / norm if norm else vector)
+        return self.dense_weight * cosine + (1 - self.dense_weight) * overlap
+
+    def rerank(
+        self, query: str, query_vector: Optional[Sequence[float]], documents: Sequence[Document]
+    ) -> List[Tuple[Document, float]]:
+        """
+        Returns:
+            (document, score) pairs to use as context, best first
+        """
+        if not documents:
+            return []
+        scores = self.score(query, query_vector, documents)
+        kept = []
+        tokens = 0
+        for i in np.argsort(-scores, kind="stable"):
+            document, score = documents[i], float(scores[i])
+            size = estimate_tokens(document.page_content)
+            if kept and (score < self.min_score or tokens + size > self.token_budget or len(kept) >= self.max_docs):
+                break
+            kept.append((document, score))
+            tokens += size
+        log.debug("Kept %d of %d candidates (%d tokens)", len(kept), len(documents), tokens)
+        return kept
@@ -0,0 +1,295 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from logging.handlers import MemoryHandler, RotatingFileHandler
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from logger import LOG_DIR, get_logger
+
+log = get_logger("router")
+
+ROUTES = ("math", "knowledge", "ground", "out_of_my_known")
+ROUTER_MODEL_PATH = os.getenv("ROUTER_MODEL_PATH", "router_model.json")
+ROUTE_LOG_FILE = os.path.join(LOG_DIR, "routes.jsonl")
+# Decisions are buffered and written ROUTE_LOG_BUFFER at a time (and at
+# exit); the file rotates like the app log.
+ROUTE_LOG_BUFFER = int(os.getenv("ROUTE_LOG_BUFFER", "100"))
+ROUTE_LOG_MAX_BYTES = int(os.getenv("ROUTE_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+ROUTE_LOG_BACKUPS = int(os.getenv("ROUTE_LOG_BACKUPS", "5"))
+
+# A bare arithmetic expression, optionally wrapped in "what is ... ?".
+_MATH_PREFIX = re.compile(r"^\s*(what\s+is|what's|calculate|compute|evaluate|solve)\s*[:,]?\s*", re.I)
+_EXPRESSION = re.compile(r"^[\d\s.+\-*/()^%×÷]+$")
+_OPERATOR = re.compile(r"\d\s*(\*\*|[+\-*/^%×÷])\s*[\d(]")
+_DATE = re.compile(r"\b\d{4}-\d{1,2}-\d{1,2}\b")
+_MATH_WORDS = re.compile(
+    r"\b(plus|minus|times|multiplied by|divided by|square root|squared|cubed|sum of|product of|percent of)\b", re.I
+)
+_BOOKING_VERB = re.compile(r"\b(book|booking|reserve|reservation|rent)\b", re.I)
+_BOOKING_OBJECT = re.compile(r"\b(ground|grounds|playground|turf|pitch|court|field|slot)\b", re.I)
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_MATH_FILLER = re.compile(r"\b(of|and|by|to|the|a|an)\b", re.I)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def rule_route(query: str) -> Optional[str]:
+    """Deterministic rules for unambiguous queries; None when no rule applies."""
+    text = _MATH_PREFIX.sub("", query.strip()).rstrip(" ?=.")
+    if text and _EXPRESSION.match(text) and _OPERATOR.search(text) and not _DATE.search(text):
+        return "math"
+    if _BOOKING_VERB.search(query) and _BOOKING_OBJECT.search(query):
+        return "ground"
+    # Worded arithmetic ("5 plus 3", "square root of 16") only when
+    # nothing but numbers, math words and filler is left; "16GB plus
+    # MagSafe" style product questions go on to the classifier.
+    if re.search(r"\d", text) and _MATH_WORDS.search(text):
+        rest = _MATH_FILLER.sub(" ", _NUMBER.sub(" ", _MATH_WORDS.sub(" ", text)))
+        if not re.search(r"[^\W\d_]", rest):
+            return "math"
+    return None
+
+
+_route_log_handlers: Dict[str, logging.Handler] = {}
+_route_log_handlers_lock = threading.Lock()
+
+
+def _route_log_handler(path: str) -> logging.Handler:
+    # One buffered, rotating handler per file, shared by every router
+    # writing to it; logging flushes and closes it at exit.
+    path = os.path.abspath(path)
+    with _route_log_handlers_lock:
+        handler = _route_log_handlers.get(path)
+        if handler is None:
+            file_handler = RotatingFileHandler(
+                path, maxBytes=ROUTE_LOG_MAX_BYTES, backupCount=ROUTE_LOG_BACKUPS, encoding="utf-8", delay=True
+            )
+            file_handler.setFormatter(logging.Formatter("%(message)s"))
+            handler = MemoryHandler(ROUTE_LOG_BUFFER, flushLevel=logging.CRITICAL, target=file_handler)
+            _route_log_handlers[path] = handler
+        return handler
+
+
+def _features(text: str) -> List[str]:
+    tokens = _TOKEN.findall(text.lower())
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+class CentroidClassifier:
+    """
+    TF-IDF nearest-centroid classifier (a linear model over tf-idf features).
+
+    Trained from logged (query, route) pairs. predict() returns the best
+    route and its cosine similarity, which the router uses as confidence.
+    """
+
+    def __init__(self, idf: Dict[str, float], centroids: Dict[str, Dict[str, float]]):
+        self.idf = idf
+        self.centroids = centroids
+
+    def _vector(self, text: str) -> Dict[str, float]:
+        counts = Counter(f for f in _features(text) if f in self.idf)
+        vector = {f: (1 + math.log(c)) * self.idf[f] for f, c in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        return {f: v / norm for f, v in vector.items()} if norm else {}
+
+    @classmethod
+    def train(cls, examples: Iterable[Tuple[str, str]]) -> "CentroidClassifier":
+        examples = [(q, r) for q, r in examples if r in ROUTES]
+        df = Counter()
+        for query, _ in examples:
+            df.update(set(_features(query)))
+        n = len(examples)
+        model = cls({f: math.log((1 + n) / (1 + d)) + 1 for f, d in df.items()}, {})
+
+        sums: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for query, route in examples:
+            for f, v in model._vector(query).items():
+                sums[route][f] += v
+        for route, total in sums.items():
+            norm = math.sqrt(sum(v * v for v in total.values()))
+            model.centroids[route] = {f: v / norm for f, v in total.items()}
+        return model
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        vector = self._vector(text)
+        best, best_score = None, 0.0
+        for route, centroid in self.centroids.items():
+            score = sum(v * centroid.get(f, 0.0) for f, v in vector.items())
+            if score > best_score:
+                best, best_score = route, score
+        return best, best_score
+
+    def save(self, path: str = ROUTER_MODEL_PATH) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"idf": self.idf, "centroids": self.centroids}, f)
+
+    @classmethod
+    def load(cls, path: str = ROUTER_MODEL_PATH) -> Optional["CentroidClassifier"]:
+        if not os.path.isfile(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["idf"], data["centroids"])
+
+
+class QueryRouter:
+    """
+    Tiered query router: rules, then the local classifier, then the LLM.
+
+    Only queries that neither the rules nor a confident classifier can
+    place fall through to llm_route (or allm_route from aroute). Every decision is appended to
+    ROUTE_LOG_FILE with its source (buffered, see flush()), which is also
+    the training data for the classifier.
+    """
+
+    def __init__(
+        self,
+        llm_route: Callable[[str], str],
+        classifier: Optional[CentroidClassifier] = None,
+        min_confidence: float = 0.5,
+        log_file: Optional[str] = ROUTE_LOG_FILE,
+        allm_route: Optional[Callable[[str], Awaitable[str]]] = None,
+        llm_route_batch: Optional[Callable[[List[str]], List[str]]] = None,
+    ):
+        self.llm_route = llm_route
+        self.allm_route = allm_route
+        self.llm_route_batch = llm_route_batch
+        self.classifier = classifier
+        self.min_confidence = min_confidence
+        self.log_file = log_file
+
+    def _local_route(self, query: str) -> Tuple[Optional[str], str]:
+        route, source = rule_route(query), "rules"
+        if route is None and self.classifier is not None:
+            route, confidence = self.classifier.predict(query)
+            source = "classifier"
+            if confidence < self.min_confidence:
+                route = None
+        return route, source
+
+    def route(self, query: str) -> Tuple[str, str]:
+        """
+        Pick the agent for a query.
+
+        Returns:
+            Tuple of (route, source) where source is rules, classifier or llm
+        """
+        started = time.perf_counter()
+        route, source = self._local_route(query)
+        if route is None:
+            route, source = self.llm_route(query), "llm"
+            if route not in ROUTES:
+                route = "out_of_my_known"
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        self._record(query, route, source, elapsed_us)
+        return route, source
+
+    async def aroute(self, query: str) -> Tuple[str, str]:
+        """Async route(); the LLM tier awaits allm_route when one is set."""
+        started = time.perf_counter()
+        route, source = self._local_route(query)
+        if route is None:
+            if self.allm_route is not None:
+                route = await self.allm_route(query)
+            else:
+                route = await asyncio.to_thread(self.llm_route, query)
+            source = "llm"
+            if route not in ROUTES:
+                route = "out_of_my_known"
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        self._record(query, route, source, elapsed_us)
+        return route, source
+
+    def route_batch(self, queries: List[str]) -> List[Tuple[str, str]]:
+        """
+        route() for many queries: the local tiers run per query and every
+        query they can't place goes to one llm_route_batch call (or to
+        llm_route one by one when no batch function is set).
+
+        Returns:
+            (route, source) per query, in order
+        """
+        started = time.perf_counter()
+        decisions: List[Tuple[Optional[str], str]] = []
+        elapsed: List[float] = []
+        for query in queries:
+            query_started = time.perf_counter()
+            decisions.append(self._local_route(query))
+            elapsed.append((time.perf_counter() - query_started) * 1e6)
+
+        unresolved = [i for i, (route, _) in enumerate(decisions) if route is None]
+        if unresolved:
+            llm_started = time.perf_counter()
+            pending = [queries[i] for i in unresolved]
+            if self.llm_route_batch is not None:
+                routes = self.llm_route_batch(pending)
+            else:
+                routes = [self.llm_route(query) for query in pending]
+            # Every query in the LLM call waited for all of it.
+            llm_elapsed = (time.perf_counter() - llm_started) * 1e6
+            for i, route in zip(unresolved, routes):
+                decisions[i] = (route if route in ROUTES else "out_of_my_known", "llm")
+                elapsed[i] += llm_elapsed
+
+        self._record_many(
+            [(query, route, source, elapsed_us) for query, (route, source), elapsed_us in zip(queries, decisions, elapsed)]
+        )
+        log.debug("Routed %d queries in %.0fms", len(queries), (time.perf_counter() - started) * 1000)
+        return decisions
+
+    def _record(self, query: str, route: str, source: str, elapsed_us: float) -> None:
+        log.debug("Routed to %s by %s in %.0fus", route, source, elapsed_us)
+        self._record_many([(query, route, source, elapsed_us)])
+
+    def _record_many(self, records: List[Tuple[str, str, str, float]]) -> None:
+        if not self.log_file:
+            return
+        handler = _route_log_handler(self.log_file)
+        for query, route, source, elapsed_us in records:
+            line = json.dumps({"query": query, "route": route, "source": source, "latency_us": round(elapsed_us)})
+            handler.handle(logging.LogRecord("routes", logging.INFO, __file__, 0, line, None, None))
+
+    def flush(self) -> None:
+        """Write buffered decisions to the route log now."""
+        if self.log_file:
+            _route_log_handler(self.log_file).flush()
+
+
+def read_route_log(path: str = ROUTE_LOG_FILE, sources: Tuple[str, ...] = ("rules", "llm")) -> List[Tuple[str, str]]:
+    """
+    Read (query, route) training pairs from a route log.
+
+    Rotated backups (path.1, path.2, ...) are read too, oldest first.
+    Decisions made by the classifier itself are skipped by default so it
+    is not trained on its own output.
+    """
+    backups = [f"{path}.{i}" for i in range(ROUTE_LOG_BACKUPS, 0, -1)]
+    examples = []
+    for log_path in [p for p in backups if os.path.isfile(p)] + [path]:
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if record.get("source") in sources:
+                        examples.append((record["query"], record["route"]))
+    return examples
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the local query router from a route log.")
+    parser.add_argument("log_file", nargs="?", default=ROUTE_LOG_FILE)
+    parser.add_argument("--output", default=ROUTER_MODEL_PATH)
+    args = parser.parse_args()
+
+    examples = read_route_log(args.log_file)
+    CentroidClassifier.train(examples).save(args.output)
+    print(f"Trained on {len(examples)} queries -> {args.output}")
@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import embed_queries
+from logger import get_logger
+
+log = get_logger("semantic_cache")
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split())
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache for the RAG chain.
+
+    A question is looked up by the hash of its normalised text first and
+    then by cosine similarity against the embeddings of cached questions.
+    Entries expire after ttl seconds, the least recently used entry is
+    evicted past max_entries, and the whole cache is dropped when the
+    index version changes.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        threshold: float = 0.95,
+        ttl: float = 3600.0,
+        max_entries: int = 1000,
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version: Optional[str] = None
+        self.entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._matrix = None
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+
+    def _set_version(self, version: Optional[str]) -> None:
+        if version != self.version:
+            if self.entries:
+                log.info("Index version changed to %s, dropping %d cached answers", version, len(self.entries))
+            self.entries.clear()
+            self._matrix = None
+            self.version = version
+
+    def _fresh(self, entry: dict) -> bool:
+        return time.time() - entry["created"] < self.ttl
+
+    def _nearest(self, vector: np.ndarray):
+        if self._matrix is None:
+            self._matrix_keys = list(self.entries)
+            if not self._matrix_keys:
+                return None, 0.0
+            self._matrix = np.stack([self.entries[key]["vector"] for key in self._matrix_keys])
+        similarities = self._matrix @ vector
+        best = int(np.argmax(similarities))
+        return self._matrix_keys[best], float(similarities[best])
+
+    def _hit(self, key: str, kind: str) -> str:
+        entry = self.entries[key]
+        self.entries.move_to_end(key)
+        self.saved_seconds += entry["latency"]
+        if kind == "exact":
+            self.exact_hits += 1
+        else:
+            self.semantic_hits += 1
+        log.debug("%s answer cache hit, saved %.2fs", kind, entry["latency"])
+        return entry["answer"]
+
+    def _embed(self, question: str) -> Optional[np.ndarray]:
+        try:
+            vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        except Exception as e:
+            log.warning("Could not embed question for the answer cache: %r", e)
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _embed_many(self, questions: List[str]) -> List[Optional[np.ndarray]]:
+        if not questions:
+            return []
+        try:
+            matrix = np.asarray(embed_queries(self.embeddings, questions), dtype=np.float32)
+        except Exception as e:
+            log.warning("Could not embed questions for the answer cache: %r", e)
+            return [None] * len(questions)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return list(matrix / np.where(norms == 0, 1, norms))
+
+    def _lookup_exact(self, key: str, version: Optional[str]) -> Optional[str]:
+        with self._lock:
+            self._set_version(version)
+            entry = self.entries.get(key)
+            if entry is not None and self._fresh(entry):
+                return self._hit(key, "exact")
+        return None
+
+    def _lookup_similar(self, vector: Optional[np.ndarray]) -> Optional[str]:
+        if vector is None:
+            return None
+        with self._lock:
+            nearest, similarity = self._nearest(vector)
+            if nearest is not None and similarity >= self.threshold and self._fresh(self.entries[nearest]):
+                return self._hit(nearest, "semantic")
+        return None
+
+    def _store(self, key: str, vector: Optional[np.ndarray], answer: str, latency: float, version: Optional[str]) -> None:
+        with self._lock:
+            self.misses += 1
+            if vector is not None and self.version == version:
+                self.entries[key] = {"answer": answer, "vector": vector, "created": time.time(), "latency": latency}
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                self._matrix = None
+
+    def get_or_compute(self, question: str, compute: Callable[[str], str], version: Optional[str] = None) -> str:
+        """
+        Return a cached answer for the question or compute and cache one.
+
+        Args:
+            question: User question
+            compute: Produces the answer on a miss (e.g. rag_chain.invoke)
+            version: Current index version; a new version empties the cache
+
+        Returns:
+            The answer
+        """
+        key = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+        answer = self._lookup_exact(key, version)
+        if answer is not None:
+            return answer
+
+        vector = self._embed(question)
+        answer = self._lookup_similar(vector)
+        if answer is not None:
+            return answer
+
+        started = time.time()
+        answer = compute(question)
+        self._store(key, vector, answer, time.time() - started, version)
+        return answer
+
+    async def aget_or_compute(
+        self, question: str, acompute: Callable[[str], Awaitable[str]], version: Optional[str] = None
+    ) -> str:
+        """Async get_or_compute: awaits acompute (e.g. rag_chain.ainvoke) on a miss."""
+        key = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+        answer = self._lookup_exact(key, version)
+        if answer is not None:
+            return answer
+
+        # The embedding cache is SQLite-backed, so embed off the event loop.
+        vector = await asyncio.to_thread(self._embed, question)
+        answer = self._lookup_similar(vector)
+        if answer is not None:
+            return answer
+
+        started = time.time()
+        answer = await acompute(question)
+        self._store(key, vector, answer, time.time() - started, version)
+        return answer
+
+    def get_or_compute_many(
+        self, questions: List[str], compute_many: Callable[[List[str]], List[str]], version: Optional[str] = None
+    ) -> List[str]:
+        """
+        Batch get_or_compute.
+
+        Repeated questions are answered once, the remaining ones are embedded
+        in one call and every miss is passed to a single compute_many call.
+
+        Args:
+            questions: User questions
+            compute_many: Produces the answers of a list of questions, in order;
+                an exception in place of an answer is returned but not cached
+            version: Current index version; a new version empties the cache
+
+        Returns:
+            The answers, in question order
+        """
+        keys = {q: hashlib.sha256(normalize_question(q).encode("utf-8")).hexdigest() for q in questions}
+        # Questions that only differ in case or spacing share a key and are
+        # answered once, under the first spelling.
+        unique: Dict[str, str] = {}
+        for question, key in keys.items():
+            unique.setdefault(key, question)
+        answers: Dict[str, str] = {}
+        pending = []
+        for question in unique.values():
+            answer = self._lookup_exact(keys[question], version)
+            if answer is None:
+                pending.append(question)
+            else:
+                answers[keys[question]] = answer
+
+        vectors = dict(zip(pending, self._embed_many(pending)))
+        missing = []
+        for question in pending:
+            answer = self._lookup_similar(vectors[question])
+            if answer is None:
+                missing.append(question)
+            else:
+                answers[keys[question]] = answer
+
+        if missing:
+            started = time.time()
+            computed = compute_many(missing)
+            latency = (time.time() - started) / len(missing)
+            for question, answer in zip(missing, computed):
+                if not isinstance(answer, Exception):
+                    self._store(keys[question], vectors[question], answer, latency, version)
+                answers[keys[question]] = answer
+        return [answers[keys[question]] for question in questions]
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit counts, hit rate and the completion time saved so far."""
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "saved_seconds": self.saved_seconds,
+                "entries": len(self.entries),
+            }
@@ -0,0 +1,193 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Union
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.types import Command
+
+# Nodes whose LLM tokens are streamed to the user; other nodes' LLM
+# calls (e.g. the router) are internal.
+STREAMING_NODES = ("knowledge", "out_of_my_known")
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "10000"))
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "3600"))
+
+
+def make_config(thread_id: str, user_id: Optional[str] = None) -> RunnableConfig:
+    """
+    Build a fresh per-request graph config.
+
+    Args:
+        thread_id: Conversation id; interrupts resume on the same thread
+        user_id: Identity used for bookings (defaults to the thread id)
+
+    Returns:
+        A new config dict; never share or mutate one across requests
+    """
+    return {"configurable": {"thread_id": thread_id, "user_id": user_id or thread_id}}
+
+
+def stream_answer(app, graph_input: Union[dict, Command], config: RunnableConfig, final: dict) -> Iterator[str]:
+    """
+    Run the graph and yield answer tokens as the LLM produces them.
+
+    Uses app.stream with stream_mode=["messages", "values"]: retrieval
+    finishes first, then tokens from STREAMING_NODES are yielded one by
+    one. Answers that were not generated token by token (cache hits,
+    math, bookings) are yielded whole at the end.
+
+    Args:
+        app: Compiled graph
+        graph_input: Initial state or a Command(resume=...)
+        config: Per-request config from make_config
+        final: Filled with the final state (including any __interrupt__)
+
+    Yields:
+        Text chunks of the answer
+    """
+    streamed = False
+    for mode, chunk in app.stream(graph_input, config=config, stream_mode=["messages", "values"]):
+        if mode == "messages":
+            message, metadata = chunk
+            if metadata.get("langgraph_node") in STREAMING_NODES and isinstance(message.content, str) and message.content:
+                streamed = True
+                yield message.content
+        else:
+            final.clear()
+            final.update(chunk)
+    if not streamed and "__interrupt__" not in final and final.get("responce"):
+        yield final["responce"]
+
+
+class SessionManager:
+    """
+    Maps chat sessions to graph threads for many concurrent users.
+
+    Each session has its own thread_id and user_id and gets a fresh config
+    on every call. Callers that know the user should pass user_id on every
+    call, not just to create(): an evicted session is registered again on
+    its next call and would otherwise fall back to the session id.
+
+    Turns of one session are serialised by a per-session lock (an asyncio
+    lock for aask/aresume); different sessions run in parallel.
+    Conversation state lives in the graph's checkpointer, so a session
+    here is only a few fields: the least recently used ones are dropped
+    past max_sessions or after idle_seconds without a turn.
+    """
+
+    def __init__(self, app, max_sessions: int = MAX_SESSIONS, idle_seconds: float = SESSION_IDLE_SECONDS):
+        self.app = app
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _register(self, session_id: str, user_id: Optional[str]) -> Dict[str, Any]:
+        self.sessions[session_id] = session = {
+            "thread_id": f"session-{session_id}",
+            "user_id": user_id or session_id,
+            "last_seen": time.time(),
+            "lock": threading.Lock(),
+            "alock": asyncio.Lock(),
+        }
+        return session
+
+    def create(self, user_id: Optional[str] = None, session_id: Optional[str] = None) -> str:
+        """Register a session and return its id."""
+        session_id = session_id or uuid.uuid4().hex
+        with self._lock:
+            self._register(session_id, user_id)
+            self._evict()
+        return session_id
+
+    def _evict(self) -> None:
+        cutoff = time.time() - self.idle_seconds
+        while self.sessions:
+            oldest_id, oldest = next(iter(self.sessions.items()))
+            if len(self.sessions) <= self.max_sessions and oldest["last_seen"] >= cutoff:
+                break
+            del self.sessions[oldest_id]
+
+    def _session(self, session_id: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                # Evicted or created by another worker: the thread itself is
+                # still in the checkpointer, so just register it again.
+                session = self._register(session_id, user_id)
+            elif user_id:
+                session["user_id"] = user_id
+            session["last_seen"] = time.time()
+            self.sessions.move_to_end(session_id)
+            self._evict()
+        return session
+
+    def config(self, session_id: str, user_id: Optional[str] = None) -> RunnableConfig:
+        session = self._session(session_id, user_id)
+        return make_config(session["thread_id"], session["user_id"])
+
+    def ask(self, session_id: str, query: str, user_id: Optional[str] = None) -> dict:
+        """Run a new query on the session's thread."""
+        session = self._session(session_id, user_id)
+        with session["lock"]:
+            return self.app.invoke(
+                {"query": query, "responce": "", "ans": ""},
+                config=make_config(session["thread_id"], session["user_id"]),
+            )
+
+    def resume(self, session_id: str, answer: str, user_id: Optional[str] = None) -> dict:
+        """Answer the question of an interrupted turn."""
+        session = self._session(session_id, user_id)
+        with session["lock"]:
+            return self.app.invoke(
+                Command(resume=answer), config=make_config(session["thread_id"], session["user_id"])
+            )
+
+    def stream(
+        self, session_id: str, message: str, final: dict, resume: bool = False, user_id: Optional[str] = None
+    ) -> Iterator[str]:
+        """
+        Streaming ask() (or resume() with resume=True); see stream_answer.
+
+        The session lock is held until the generator is exhausted.
+        """
+        session = self._session(session_id, user_id)
+        graph_input = Command(resume=message) if resume else {"query": message, "responce": "", "ans": ""}
+        with session["lock"]:
+            yield from stream_answer(
+                self.app, graph_input, make_config(session["thread_id"], session["user_id"]), final
+            )
+
+    async def aask(self, session_id: str, query: str, user_id: Optional[str] = None) -> dict:
+        """Async ask(): runs the graph's async nodes via app.ainvoke."""
+        session = self._session(session_id, user_id)
+        async with session["alock"]:
+            return await self.app.ainvoke(
+                {"query": query, "responce": "", "ans": ""},
+                config=make_config(session["thread_id"], session["user_id"]),
+            )
+
+    async def aresume(self, session_id: str, answer: str, user_id: Optional[str] = None) -> dict:
+        session = self._session(session_id, user_id)
+        async with session["alock"]:
+            return await self.app.ainvoke(
+                Command(resume=answer), config=make_config(session["thread_id"], session["user_id"])
+            )
+
+    def reset(self, session_id: str) -> None:
+        """Forget a session; its checkpoints expire with the checkpointer TTL."""
+        with self._lock:
+            self.sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+
+def pending_question(result: dict) -> Optional[str]:
+    """The question of an interrupted turn, or None if the turn finished."""
+    if "__interrupt__" not in result:
+        return None
+    return result["__interrupt__"][0].value.get("question", "No question provided.")
@@ -1,8 +1,22 @@
+import os
 import streamlit as st
 import psutil
-import time
-from graph import app, config, process_response
-from langgraph.types import Command
+from graph import app
+from knolege_agent import answer_cache_stats, warm_up
+from sessions import SessionManager, pending_question
+
+# Build the RAG stack in the background so the first knowledge query
+# doesn't pay for it; other routes never need it.
+if os.getenv("KNOWLEDGE_WARMUP") == "1":
+    warm_up()
+
+@st.cache_resource
+def get_session_manager() -> SessionManager:
+    """One manager per server process, shared by all browser sessions."""
+    return SessionManager(app)
+
+
+sessions = get_session_manager()
 
 # Page config
 st.set_page_config(
@@ -20,8 +34,8 @@ if "waiting_for_input" not in st.session_state:
     st.session_state.waiting_for_input = False
 if "interrupt_question" not in st.session_state:
     st.session_state.interrupt_question = None
-if "thread_id" not in st.session_state:
-    st.session_state.thread_id = f"streamlit-{int(time.time())}"
+if "session_id" not in st.session_state:
+    st.session_state.session_id = sessions.create()
 if "booking_state" not in st.session_state:
     st.session_state.booking_state = {
         "user_id": "",
@@ -30,9 +44,6 @@ if "booking_state" not in st.session_state:
         "date": ""
     }
 
-# Update config with session thread_id
-config["configurable"]["thread_id"] = st.session_state.thread_id
-
 
 def get_machine_resources():
     """Get current machine resource usage."""
@@ -53,9 +64,8 @@ def get_machine_resources():
 
 def process_graph_response(result):
     """Process graph response and handle interrupts."""
-    if "__interrupt__" in result:
-        intr = result["__interrupt__"][0]
-        question = intr.value.get("question", "No question provided.")
+    question = pending_question(result)
+    if question is not None:
         st.session_state.interrupt_question = question
         st.session_state.waiting_for_input = True
         return None
@@ -85,6 +95,17 @@ with st.sidebar:
     
     st.divider()
     
+    cache_stats = answer_cache_stats()
+    if cache_stats:
+        st.header("⚡ Answer Cache")
+        st.metric("Hit Rate", f"{cache_stats['hit_rate'] * 100:.1f}%")
+        st.caption(
+            f"{cache_stats['exact_hits']} exact / {cache_stats['semantic_hits']} similar hits, "
+            f"{cache_stats['misses']} misses, {cache_stats['saved_seconds']:.1f}s saved"
+        )
+
+        st.divider()
+
     if st.button("🔄 Refresh Resources"):
         st.rerun()
     
@@ -95,8 +116,8 @@ with st.sidebar:
         st.session_state.current_result = None
         st.session_state.waiting_for_input = False
         st.session_state.interrupt_question = None
-        st.session_state.thread_id = f"streamlit-{int(time.time())}"
-        config["configurable"]["thread_id"] = st.session_state.thread_id
+        sessions.reset(st.session_state.session_id)
+        st.session_state.session_id = sessions.create()
         st.rerun()
 
 
@@ -134,10 +155,7 @@ if st.session_state.waiting_for_input and st.session_state.interrupt_question:
             if user_response:
                 # Resume the graph with user input
                 try:
-                    result = app.invoke(
-                        Command(resume=user_response),
-                        config=config
-                    )
+                    result = sessions.resume(st.session_state.session_id, user_response)
                     st.session_state.current_result = result
                     
                     # Add interrupt question and response to history
@@ -182,18 +200,11 @@ if not st.session_state.waiting_for_input:
             # Add user query to history
             st.session_state.conversation_history.append(("user", user_query))
             
-            # Prepare initial state
-            initial_state = {
-                "query": user_query,
-                "responce": "",
-                "ans": "",
-                "booking": st.session_state.booking_state.copy()
-            }
-            
-            # Invoke the graph
-            with st.spinner("🤔 Processing your query..."):
+            # Stream the answer into the chat as the LLM generates it
+            with st.chat_message("assistant"):
                 try:
-                    result = app.invoke(initial_state, config=config)
+                    result = {}
+                    st.write_stream(sessions.stream(st.session_state.session_id, user_query, result))
                     st.session_state.current_result = result
                     
                     # Process the result
@@ -0,0 +1,85 @@
+from datetime import date
+
+import pytest
+
+from booking_parser import parse_booking_text
+
+# A Wednesday.
+TODAY = date(2025, 3, 12)
+
+
+def parse(text):
+    return parse_booking_text(text, today=TODAY)
+
+
+@pytest.mark.parametrize(
+    "text, fields",
+    [
+        ("2025-04-01 from 14:00 to 16:00", {"date": "2025-04-01", "start_time": "14:00", "end_time": "16:00"}),
+        ("15 March 2pm to 4pm", {"date": "2025-03-15", "start_time": "14:00", "end_time": "16:00"}),
+        ("March 15th, 2026 at 6pm", {"date": "2026-03-15", "start_time": "18:00"}),
+        ("on the 2nd of jan. at noon", {"date": "2026-01-02", "start_time": "12:00"}),
+        ("sept 3 at 07:30", {"date": "2025-09-03", "start_time": "07:30"}),
+        ("from 10am to noon", {"start_time": "10:00", "end_time": "12:00"}),
+        ("9:30-14:00", {"start_time": "09:30", "end_time": "14:00"}),
+        ("tomorrow 11 to 1pm", {"date": "2025-03-13", "start_time": "11:00", "end_time": "13:00"}),
+        ("day after tomorrow at 6pm for 2 hours", {"date": "2025-03-14", "start_time": "18:00", "end_time": "20:00"}),
+        ("in 3 days at 9am", {"date": "2025-03-15", "start_time": "09:00"}),
+        ("next wednesday 18:00-19:30", {"date": "2025-03-19", "start_time": "18:00", "end_time": "19:30"}),
+        ("friday 14 march at 5pm", {"date": "2025-03-14", "start_time": "17:00"}),
+    ],
+)
+def test_parses_dates_and_times(text, fields):
+    assert parse(text) == (fields, False)
+
+
+def test_parses_repeats():
+    fields, unresolved = parse("every tuesday for 6 weeks at 6pm for 1 hour")
+    assert fields == {
+        "repeat_every_days": 7,
+        "date": "2025-03-18",
+        "repeat_until": "2025-04-29",
+        "start_time": "18:00",
+        "end_time": "19:00",
+    }
+    assert not unresolved
+    assert parse("every day until 30 June starting tomorrow 7am to 8am")[0] == {
+        "repeat_every_days": 1,
+        "repeat_until": "2025-06-30",
+        "date": "2025-03-13",
+        "start_time": "07:00",
+        "end_time": "08:00",
+    }
+
+
+@pytest.mark.parametrize("text", ["5 junior players", "two decades 4 the club", "a marathon 10 km"])
+def test_words_starting_like_months_are_not_dates(text):
+    assert "date" not in parse(text)[0]
+
+
+@pytest.mark.parametrize("text", ["tomorrow or next friday at 6pm", "2025-04-01, I mean 2025-04-02", "31 February at 6pm"])
+def test_conflicting_or_invalid_dates_stay_unresolved(text):
+    fields, unresolved = parse(text)
+    assert "date" not in fields
+    assert unresolved
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["at 8 tomorrow", "at 4", "from 2 to 4 on friday", "sept 3 at 7:30", "at 12:30", "from 10:00 to 11:30"],
+)
+def test_ambiguous_hours_stay_unresolved(text):
+    fields, unresolved = parse(text)
+    assert "start_time" not in fields
+    assert unresolved
+
+
+@pytest.mark.parametrize("text", ["tomorrow 10pm to 1am", "10pm to midnight", "5 to 5pm", "14:00-9:30"])
+def test_ranges_that_do_not_end_after_they_start_stay_unresolved(text):
+    fields, unresolved = parse(text)
+    assert "start_time" not in fields and "end_time" not in fields
+    assert unresolved
+
+
+def test_nothing_to_parse():
+    assert parse("yes please") == ({}, False)
@@ -0,0 +1,141 @@
+import random
+import threading
+
+import pytest
+
+from booking_store import CsvBookingStore, DayIndex, SqliteBookingStore, read_bookings
+
+
+def booking(date, start, end, user_id="u1"):
+    return {"user_id": user_id, "date": date, "start_time": start, "end_time": end}
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "csv":
+        return CsvBookingStore(str(tmp_path / "bookings.csv"))
+    return SqliteBookingStore(str(tmp_path / "bookings.db"))
+
+
+def test_day_index_matches_a_linear_scan():
+    rng = random.Random(7)
+    for _ in range(200):
+        intervals = []
+        day = DayIndex()
+        for _ in range(rng.randint(0, 8)):
+            start = rng.randint(0, 1400)
+            interval = (start, start + rng.randint(1, 180))
+            intervals.append(interval)
+            day.add(*interval)
+        start = rng.randint(0, 1400)
+        end = start + rng.randint(1, 180)
+        assert day.overlaps(start, end) == any(s < end and start < e for s, e in intervals)
+        assert DayIndex.from_intervals(intervals).overlaps(start, end) == day.overlaps(start, end)
+
+
+def test_overlapping_bookings_are_refused(store):
+    assert store.book(booking("2025-06-01", "10:00", "12:00"))
+    assert not store.book(booking("2025-06-01", "11:00", "13:00", "u2"))
+    assert not store.book(booking("2025-06-01", "09:00", "10:30", "u2"))
+    assert not store.book(booking("2025-06-01", "10:30", "11:00", "u2"))
+    assert store.book(booking("2025-06-01", "12:00", "13:00", "u2"))
+    assert store.book(booking("2025-06-01", "08:00", "10:00", "u2"))
+    assert store.book(booking("2025-06-02", "10:00", "12:00", "u2"))
+    assert list(store.intervals("2025-06-01")) == [(480, 600), (600, 720), (720, 780)]
+    assert [b["date"] for b in store.bookings_for_user("u2")] == ["2025-06-01", "2025-06-01", "2025-06-02"]
+
+
+def test_is_available_does_not_book(store):
+    assert store.is_available(booking("2025-06-01", "10:00", "11:00"))
+    assert store.is_available(booking("2025-06-01", "10:00", "11:00"))
+    assert store.book(booking("2025-06-01", "10:00", "11:00"))
+    assert not store.is_available(booking("2025-06-01", "10:59", "11:30"))
+
+
+def test_csv_store_reloads_its_index(tmp_path):
+    path = str(tmp_path / "bookings.csv")
+    CsvBookingStore(path).book(booking("2025-06-01", "10:00", "12:00"))
+    reloaded = CsvBookingStore(path)
+    assert not reloaded.book(booking("2025-06-01", "11:00", "11:30", "u2"))
+    assert read_bookings(path) == [booking("2025-06-01", "10:00", "12:00")]
+
+
+def test_sqlite_store_books_each_slot_once_across_threads(tmp_path):
+    path = str(tmp_path / "bookings.db")
+    SqliteBookingStore(path)
+    results = []
+
+    def worker(user_id):
+        # A store per thread, like separate worker processes sharing the file.
+        results.append(SqliteBookingStore(path).book(booking("2025-06-01", "18:00", "19:00", user_id)))
+
+    threads = [threading.Thread(target=worker, args=(f"u{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 1
+
+
+def test_sqlite_store_imports_and_exports_csv(tmp_path):
+    csv_path = str(tmp_path / "bookings.csv")
+    CsvBookingStore(csv_path).book(booking("2025-06-01", "10:00", "12:00"))
+    store = SqliteBookingStore(str(tmp_path / "bookings.db"), import_csv=csv_path)
+    assert not store.is_available(booking("2025-06-01", "11:00", "11:30"))
+    assert store.export_csv(str(tmp_path / "export.csv")) == 1
+    assert read_bookings(str(tmp_path / "export.csv")) == read_bookings(csv_path)
+
+
+def test_holds_only_the_users_exact_slot(store):
+    assert store.book(booking("2025-06-01", "10:00", "12:00"))
+    assert store.holds(booking("2025-06-01", "10:00", "12:00"))
+    assert not store.holds(booking("2025-06-01", "10:00", "12:00", "u2"))
+    assert not store.holds(booking("2025-06-01", "10:00", "11:00"))
+
+
+def test_book_many_sweeps_the_batch_against_the_store_and_itself(store):
+    assert store.book(booking("2025-06-01", "10:00", "11:00"))
+    batch = [
+        booking("2025-06-01", "12:00", "13:00", "u2"),
+        booking("2025-06-01", "10:30", "11:30", "u2"),
+        booking("2025-06-02", "09:00", "10:00", "u3"),
+        booking("2025-06-01", "12:30", "14:00", "u3"),
+        booking("2025-06-01", "11:00", "12:00", "u3"),
+    ]
+
+    failures = store.book_many(batch)
+    assert failures == {
+        1: "conflicts with an existing booking",
+        3: "overlaps 12:00-13:00 on 2025-06-01 in the same batch",
+    }
+    assert store.is_available(booking("2025-06-02", "09:00", "10:00"))
+
+    assert store.book_many(batch, atomic=False) == failures
+    assert list(store.intervals("2025-06-01")) == [(600, 660), (660, 720), (720, 780)]
+    assert not store.is_available(booking("2025-06-02", "09:30", "09:45"))
+    assert store.book_many([]) == {}
+
+
+@pytest.mark.parametrize(
+    "start, end, error",
+    [("22:00", "01:00", "end_time must be after start_time"), ("12:00", "12:00", "end_time must be after start_time"),
+     ("9am", "10:00", "invalid time")],
+)
+def test_invalid_bookings_are_refused(store, start, end, error):
+    with pytest.raises(ValueError, match=error):
+        store.book(booking("2025-06-01", start, end))
+    # The refused booking must not block a later valid one.
+    assert store.book(booking("2025-06-01", "22:30", "23:30"))
+
+
+def test_book_many_reports_invalid_bookings(store):
+    batch = [
+        booking("2025-06-01", "22:00", "01:00"),
+        booking("2025-06-01", "22:30", "23:30", "u2"),
+        {"user_id": "u3", "date": "2025-06-01", "start_time": "08:00"},
+    ]
+    assert store.book_many(batch) == {0: "end_time must be after start_time", 2: "missing end_time"}
+    assert store.is_available(booking("2025-06-01", "22:30", "23:30"))
+    assert store.book_many(batch, atomic=False) == {0: "end_time must be after start_time", 2: "missing end_time"}
+    assert list(store.intervals("2025-06-01")) == [(1350, 1410)]
+    assert store.book_many([batch[0]]) == {0: "end_time must be after start_time"}
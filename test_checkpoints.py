@@ -0,0 +1,74 @@
+import os
+import sqlite3
+from typing import TypedDict
+
+from langgraph.graph import END, START, StateGraph
+
+from checkpoints import CompressedSerializer, PrunedSqliteSaver
+
+
+class CounterState(TypedDict):
+    count: int
+    note: str
+
+
+def counter_app(saver):
+    builder = StateGraph(CounterState)
+    builder.add_node("increment", lambda state: {"count": state["count"] + 1})
+    builder.add_edge(START, "increment")
+    builder.add_edge("increment", END)
+    return builder.compile(checkpointer=saver)
+
+
+def config(thread_id):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def test_compressed_serializer_round_trip():
+    serde = CompressedSerializer(min_size=64)
+    small = {"count": 1}
+    large = {"note": "the same words again " * 50}
+    assert not serde.dumps_typed(small)[0].endswith(CompressedSerializer.SUFFIX)
+    type_, payload = serde.dumps_typed(large)
+    assert type_.endswith(CompressedSerializer.SUFFIX) and len(payload) < len(large["note"])
+    assert serde.loads_typed(serde.dumps_typed(small)) == small
+    assert serde.loads_typed((type_, payload)) == large
+    # Payloads written without compression still load.
+    assert serde.loads_typed(serde.serde.dumps_typed(large)) == large
+
+
+def test_database_is_opened_on_first_use(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    app = counter_app(PrunedSqliteSaver.from_path(path))
+    assert not os.path.exists(path)
+    assert app.invoke({"count": 0, "note": ""}, config("t1"))["count"] == 1
+    assert os.path.exists(path)
+    assert counter_app(PrunedSqliteSaver.from_path(path)).get_state(config("t1")).values["count"] == 1
+
+
+def test_history_is_trimmed_per_thread(tmp_path):
+    saver = PrunedSqliteSaver.from_path(str(tmp_path / "checkpoints.sqlite"), max_history=3)
+    app = counter_app(saver)
+    for _ in range(5):
+        state = app.get_state(config("t1")).values or {"count": 0, "note": ""}
+        app.invoke(state, config("t1"))
+    app.invoke({"count": 0, "note": ""}, config("t2"))
+
+    assert len(list(saver.list(config("t1")))) == 3
+    assert len(list(saver.list(config("t2")))) == 3
+    assert app.get_state(config("t1")).values["count"] == 5
+
+
+def test_idle_threads_are_pruned(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    saver = PrunedSqliteSaver.from_path(path, ttl=3600)
+    app = counter_app(saver)
+    app.invoke({"count": 0, "note": ""}, config("old"))
+    app.invoke({"count": 0, "note": ""}, config("new"))
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE thread_activity SET updated_at = updated_at - 7200 WHERE thread_id = 'old'")
+
+    assert saver.prune() == 1
+    assert list(saver.list(config("old"))) == []
+    assert app.get_state(config("new")).values["count"] == 1
+    assert saver.prune() == 0
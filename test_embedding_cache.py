@@ -0,0 +1,90 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings
+from llm_cache import CacheMiss
+
+
+class CountingEmbeddings(Embeddings):
+    """Embeds queries and documents differently and records every call."""
+
+    model = "counting"
+
+    def __init__(self):
+        self.documents = []
+        self.queries = []
+
+    def embed_documents(self, texts):
+        self.documents.extend(texts)
+        return [[len(text), 0.1, -2.5] for text in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [len(text), 1.0, 0.0]
+
+
+@pytest.fixture
+def underlying():
+    return CountingEmbeddings()
+
+
+def cached(underlying, tmp_path, **kwargs):
+    kwargs.setdefault("replay_only", False)
+    return CachedEmbeddings(underlying, path=str(tmp_path / "embeddings.sqlite"), **kwargs)
+
+
+def test_hits_and_misses(underlying, tmp_path):
+    cache = cached(underlying, tmp_path)
+    assert cache.embed_documents(["alpha"]) == [[5.0, pytest.approx(0.1), -2.5]]
+    assert cache.embed_documents(["alpha"]) == [[5.0, pytest.approx(0.1), -2.5]]
+    assert underlying.documents == ["alpha"]
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+
+def test_batches_only_embed_the_missing_texts(underlying, tmp_path):
+    cache = cached(underlying, tmp_path)
+    cache.embed_documents(["a", "bb"])
+    vectors = cache.embed_documents(["bb", "ccc", "a", "ccc"])
+    assert underlying.documents == ["a", "bb", "ccc"]
+    assert [v[0] for v in vectors] == [2.0, 3.0, 1.0, 3.0]
+    assert cache.stats()["entries"] == 3
+
+
+def test_vectors_survive_a_reopen_as_float32(underlying, tmp_path):
+    cached(underlying, tmp_path).embed_documents(["alpha"])
+    reopened = cached(CountingEmbeddings(), tmp_path, replay_only=True)
+    vector = reopened.embed_documents(["alpha"])[0]
+    # Stored as float32, so 0.1 comes back with float32 precision.
+    assert vector[0] == 5.0 and vector[2] == -2.5
+    assert vector[1] != 0.1 and vector[1] == pytest.approx(0.1, rel=1e-7)
+
+
+def test_queries_and_documents_are_cached_separately(underlying, tmp_path):
+    cache = cached(underlying, tmp_path)
+    document = cache.embed_documents(["same text"])[0]
+    query = cache.embed_query("same text")
+    assert query == [9.0, 1.0, 0.0] and query != document
+    assert cache.embed_queries(["same text", "other"]) == [query, [5.0, 1.0, 0.0]]
+    assert underlying.queries == ["same text", "other"]
+    assert cache.embed_documents(["same text"])[0] == pytest.approx(document)
+    assert underlying.documents == ["same text"]
+
+
+def test_evicts_the_least_recently_used(underlying, tmp_path):
+    cache = cached(underlying, tmp_path, max_entries=2)
+    cache.embed_documents(["a"])
+    cache.embed_documents(["bb"])
+    cache.embed_documents(["a"])
+    cache.embed_documents(["ccc"])
+    assert cache.stats()["entries"] == 2
+    cache.embed_documents(["a", "ccc"])
+    assert underlying.documents == ["a", "bb", "ccc"]
+
+
+def test_replay_only_raises_on_a_miss(underlying, tmp_path):
+    cache = cached(underlying, tmp_path, replay_only=True)
+    with pytest.raises(CacheMiss):
+        cache.embed_documents(["alpha"])
+    with pytest.raises(CacheMiss):
+        cache.embed_query("alpha")
+    assert underlying.documents == [] and underlying.queries == []
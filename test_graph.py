@@ -0,0 +1,69 @@
+import pytest
+from langchain_core.globals import get_llm_cache, set_llm_cache
+
+import benchmark
+from sessions import SessionManager, pending_question
+
+
+@pytest.fixture(scope="module")
+def graph(tmp_path_factory):
+    # The offline fakes from benchmark.py, with every store in a temp dir.
+    with pytest.MonkeyPatch.context() as mp:
+        for name in ("BOOKING_DB", "CHECKPOINT_DB", "LLM_CACHE_MODE", "LLM_CACHE_PATH"):
+            mp.delenv(name, raising=False)
+        cache = get_llm_cache()
+        graph = benchmark.load_app(str(tmp_path_factory.mktemp("graph")), 0.0, 0.0, 50)
+        # llm_cache may already have been imported with the default path.
+        set_llm_cache(None)
+        yield graph
+        set_llm_cache(cache)
+
+
+def test_run_batch_answers_each_route(graph):
+    results = graph.run_batch(["what is 2 + 3", "what is the rating of model 1?", "book the ground tomorrow at 6pm"])
+    assert [(r["route"], r["status"]) for r in results] == [
+        ("math", "ok"), ("knowledge", "ok"), ("ground", "needs_session"),
+    ]
+    assert results[0]["responce"] == "5"
+    assert results[1]["responce"].startswith("Based on the context")
+    assert graph.run_batch([]) == []
+
+
+def test_stream_yields_the_answer_and_fills_the_final_state(graph):
+    sessions = SessionManager(graph.app)
+    final = {}
+    chunks = list(sessions.stream("s1", "what is the rating of model 1?", final))
+    assert "".join(chunks) == final["responce"] and chunks
+    assert final["route"] == "knowledge"
+
+
+def test_booking_interrupts_until_the_slot_is_given(graph):
+    sessions = SessionManager(graph.app)
+    assert "Please provide" in pending_question(sessions.ask("s2", "book the ground", user_id="42"))
+
+
+def test_invalid_booking_is_sent_back_instead_of_saved(graph):
+    import ground_book
+
+    booking = ground_book.save_booking_to_csv(
+        {"user_id": "42", "date": "2030-01-01", "start_time": "22:00", "end_time": "01:00"}
+    )
+    assert booking["status"] == "" and "end_time must be after start_time" in booking["message"]
+    booking = ground_book.save_booking_to_csv(
+        {"user_id": "42", "date": "2030-01-01", "start_time": "22:30", "end_time": "23:30"}
+    )
+    assert booking["status"] == "Booking confirmed"
+
+
+def test_llm_extraction_wins_over_a_partial_local_parse(graph):
+    import ground_book
+
+    previous = {"user_id": "42", "date": "2030-01-01"}
+    parsed = {"start_time": "10:00", "repeat_every_days": 7}
+    merged = ground_book._merge_extraction(
+        '{"start_time": "22:00", "end_time": "23:00", "date": "not a date"}', previous, parsed, {**previous, **parsed}
+    )
+    assert merged == {
+        "user_id": "42", "date": "2030-01-01", "start_time": "22:00", "end_time": "23:00", "repeat_every_days": 7,
+    }
+    assert ground_book._merge_extraction("not json", previous, parsed, {"fallback": True}) == {"fallback": True}
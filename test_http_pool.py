@@ -0,0 +1,43 @@
+import asyncio
+
+import httpx
+
+import http_pool
+
+
+def test_each_event_loop_gets_its_own_semaphore():
+    async def slot():
+        async with http_pool.llm_slot():
+            return http_pool._loop_semaphores[asyncio.get_running_loop()]
+
+    async def twice():
+        return await slot(), await slot()
+
+    first, again = asyncio.run(twice())
+    assert first is again
+    assert asyncio.run(slot()) is not first
+
+
+def test_the_shared_async_client_uses_the_running_loops_pool():
+    client = http_pool.get_async_http_client()
+    assert client is http_pool.get_async_http_client()
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.path)
+        return httpx.Response(200, json={"ok": True})
+
+    async def request(path):
+        loop_client = http_pool._loop_client()
+        assert loop_client is http_pool._loop_client()
+        # Swap the loop's pool for a mock transport.
+        http_pool._loop_clients[asyncio.get_running_loop()] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        await loop_client.aclose()
+        response = await client.get(f"http://api.test{path}")
+        return response.json(), loop_client
+
+    first, first_pool = asyncio.run(request("/one"))
+    second, second_pool = asyncio.run(request("/two"))
+    assert first == second == {"ok": True}
+    assert seen == ["/one", "/two"]
+    assert first_pool is not second_pool
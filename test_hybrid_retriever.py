@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import hybrid_retriever
+from hybrid_retriever import BM25Index, HybridRetriever, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "The M4 chip has a ten core CPU",
+    "MagSafe charging and two USB-C ports",
+    "A 13.6 inch Liquid Retina display",
+    "Battery life of up to 18 hours of video playback on battery power",
+]
+
+
+class GatedEmbeddings(Embeddings):
+    """Bag-of-letters vectors; embed_query waits while the gate is closed."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def _vector(self, text):
+        return [text.lower().count(c) + 0.01 for c in "abcdefghijklmnopqrstuvwxyz0123456789"]
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.gate.wait()
+        return self._vector(text)
+
+
+@pytest.fixture
+def retriever():
+    embeddings = GatedEmbeddings()
+    vectorstore = FAISS.from_texts(TEXTS, embeddings, ids=[f"doc-{i}" for i in range(len(TEXTS))])
+    retriever = HybridRetriever.from_vectorstore(vectorstore, k=2, dense_timeout=0.05)
+    yield retriever
+    embeddings.gate.set()
+
+
+def test_tokenize_keeps_spec_tokens_whole():
+    assert tokenize("USB-C ports, 13.6 inch M4!") == ["usb-c", "ports", "13.6", "inch", "m4"]
+
+
+def test_bm25_scores_rare_terms_higher_and_follows_removals():
+    index = BM25Index()
+    for i, text in enumerate(TEXTS):
+        index.add(f"doc-{i}", Document(page_content=text, id=f"doc-{i}"))
+    assert index.idf("magsafe") > index.idf("a") > 0 and index.idf("unknown") == 0.0
+
+    results = index.search("battery magsafe", k=4)
+    assert [doc.id for doc, _ in results] == ["doc-3", "doc-1"]
+    # doc-3 mentions battery twice, but tf saturates and its length is penalised.
+    assert results[0][1] < 2 * results[1][1]
+    assert index.search("no such words") == []
+
+    index.remove("doc-3")
+    assert [doc.id for doc, _ in index.search("battery magsafe")] == ["doc-1"]
+    assert index.total_length == sum(index.doc_lengths.values())
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    a, b, c = (Document(page_content=t, id=t) for t in "abc")
+    assert reciprocal_rank_fusion([[a, b, c], [c, b]], k=1) == [c, b, a]
+    assert reciprocal_rank_fusion([[a], []]) == [a]
+
+
+def test_fuses_dense_and_lexical_results(retriever):
+    documents = retriever.invoke("M4 chip CPU")
+    assert documents[0].page_content == TEXTS[0]
+    assert len(documents) == 2
+
+
+def test_dense_timeout_falls_back_to_lexical_results(retriever):
+    retriever.vectorstore.embeddings.gate.clear()
+    started = time.perf_counter()
+    documents = retriever.invoke("USB-C MagSafe")
+    assert time.perf_counter() - started < 1
+    assert [document.page_content for document in documents] == [TEXTS[1]]
+
+
+def test_stuck_dense_searches_do_not_pile_up(retriever):
+    gate = retriever.vectorstore.embeddings.gate
+    gate.clear()
+    for _ in range(hybrid_retriever.DENSE_WORKERS + 3):
+        assert [d.page_content for d in retriever.invoke("USB-C MagSafe")] == [TEXTS[1]]
+    # Only DENSE_WORKERS searches were ever submitted, and all are stuck.
+    assert hybrid_retriever._dense_executor._work_queue.qsize() == 0
+    assert not hybrid_retriever._dense_slots.acquire(blocking=False)
+
+    gate.set()
+    deadline = time.monotonic() + 5
+    while hybrid_retriever._dense_slots._value < hybrid_retriever.DENSE_WORKERS:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert retriever.invoke("M4 chip CPU")[0].page_content == TEXTS[0]
+
+
+def test_batch_retrieve_matches_invoke(retriever):
+    queries = ["M4 chip CPU", "battery life", "display inch"]
+    assert retriever.batch_retrieve(queries) == [retriever.invoke(query) for query in queries]
@@ -0,0 +1,147 @@
+import hashlib
+import os
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from ingest import IngestionPipeline
+
+SETTINGS = {"chunk_size": 200, "chunk_overlap": 0, "embedding_model": "test"}
+
+
+def write_pdf(path, text):
+    """Write a one-page PDF whose page shows text (enough for PyPDFLoader)."""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R"
+        b" /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(bytes(out))
+
+
+class FlakyEmbeddings(Embeddings):
+    """Deterministic embeddings whose embed_documents can be made to fail."""
+
+    def __init__(self):
+        self.fail = False
+
+    def _vector(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return (np.frombuffer(digest, dtype=np.uint8)[:16] / 255.0).tolist()
+
+    def embed_documents(self, texts):
+        if self.fail:
+            raise RuntimeError("embedding API down")
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write_pdf(docs / "a.pdf", "The M4 chip has a ten core CPU")
+    pipeline = IngestionPipeline(str(docs), FlakyEmbeddings(), SETTINGS, root=str(tmp_path / "index"))
+    pipeline.sync()
+    return pipeline
+
+
+def test_failed_sync_changes_nothing_and_is_retried(pipeline):
+    indexed = pipeline.vectorstore.index.ntotal
+    version = pipeline.version
+    write_pdf(os.path.join(pipeline.docs_dir, "b.pdf"), "MagSafe charging and two USB-C ports")
+
+    pipeline.embeddings.fail = True
+    with pytest.raises(RuntimeError):
+        pipeline.sync()
+    assert "b.pdf" not in pipeline.manifest["files"]
+    assert pipeline.vectorstore.index.ntotal == indexed
+    assert pipeline.version == version
+
+    pipeline.embeddings.fail = False
+    summary = pipeline.sync()
+    assert summary["added"] == 1 and summary["chunks"] > 0
+    assert pipeline.vectorstore.index.ntotal == indexed + summary["chunks"]
+    assert set(pipeline.manifest["files"]["b.pdf"]["ids"]) <= set(pipeline.vectorstore.index_to_docstore_id.values())
+
+
+def test_changed_and_removed_files_replace_their_chunks(pipeline):
+    old_ids = pipeline.manifest["files"]["a.pdf"]["ids"]
+    path = os.path.join(pipeline.docs_dir, "a.pdf")
+    write_pdf(path, "The M4 chip has a twelve core CPU and more")
+    assert pipeline.sync()["changed"] == 1
+    indexed = set(pipeline.vectorstore.index_to_docstore_id.values())
+    assert not indexed & set(old_ids)
+    assert indexed == set(pipeline.manifest["files"]["a.pdf"]["ids"])
+
+    os.remove(path)
+    assert pipeline.sync()["removed"] == 1
+    assert pipeline.vectorstore.index.ntotal == 0
+    assert pipeline.manifest["files"] == {}
+
+
+def test_stale_ids_missing_from_the_index_do_not_block_removal(pipeline):
+    # A manifest written by an older, non-atomic sync may list ids that
+    # were never indexed.
+    pipeline.manifest["files"]["a.pdf"]["ids"].append("a.pdf#never-indexed#99")
+    os.remove(os.path.join(pipeline.docs_dir, "a.pdf"))
+    assert pipeline.sync()["removed"] == 1
+    assert pipeline.vectorstore.index.ntotal == 0
+
+
+def test_sync_embeds_in_batches_without_touching_the_live_index(pipeline, monkeypatch):
+    monkeypatch.setattr("ingest.EMBED_BATCH_SIZE", 1)
+    batches = []
+    embed_documents = pipeline.embeddings.embed_documents
+
+    def recording(texts):
+        # The live index must not change while chunks are still being embedded.
+        batches.append((len(texts), pipeline.vectorstore.index.ntotal))
+        return embed_documents(texts)
+
+    monkeypatch.setattr(pipeline.embeddings, "embed_documents", recording)
+    indexed = pipeline.vectorstore.index.ntotal
+    write_pdf(os.path.join(pipeline.docs_dir, "b.pdf"), "MagSafe charging and two USB-C ports")
+    write_pdf(os.path.join(pipeline.docs_dir, "c.pdf"), "A Liquid Retina XDR display")
+    summary = pipeline.sync()
+    assert summary["chunks"] == len(batches) == 2
+    assert batches == [(1, indexed), (1, indexed)]
+    assert pipeline.vectorstore.index.ntotal == indexed + 2
+
+
+def test_touched_files_are_not_rehashed_and_detection_does_not_mutate(pipeline, monkeypatch):
+    path = os.path.join(pipeline.docs_dir, "a.pdf")
+    record = dict(pipeline.manifest["files"]["a.pdf"])
+    os.utime(path, (record["mtime"] + 10, record["mtime"] + 10))
+
+    added, changed, removed, touched = pipeline.detect_changes()
+    assert (added, changed, removed) == ({}, {}, [])
+    assert touched == {"a.pdf": (record["mtime"] + 10, record["size"])}
+    assert pipeline.manifest["files"]["a.pdf"] == record
+
+    version = pipeline.version
+    assert pipeline.sync() == {"added": 0, "changed": 0, "removed": 0, "chunks": 0}
+    assert pipeline.version == version
+    reloaded = IngestionPipeline(pipeline.docs_dir, pipeline.embeddings, SETTINGS, root=os.path.dirname(pipeline.index_dir))
+    reloaded.load()
+    assert reloaded.manifest["files"]["a.pdf"]["mtime"] == record["mtime"] + 10
+
+    monkeypatch.setattr("ingest.file_sha256", lambda path: pytest.fail("rehashed an unchanged file"))
+    assert reloaded.detect_changes() == ({}, {}, [], {})
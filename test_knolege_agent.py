@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.language_models import FakeListChatModel
+
+import knolege_agent
+
+LAZY_GLOBALS = ["_llm", "_embeddings", "_vectorstore", "_retriever", "_rag_chain", "_answer_cache", "_index_version"]
+
+
+@pytest.fixture(autouse=True)
+def fresh_factories(monkeypatch):
+    # monkeypatch restores whatever the module held before the test.
+    for name in LAZY_GLOBALS:
+        monkeypatch.setattr(knolege_agent, name, None)
+    monkeypatch.setattr(knolege_agent, "pipeline", None)
+    # Keep the fake model's answers out of the on-disk LLM cache.
+    cache = get_llm_cache()
+    set_llm_cache(None)
+    yield
+    set_llm_cache(cache)
+
+
+def test_factories_build_one_instance_across_threads(monkeypatch):
+    built = []
+
+    class SlowChatOpenAI:
+        def __init__(self, **kwargs):
+            time.sleep(0.05)
+            built.append(self)
+
+    monkeypatch.setattr(knolege_agent, "ChatOpenAI", SlowChatOpenAI)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(knolege_agent.get_llm())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(built) == 1
+    assert all(result is built[0] for result in results)
+
+
+def test_use_models_rebuilds_what_depends_on_them():
+    embeddings = DeterministicFakeEmbedding(size=8)
+    vectorstore = FAISS.from_texts(["The M4 chip has a ten core CPU", "MagSafe charging"], embeddings)
+    knolege_agent.use_models(
+        llm=FakeListChatModel(responses=["ten cores", "still ten"]),
+        embeddings=embeddings,
+        vectorstore=vectorstore,
+        version="v1",
+    )
+    assert knolege_agent.index_version() == "v1"
+    assert knolege_agent.get_vectorstore() is vectorstore
+    assert knolege_agent.get_answer_cache().embeddings is embeddings
+    chain = knolege_agent.get_rag_chain()
+    assert chain.invoke("How many CPU cores?") == "ten cores"
+    retriever = knolege_agent.get_retriever()
+
+    knolege_agent.use_models(llm=FakeListChatModel(responses=["twelve cores"]))
+    assert knolege_agent.get_vectorstore() is vectorstore
+    assert knolege_agent.get_retriever() is not retriever
+    assert knolege_agent.get_rag_chain() is not chain
+    assert knolege_agent.get_rag_chain().invoke("How many CPU cores?") == "twelve cores"
+
+
+def test_lazy_module_attributes():
+    knolege_agent.use_models(vectorstore=FAISS.from_texts(["x"], DeterministicFakeEmbedding(size=4)))
+    assert knolege_agent.vectorstore is knolege_agent.get_vectorstore()
+    with pytest.raises(AttributeError):
+        knolege_agent.no_such_thing
@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration
+
+import llm_cache
+from llm_cache import CacheMiss, DiskLLMCache, ResponseStore, request_key
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResponseStore(path=str(tmp_path / "llm_cache.sqlite"))
+
+
+def prompt(*messages):
+    return dumps(list(messages))
+
+
+def test_request_key_ignores_whitespace_only():
+    assert request_key(model="m", prompt="what  is\n 2+2") == request_key(model="m", prompt="what is 2+2")
+    assert request_key(model="m", prompt="what is 2+2") != request_key(model="m", prompt="what is 2+3")
+    # An "id" is part of the request unless it is a known volatile field.
+    assert request_key(tools=[{"id": "a"}]) != request_key(tools=[{"id": "b"}])
+
+
+def test_message_ids_do_not_change_the_key():
+    first = prompt(HumanMessage("hello", id="run-1"))
+    second = prompt(HumanMessage("hello", id="run-2"))
+    assert DiskLLMCache._key(first, "llm") == DiskLLMCache._key(second, "llm")
+
+
+def test_message_type_and_tool_call_ids_change_the_key():
+    # The serialised class path is also stored under "id".
+    assert DiskLLMCache._key(prompt(HumanMessage("hello")), "llm") != DiskLLMCache._key(
+        prompt(SystemMessage("hello")), "llm"
+    )
+    calls = [
+        prompt(AIMessage("", tool_calls=[{"name": "f", "args": {"id": 1}, "id": call_id}]))
+        for call_id in ("call_1", "call_2")
+    ]
+    assert DiskLLMCache._key(calls[0], "llm") != DiskLLMCache._key(calls[1], "llm")
+
+
+def test_store_hits_misses_and_eviction(store):
+    store.max_entries = 2
+    assert store.get("a") is None
+    store.put("a", "1")
+    store.put("b", "2")
+    assert store.get("a") == "1"
+    store.put("c", "3")
+    assert store.get("b") is None
+    assert store.stats() == {"hits": 1, "misses": 2, "entries": 2}
+
+
+def test_langchain_cache_round_trip(store):
+    cache = DiskLLMCache(store, replay_only=False)
+    request = prompt(HumanMessage("hello", id="run-1"))
+    assert cache.lookup(request, "llm") is None
+    cache.update(request, "llm", [ChatGeneration(message=AIMessage("hi there"))])
+    [generation] = cache.lookup(prompt(HumanMessage("hello", id="run-2")), "llm")
+    assert generation.message.content == "hi there"
+    assert cache.lookup(request, "other llm") is None
+
+
+def test_langchain_cache_replay_raises_on_a_miss(store):
+    cache = DiskLLMCache(store, replay_only=True)
+    with pytest.raises(CacheMiss):
+        cache.lookup(prompt(HumanMessage("hello")), "llm")
+    cache.update(prompt(HumanMessage("hello")), "llm", [ChatGeneration(message=AIMessage("hi"))])
+    assert store.stats()["entries"] == 0
+
+
+class FakeClient:
+    def __init__(self):
+        self.requests = []
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **request):
+        self.requests.append(request)
+        message = SimpleNamespace(content=f"answer {len(self.requests)}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def use_store(store, monkeypatch):
+    monkeypatch.setattr(llm_cache, "_store", store)
+    return store
+
+
+def test_completions_are_off_by_default(use_store, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_MODE", "off")
+    client = FakeClient()
+    request = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+    llm_cache.cached_chat_completion(client, **request)
+    llm_cache.cached_chat_completion(client, **request)
+    assert len(client.requests) == 2
+    assert use_store.stats()["entries"] == 0
+
+
+def test_completions_are_recorded_and_replayed(use_store, monkeypatch):
+    client = FakeClient()
+    request = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_MODE", "on")
+    assert llm_cache.cached_chat_completion(client, **request) == "answer 1"
+    assert llm_cache.cached_chat_completion(client, **request) == "answer 1"
+
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_MODE", "replay")
+    assert llm_cache.cached_chat_completion(client, **request) == "answer 1"
+    with pytest.raises(CacheMiss):
+        llm_cache.cached_chat_completion(client, model="m", messages=[{"role": "user", "content": "bye"}])
+    assert len(client.requests) == 1
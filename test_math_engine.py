@@ -0,0 +1,139 @@
+import math
+import random
+
+import pytest
+
+from math_agent import MIN_VECTOR_GROUP, evaluate_batch, safe_eval_math
+from math_engine import MAX_FACTORIAL, MAX_INT_BITS, MathError, evaluate, extract_expression, format_number
+
+
+@pytest.mark.parametrize(
+    "expression, expected",
+    [
+        ("2 + 3 * 4", 14),
+        ("2^10", 1024),
+        ("7 // 2", 3),
+        ("-7 % 3", 2),
+        ("1,000 * 3", 3000),
+        ("sqrt(16) + abs(-2)", 6.0),
+        ("log(8, 2)", 3.0),
+        ("round(3.14159, 2)", 3.14),
+        ("factorial(5)", 120),
+        ("(2**60 + 1) - 2**60", 1),
+        ("10**-5000", 0.0),
+        ("(-2)**-2", 0.25),
+        ("(-8)**3", -512),
+    ],
+)
+def test_evaluate(expression, expected):
+    assert evaluate(expression) == expected
+
+
+@pytest.mark.parametrize(
+    "expression, error",
+    [
+        ("1 / 0", "Division by zero"),
+        ("9**9**9", "Result is too large"),
+        ("factorial(1000)", "Result is too large"),
+        ("0.5**-5000", "Result is too large"),
+        ("(-1)**0.5", "Result is not a real number"),
+        ("(-8)**(1/3)", "Result is not a real number"),
+        ("1e999", "Result is not a finite number"),
+        ("1e999 - 1e999", "Result is not a finite number"),
+        ("__import__('os')", "Unsupported syntax"),
+        ("().__class__", "Unsupported syntax: Attribute"),
+        ("x + 1", "Unsupported syntax: Name"),
+        ("2 +", "Invalid expression"),
+        ("", "Empty expression"),
+    ],
+)
+def test_evaluate_errors(expression, error):
+    with pytest.raises(MathError, match=error.replace("(", r"\(")):
+        evaluate(expression)
+
+
+def test_factorial_limit_matches_the_bit_limit():
+    assert evaluate(f"factorial({MAX_FACTORIAL})").bit_length() <= MAX_INT_BITS
+    with pytest.raises(MathError, match="Result is too large"):
+        evaluate(f"factorial({MAX_FACTORIAL + 1})")
+
+
+def test_extract_expression_and_format():
+    assert extract_expression("what is 15 + 27?") == "15 + 27"
+    assert extract_expression("I have 3 apples and eat one") is None
+    assert format_number(4.0) == "4"
+    assert format_number(0.5) == "0.5"
+    assert safe_eval_math("1/0") == "Error: Division by zero."
+
+
+def _expected(expression):
+    try:
+        return format_number(evaluate(expression)), None
+    except MathError as e:
+        return None, str(e)
+
+
+def _same(actual, expected):
+    if actual == expected:
+        return True
+    # Transcendental functions may differ between libm and NumPy in the last bit.
+    try:
+        return math.isclose(float(actual), float(expected), rel_tol=1e-12)
+    except (TypeError, ValueError):
+        return False
+
+
+TEMPLATES = [
+    "{a} + {b} * {c}",
+    "{a} * {b} % {c}",
+    "{a} ** {c} - {b}",
+    "({a} - {b}) / {c}",
+    "{a} // {c} + {b} % {c}",
+    "-{a} % {c}",
+    "sqrt({a}) + log({b})",
+    "log({a}, {c})",
+    "round({a}.{b}, {c})",
+    "round({a}.{b})",
+    "min({a}, {b})",
+    "max({a}, {b}, {c})",
+    "min({a})",
+    "sqrt({a}, {c})",
+    "floor({a} / {c}) + ceil({b} / {c})",
+    "sin({a}) * cos({b}) + tan({c})",
+    "exp({c}) - log10({a}) + log2({b})",
+    "abs({b} - {a}) * pi",
+    "{a} / ({b} - {b})",
+    "factorial({c})",
+]
+
+
+@pytest.mark.parametrize("template", TEMPLATES)
+def test_evaluate_batch_matches_the_scalar_engine(template):
+    rng = random.Random(template)
+    expressions = [
+        template.format(a=rng.randint(0, 10 ** 9), b=rng.randint(1, 10 ** 9), c=rng.randint(0, 12))
+        for _ in range(MIN_VECTOR_GROUP * 4)
+    ]
+    for item in evaluate_batch(expressions):
+        result, error = _expected(item["expression"])
+        assert item["error"] == error, item
+        assert _same(item["result"], result), item
+
+
+@pytest.mark.parametrize(
+    "expression, result",
+    [
+        ("123456789*987654321%1000", "269"),
+        ("(2**60+1)-2**60", "1"),
+        ("log(8,2)", "3"),
+        ("round(3.14159,2)", "3.14"),
+    ],
+)
+def test_evaluate_batch_exact_cases(expression, result):
+    items = evaluate_batch([expression] * MIN_VECTOR_GROUP)
+    assert [item["result"] for item in items] == [result] * MIN_VECTOR_GROUP
+
+
+def test_evaluate_batch_rejects_what_the_scalar_engine_rejects():
+    items = evaluate_batch(["min(3)"] * MIN_VECTOR_GROUP + ["sqrt(16,2)"] * MIN_VECTOR_GROUP)
+    assert all(item["result"] is None and item["error"] for item in items)
@@ -0,0 +1,98 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from booking_store import CsvBookingStore, SqliteBookingStore
+from recurrence import (
+    RuleIndex,
+    add_months,
+    first_common_date,
+    make_rule,
+    occurrences,
+    occurs_on,
+    rule_from_booking,
+)
+
+
+def rule(start_date, end_date, period, start="18:00", end="19:00", user_id="u1"):
+    return make_rule(user_id, start, end, start_date, end_date, period)
+
+
+def random_rule(rng):
+    first = date(2025, 1, 1) + timedelta(days=rng.randint(0, 60))
+    last = first + timedelta(days=rng.randint(0, 120))
+    return rule(first.isoformat(), last.isoformat(), rng.randint(1, 21))
+
+
+def test_make_rule_trims_to_the_last_occurrence():
+    assert rule("2025-01-01", "2025-01-20", 7)["end_date"] == "2025-01-15"
+    with pytest.raises(ValueError):
+        rule("2025-01-02", "2025-01-01", 7)
+    with pytest.raises(ValueError):
+        rule("2025-01-01", "2025-01-02", 0)
+
+
+def test_occurrences_and_windows():
+    weekly = rule("2025-01-01", "2025-02-28", 7)
+    dates = list(occurrences(weekly))
+    assert dates[:3] == ["2025-01-01", "2025-01-08", "2025-01-15"] and dates[-1] == "2025-02-26"
+    assert list(occurrences(weekly, "2025-01-09", "2025-01-31")) == ["2025-01-15", "2025-01-22", "2025-01-29"]
+    assert all(occurs_on(weekly, d) for d in dates)
+    assert not occurs_on(weekly, "2025-01-02") and not occurs_on(weekly, "2025-03-05")
+
+
+def test_first_common_date_matches_brute_force():
+    rng = random.Random(16)
+    for _ in range(500):
+        a, b = random_rule(rng), random_rule(rng)
+        common = sorted(set(occurrences(a)) & set(occurrences(b)))
+        assert first_common_date(a, b) == (common[0] if common else None), (a, b)
+
+
+def test_rule_index_matches_occurs_on():
+    rng = random.Random(17)
+    rules = [random_rule(rng) for _ in range(40)]
+    index = RuleIndex(rules)
+    day = date(2025, 1, 1)
+    for offset in range(200):
+        d = (day + timedelta(days=offset)).isoformat()
+        assert len(index.intervals(d)) == sum(occurs_on(r, d) for r in rules)
+
+
+def test_rule_from_booking_and_add_months():
+    booking = {
+        "user_id": 7, "date": "2025-01-31", "start_time": "06:00", "end_time": "07:00",
+        "repeat_until": "2025-02-28", "repeat_every_days": "14",
+    }
+    assert rule_from_booking(booking) == {
+        "user_id": "7", "start_time": "06:00", "end_time": "07:00",
+        "start_date": "2025-01-31", "end_date": "2025-02-28", "period_days": 14,
+    }
+    assert add_months("2025-01-31", 1) == "2025-02-28"
+    assert add_months("2024-12-15", 2) == "2025-02-15"
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "csv":
+        return CsvBookingStore(str(tmp_path / "bookings.csv"))
+    return SqliteBookingStore(str(tmp_path / "bookings.db"))
+
+
+def test_rules_conflict_with_rules_and_bookings(store):
+    # Every 4 days from Jan 1 and every 6 days from Jan 3 first meet on Jan 9;
+    # with every 2 days from Jan 2 only Jan 3, 7, 11, ... stay free at 18:00.
+    assert store.add_rule(rule("2025-01-01", "2025-03-01", 4))
+    assert not store.add_rule(rule("2025-01-03", "2025-03-01", 6, user_id="u2"))
+    assert store.add_rule(rule("2025-01-03", "2025-01-08", 6, user_id="u2"))
+    assert store.add_rule(rule("2025-01-02", "2025-03-01", 2, user_id="u3"))
+    assert store.add_rule(rule("2025-01-01", "2025-03-01", 4, start="19:00", end="20:00", user_id="u3"))
+
+    assert not store.is_available({"date": "2025-01-09", "start_time": "18:30", "end_time": "18:45"})
+    assert not store.is_available({"date": "2025-01-10", "start_time": "18:30", "end_time": "18:45"})
+    assert store.is_available({"date": "2025-01-11", "start_time": "18:30", "end_time": "18:45"})
+    assert not store.book({"user_id": "u4", "date": "2025-02-02", "start_time": "18:00", "end_time": "18:30"})
+    assert store.book({"user_id": "u4", "date": "2025-02-04", "start_time": "18:00", "end_time": "18:30"})
+    assert not store.add_rule(rule("2025-01-31", "2025-02-10", 4, start="18:15", end="18:20", user_id="u5"))
+    assert sorted(r["start_date"] for r in store.rules_for_user("u3")) == ["2025-01-01", "2025-01-02"]
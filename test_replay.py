@@ -0,0 +1,79 @@
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+from langgraph.types import Command
+
+from replay import read_requests, replay, summarize
+from sessions import SessionManager
+
+
+class ScriptedApp:
+    """Asks for a time on "book" queries and echoes everything else."""
+
+    def invoke(self, graph_input, config):
+        if isinstance(graph_input, Command):
+            return {"route": "book", "route_source": "llm", "responce": f"booked {graph_input.resume}"}
+        if graph_input["query"].startswith("book"):
+            return {"__interrupt__": [SimpleNamespace(value={"question": "When?"})]}
+        return {"route": "knowledge", "route_source": "rule", "responce": graph_input["query"]}
+
+
+def write_log(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_read_requests(tmp_path):
+    path = write_log(
+        tmp_path / "log.jsonl",
+        [
+            json.dumps({"query": "what is the M4", "ts": 10.5, "session": "s1", "user_id": "7"}),
+            "",
+            "   ",
+            json.dumps({"other": "no query here"}),
+            json.dumps({"query": "book the ground", "answers": ["6pm"], "ts": "2025-03-12T10:00:00", "id": "r2"}),
+            json.dumps({"query": "one more"}),
+        ],
+    )
+    requests = list(read_requests(path))
+    assert [r["line"] for r in requests] == [1, 5, 6]
+    assert requests[0] == {
+        "line": 1, "id": "1", "query": "what is the M4", "answers": [],
+        "session": "s1", "user_id": "7", "ts": 10.5,
+    }
+    assert requests[1]["id"] == "r2" and requests[1]["answers"] == ["6pm"]
+    assert requests[1]["ts"] == datetime(2025, 3, 12, 10).timestamp()
+    assert [r["query"] for r in read_requests(path, limit=2)] == ["what is the M4", "book the ground"]
+    assert list(read_requests(path, field="other")) == [
+        {"line": 4, "id": "4", "query": "no query here", "answers": [], "session": None, "user_id": None, "ts": None}
+    ]
+
+
+def test_replay_and_summarize(tmp_path):
+    path = write_log(
+        tmp_path / "log.jsonl",
+        [
+            json.dumps({"query": "what is the M4"}),
+            json.dumps({"query": "book the ground", "answers": ["6pm"], "session": "s1"}),
+            json.dumps({"query": "book it again", "session": "s1"}),
+        ],
+    )
+    results = replay(SessionManager(ScriptedApp()), read_requests(path), workers=2)
+    by_line = {record["line"]: record for record in results}
+    assert by_line[1]["status"] == "ok" and by_line[1]["route"] == "knowledge"
+    assert by_line[2]["status"] == "ok" and by_line[2]["turns"] == 2 and by_line[2]["response"] == "booked 6pm"
+    assert by_line[3]["status"] == "unanswered"
+
+    summary = summarize(results, elapsed=2.0)
+    assert summary["requests"] == 3 and summary["rps"] == 1.5
+    assert summary["status"] == {"ok": 2, "unanswered": 1}
+    assert summary["route_source"] == {"rule": 1, "llm": 1}
+    assert set(summary["routes"]) == {"book", "knowledge", "unknown"}
+    assert summary["latency"]["p50_ms"] is not None
+
+
+def test_summarize_without_results():
+    summary = summarize([], elapsed=0.0)
+    assert summary["requests"] == 0 and summary["rps"] == 0.0
+    assert summary["latency"] == {"p50_ms": None, "p95_ms": None, "p99_ms": None}
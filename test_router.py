@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from router import CentroidClassifier, QueryRouter, read_route_log, rule_route
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "2+3*4",
+        "what is (12 - 4) / 2?",
+        "calculate 2**10",
+        "What is 5 plus 3?",
+        "square root of 16",
+        "20 percent of 150",
+        "7 times 6",
+    ],
+)
+def test_arithmetic_goes_to_math(query):
+    assert rule_route(query) == "math"
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "Does the 13 inch model have MagSafe plus two USB-C ports?",
+        "Is the M4 Pro 20 percent of the price of a Mac Pro?",
+        "Which model has 16GB plus a 10 core GPU?",
+        "What happened on 2024-05-01?",
+        "How many ports does it have?",
+    ],
+)
+def test_questions_with_numbers_are_not_math(query):
+    assert rule_route(query) is None
+
+
+@pytest.mark.parametrize("query", ["Book the turf for tomorrow at 6pm", "I want to reserve a court"])
+def test_booking_requests_go_to_ground(query):
+    assert rule_route(query) == "ground"
+
+
+def test_llm_only_sees_what_rules_and_classifier_cannot_place(tmp_path):
+    classifier = CentroidClassifier.train(
+        [("battery life of the macbook", "knowledge"), ("macbook display size", "knowledge")]
+    )
+    seen = []
+    router = QueryRouter(
+        lambda query: seen.append(query) or "bogus", classifier=classifier, log_file=str(tmp_path / "routes.jsonl")
+    )
+
+    assert router.route("2+2") == ("math", "rules")
+    assert router.route("macbook battery life") == ("knowledge", "classifier")
+    assert router.route("tell me a joke") == ("out_of_my_known", "llm")
+    assert seen == ["tell me a joke"]
+    assert router.route_batch(["3*3", "hello there"]) == [("math", "rules"), ("out_of_my_known", "llm")]
+
+
+def test_route_log_is_buffered_and_feeds_training(tmp_path):
+    path = tmp_path / "routes.jsonl"
+    router = QueryRouter(lambda query: "knowledge", log_file=str(path))
+    router.route("2+2")
+    router.route_batch(["what is the screen size", "book the pitch"])
+    router.flush()
+
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [record["source"] for record in records] == ["rules", "llm", "rules"]
+    assert read_route_log(str(path)) == [
+        ("2+2", "math"),
+        ("what is the screen size", "knowledge"),
+        ("book the pitch", "ground"),
+    ]
@@ -0,0 +1,135 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import semantic_cache
+from semantic_cache import SemanticAnswerCache
+
+VECTORS = {
+    "how many cpu cores does the m4 have?": [1.0, 0.0, 0.0],
+    "how many cores does the m4 cpu have?": [0.99, 0.1, 0.0],
+    "what ports does it have?": [0.0, 1.0, 0.0],
+    "how heavy is it?": [0.0, 0.0, 1.0],
+    "how much does it weigh?": [0.0, 0.6, 0.8],
+}
+
+
+class TableEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        if text.lower() == "broken":
+            raise RuntimeError("embedding API down")
+        return VECTORS[" ".join(text.lower().split())]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(semantic_cache, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture
+def cache(clock):
+    return SemanticAnswerCache(TableEmbeddings(), threshold=0.95, ttl=60, max_entries=2)
+
+
+def answer(question):
+    return f"answer to {question}"
+
+
+def fail(question):
+    raise AssertionError(f"{question!r} should have been a cache hit")
+
+
+def test_exact_and_semantic_hits(cache):
+    question = "How many CPU cores does the M4 have?"
+    assert cache.get_or_compute(question, answer) == answer(question)
+    assert cache.get_or_compute("  how many cpu CORES does the m4 have? ", fail) == answer(question)
+    assert cache.get_or_compute("How many cores does the M4 CPU have?", fail) == answer(question)
+    # Related but below the threshold (cosine 0.8).
+    assert cache.get_or_compute("How much does it weigh?", answer) == answer("How much does it weigh?")
+    assert cache.stats() == {
+        "exact_hits": 1, "semantic_hits": 1, "misses": 2, "hit_rate": 0.5,
+        "saved_seconds": 0.0, "entries": 2,
+    }
+
+
+def test_entries_expire_after_the_ttl(cache, clock):
+    cache.get_or_compute("What ports does it have?", answer)
+    clock.now += 59
+    assert cache.get_or_compute("What ports does it have?", fail)
+    clock.now += 2
+    assert cache.get_or_compute("What ports does it have?", lambda q: "fresh") == "fresh"
+
+
+def test_least_recently_used_entry_is_evicted(cache):
+    cache.get_or_compute("What ports does it have?", answer)
+    cache.get_or_compute("How heavy is it?", answer)
+    cache.get_or_compute("What ports does it have?", fail)
+    cache.get_or_compute("How many CPU cores does the M4 have?", answer)
+    assert cache.stats()["entries"] == 2
+    assert cache.get_or_compute("What ports does it have?", fail)
+    assert cache.get_or_compute("How heavy is it?", lambda q: "recomputed") == "recomputed"
+
+
+def test_a_new_index_version_drops_every_answer(cache):
+    cache.get_or_compute("What ports does it have?", answer, version="v1")
+    assert cache.get_or_compute("What ports does it have?", fail, version="v1")
+    assert cache.get_or_compute("What ports does it have?", lambda q: "new", version="v2") == "new"
+    assert cache.get_or_compute("What ports does it have?", fail, version="v2") == "new"
+
+
+def test_questions_that_cannot_be_embedded_are_answered_but_not_cached(cache):
+    assert cache.get_or_compute("broken", answer) == answer("broken")
+    assert cache.get_or_compute("broken", lambda q: "again") == "again"
+    assert cache.stats()["entries"] == 0
+
+
+def test_get_or_compute_many_answers_repeats_once_and_skips_failures(cache):
+    cache.get_or_compute("What ports does it have?", answer)
+    batches = []
+
+    def compute_many(questions):
+        batches.append(list(questions))
+        return [RuntimeError("model down") if "heavy" in q else answer(q) for q in questions]
+
+    questions = [
+        "How many CPU cores does the M4 have?",
+        "what ports does it have?",
+        "how many cpu cores does the m4 have?",
+        "How heavy is it?",
+        "How many cores does the M4 CPU have?",
+        "How many CPU cores does the M4 have?",
+    ]
+    answers = cache.get_or_compute_many(questions, compute_many)
+    # Near-duplicates within one batch are only matched against answers
+    # cached before it, so the paraphrase is computed too.
+    assert batches == [
+        ["How many CPU cores does the M4 have?", "How heavy is it?", "How many cores does the M4 CPU have?"]
+    ]
+    first = answer("How many CPU cores does the M4 have?")
+    assert answers[0] == answers[2] == answers[5] == first
+    assert answers[1] == answer("What ports does it have?")
+    assert isinstance(answers[3], RuntimeError)
+    assert answers[4] == answer("How many cores does the M4 CPU have?")
+
+    # The failed answer was not cached; the rest were.
+    again = cache.get_or_compute_many(["How heavy is it?", "how many cores does the m4 cpu have?"], compute_many)
+    assert batches[-1] == ["How heavy is it?"]
+    assert isinstance(again[0], RuntimeError) and again[1] == answers[4]
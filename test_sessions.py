@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import Counter
+
+import sessions as sessions_module
+from sessions import SessionManager
+
+
+class EchoApp:
+    """Returns the config a turn ran with."""
+
+    def invoke(self, graph_input, config):
+        return dict(config["configurable"])
+
+
+def test_user_id_survives_eviction():
+    sessions = SessionManager(EchoApp(), max_sessions=1)
+    sessions.create(user_id="alice", session_id="s1")
+    sessions.create(user_id="bob", session_id="s2")
+    assert "s1" not in sessions.sessions
+
+    assert sessions.ask("s1", "book the turf", user_id="alice") == {"thread_id": "session-s1", "user_id": "alice"}
+    assert sessions.resume("s1", "tomorrow 6pm to 7pm") == {"thread_id": "session-s1", "user_id": "alice"}
+    assert sessions.ask("s3", "hi") == {"thread_id": "session-s3", "user_id": "s3"}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def test_idle_sessions_are_evicted(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sessions_module, "time", clock)
+    sessions = SessionManager(EchoApp(), idle_seconds=60)
+    sessions.create(user_id="alice", session_id="s1")
+    sessions.create(user_id="bob", session_id="s2")
+    clock.now += 40
+    sessions.ask("s2", "hi")
+    clock.now += 30
+    sessions.create(session_id="s3")
+    assert list(sessions.sessions) == ["s2", "s3"]
+    clock.now += 61
+    sessions.create(session_id="s4")
+    assert list(sessions.sessions) == ["s4"]
+
+
+class SlowApp:
+    """Records how many turns run at once, per thread and overall."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = Counter()
+        self.max_per_thread = Counter()
+        self.max_overall = 0
+
+    def invoke(self, graph_input, config):
+        thread_id = config["configurable"]["thread_id"]
+        with self.lock:
+            self.active[thread_id] += 1
+            self.max_per_thread[thread_id] = max(self.max_per_thread[thread_id], self.active[thread_id])
+            self.max_overall = max(self.max_overall, sum(self.active.values()))
+        time.sleep(0.02)
+        with self.lock:
+            self.active[thread_id] -= 1
+        return {}
+
+
+def test_turns_of_one_session_run_one_at_a_time():
+    app = SlowApp()
+    sessions = SessionManager(app)
+    threads = [
+        threading.Thread(target=sessions.ask, args=(session_id, "hi"))
+        for session_id in ["s1", "s2"] * 4
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert app.max_per_thread == {"session-s1": 1, "session-s2": 1}
+    assert app.max_overall == 2